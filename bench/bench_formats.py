@@ -0,0 +1,82 @@
+"""Parse throughput of G.R.I.M.'s source formats on synthetic files.
+
+Times what process_csv_file() does before it writes: sniff(), scan(), read_batches() and normalize_batch().
+Run from the project root: python bench/bench_formats.py [--rows 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.grim import formats, grim
+
+START_MS = 1700006400000  # 2023-11-15T00:00:00Z
+CDD_BANNER = "https://www.CryptoDataDownload.com"
+
+def write_aggtrades(path: str, rows: int) -> None:
+    ids = np.arange(rows)
+    pd.DataFrame({
+        'agg_trade_id': ids, 'price': np.round(60000 + np.random.randn(rows) * 50, 2),
+        'quantity': np.round(np.random.rand(rows), 5), 'first_trade_id': ids, 'last_trade_id': ids,
+        'transact_time': START_MS + ids * 40, 'is_buyer_maker': 'true', 'is_best_match': 'true'
+    }).to_csv(path, header=False, index=False)
+
+def write_cdd(path: str, rows: int, scale: int) -> None:
+    unix = (START_MS // 1000 + np.arange(rows)[::-1] * 60) * scale
+    close = np.round(60000 + np.random.randn(rows) * 50, 2)
+    frame = pd.DataFrame({
+        'unix': unix, 'date': pd.to_datetime(unix, unit='s' if scale == 1 else 'ms').strftime('%Y-%m-%d %H:%M:%S'),
+        'symbol': 'BTC/USD', 'open': close, 'high': close, 'low': close, 'close': close,
+        'Volume BTC': np.round(np.random.rand(rows), 5), 'Volume USD': close
+    })
+    with open(path, 'w') as f:
+        f.write(CDD_BANNER + "\n")
+        frame.to_csv(f, index=False)
+
+def write_scale_csv(path: str, rows: int) -> None:
+    times = START_MS + np.arange(rows) * 40
+    price = np.round(60000 + np.random.randn(rows) * 50, 2)
+    pd.DataFrame({
+        'timestamp': pd.to_datetime(times, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%S.%fZ'), 'price': price,
+        'quantity': 0.5, 'quoteQty': price * 0.5, 'tradeId': np.arange(rows)
+    }).to_csv(path, index=False)
+
+def parse(path: str) -> int:
+    """Everything process_csv_file() does to a file short of saving it; returns the rows produced."""
+    source = formats.sniff(path)
+    formats.scan(path, source)
+    return sum(len(grim.normalize_batch(batch, source)) for batch in formats.read_batches(path, source, grim.CSV_CHUNK_SIZE))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark G.R.I.M. source-format parsing")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows per synthetic file")
+    args = parser.parse_args()
+    files = [
+        ("BTCUSDT-aggTrades.csv", write_aggtrades, ()),
+        ("Bitstamp_BTCUSD_minute.csv", write_cdd, (1,)),
+        ("Bitfinex_BTCUSD_minute.csv", write_cdd, (1000,)),
+        ("BTCUSDT_scale.csv", write_scale_csv, ()),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, writer, extra in files:
+            path = os.path.join(tmp, name)
+            writer(path, args.rows, *extra)
+            started = time.perf_counter()
+            rows = parse(path)
+            elapsed = time.perf_counter() - started
+            print(f"{formats.sniff(path)['name']:<18} {rows:>9} rows  {os.path.getsize(path) / 1e6:7.1f} MB  {rows / elapsed / 1000:7.1f}k rows/s")
+    times = START_MS + np.arange(args.rows) * 40
+    started = time.perf_counter()
+    pd.to_datetime(times, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ')
+    strftime = time.perf_counter() - started
+    started = time.perf_counter()
+    formats.iso_timestamps(times)
+    numpy = time.perf_counter() - started
+    print(f"ISO timestamps for {args.rows} rows: pandas strftime {strftime:.2f} s, formats.iso_timestamps {numpy:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""File size and query times of a G.R.I.M. daily SQLite file before and after migration to schema version 2.
+
+Builds a synthetic version 1 day, times it, migrates it with schema.migrate() and times it again.
+Run from the project root: python bench/bench_schema.py [--rows 600000]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.grim import formats, schema
+
+DAY_START_MS = 1700006400000  # 2023-11-15T00:00:00Z
+HOUR_MS = 3600000
+REPEATS = 5  # Best of, per query
+
+V1_QUERIES = {
+    "1-hour range fetch": ("SELECT timestamp, price, quantity, quoteQty, tradeId, symbol FROM market_data "
+                           "WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp", "iso"),
+    "1-hour aggregate": ("SELECT COUNT(*), SUM(quantity), SUM(quoteQty), MIN(price), MAX(price) FROM market_data "
+                         "WHERE timestamp >= ? AND timestamp < ?", "iso"),
+}
+V2_QUERIES = {
+    "1-hour range fetch": ("SELECT time, trade_id, price, quantity, symbol_id FROM market_data "
+                           "WHERE time >= ? AND time < ? ORDER BY time", "ms"),
+    "1-hour aggregate": ("SELECT COUNT(*), SUM(quantity), SUM(price * quantity), MIN(price), MAX(price) FROM market_data "
+                         "WHERE time >= ? AND time < ?", "ms"),
+}
+
+def write_v1(path: str, rows: int) -> None:
+    """A version 1 day: TEXT timestamp/tradeId/symbol key and a stored quoteQty, in WAL mode as G.R.I.M. wrote it."""
+    times = np.sort(DAY_START_MS + np.random.randint(0, formats.DAY_MS, rows))
+    price = np.round(60000 + np.random.randn(rows) * 50, 2)
+    quantity = np.round(np.random.rand(rows), 5)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("""
+            CREATE TABLE market_data (
+                timestamp TEXT,
+                price REAL,
+                quantity REAL,
+                quoteQty REAL,
+                tradeId TEXT,
+                symbol TEXT,
+                PRIMARY KEY (timestamp, symbol, tradeId)
+            )
+        """)
+        conn.executemany("INSERT INTO market_data VALUES (?, ?, ?, ?, ?, ?)",
+                         zip(formats.iso_timestamps(times, 'ms').tolist(), price.tolist(), quantity.tolist(),
+                             (price * quantity).tolist(), [str(i) for i in range(rows)], ["BTCUSDT"] * rows))
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    finally:
+        conn.close()
+
+def best(fn) -> float:
+    """Best of REPEATS wall times of fn(), in ms."""
+    times = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times)
+
+def measure(path: str, queries: dict, full_day) -> dict:
+    start, end = DAY_START_MS + 12 * HOUR_MS, DAY_START_MS + 13 * HOUR_MS
+    results = {"file size (MB)": sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p)) / 1e6}
+    conn = sqlite3.connect(path)
+    try:
+        for name, (sql, unit) in queries.items():
+            params = tuple(formats.iso_timestamps([start, end], 'ms').tolist()) if unit == "iso" else (start, end)
+            results[f"{name} (ms)"] = best(lambda: conn.execute(sql, params).fetchall())
+        results["full-day fetch (ms)"] = best(lambda: full_day(conn))
+    finally:
+        conn.close()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark G.R.I.M.'s daily SQLite schema, version 1 vs 2")
+    parser.add_argument("--rows", type=int, default=600000, help="Trades in the synthetic day")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "20231115.db")
+        write_v1(path, args.rows)
+        before = measure(path, V1_QUERIES, lambda conn: pd.read_sql("SELECT * FROM market_data ORDER BY timestamp", conn))
+        started = time.perf_counter()
+        schema.migrate(path)
+        migration = time.perf_counter() - started
+        after = measure(path, V2_QUERIES, schema.read)
+    print(f"{args.rows} rows, version 1 -> 2:")
+    for key in before:
+        print(f"  {key:<24} {before[key]:8.1f} -> {after[key]:8.1f}")
+    print(f"  migration                {migration:8.1f} s")
+
+if __name__ == "__main__":
+    main()
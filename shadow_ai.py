@@ -1,10 +1,14 @@
 import argparse
 import importlib
+import sys
 
 def main():
     parser = argparse.ArgumentParser(description="SHADOW AI Trading System")
     parser.add_argument('module', choices=['scale', 'grim', 'flare', 'phantom', 'spectre', 'veil', 'echo'], help='The module to run')
-    args = parser.parse_args()
+    args, module_args = parser.parse_known_args()
+
+    # Hand any remaining options (e.g. `scale --mode stream`) to the module's own parser
+    sys.argv = [args.module] + module_args
 
     try:
         module = importlib.import_module(f"src.{args.module}.{args.module}")
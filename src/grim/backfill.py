@@ -0,0 +1,212 @@
+import time
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import requests
+
+from src.grim import catalog
+
+logger = logging.getLogger(__name__)
+
+# Binance REST API backfill of the catalog's missing minutes, in hour-long ranges fetched
+# concurrently within the API's request weight and checkpointed in the catalog
+PAGE_LIMIT = 1000  # Trades per request (the API maximum)
+RANGE_MS = 3600000  # Range length; the API rejects startTime/endTime windows of an hour or more
+WEIGHT_LIMIT = 6000  # Request weight Binance allows per IP per minute
+WEIGHT_TARGET = 0.5  # Share of WEIGHT_LIMIT concurrency is grown under and cut above
+WEIGHT_PAUSE = 0.9  # Share of WEIGHT_LIMIT at which requests wait for the next minute
+MAX_CONCURRENCY = 8  # Ranges fetched at once
+FLUSH_ROWS = 200000  # Fetched rows buffered before they go to the sink and the cursors are checkpointed
+MAX_API_RETRIES = 3  # Failed requests in a row before a range is left for the next run
+RETRY_DELAY = 5
+RATE_LIMIT_WAIT = 120  # Pause after a 429/418 without a Retry-After header
+REQUEST_TIMEOUT = 10
+
+class Throttle:
+    """How many ranges to fetch at once, adapted to the request weight the API reports."""
+
+    def __init__(self, used_weight: Optional[int] = None):
+        self.concurrency = 1
+        self.paused_until = 0.0  # time.monotonic() before which no request is sent
+        self.observe(used_weight)
+
+    def observe(self, used_weight: Optional[int]) -> None:
+        """Grow or cut concurrency from a response's x-mbx-used-weight-1m."""
+        if used_weight is None:
+            return
+        if used_weight >= WEIGHT_LIMIT * WEIGHT_PAUSE:
+            self.back_off(60 - time.time() % 60)  # The weight resets with the minute
+        elif used_weight > WEIGHT_LIMIT * WEIGHT_TARGET:
+            self.concurrency = max(self.concurrency // 2, 1)
+        else:
+            self.concurrency = min(self.concurrency + 1, MAX_CONCURRENCY)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def back_off(self, seconds: float) -> None:
+        self.concurrency = 1
+        self.pause(seconds)
+
+def plan_ranges(gaps: List[Tuple[int, int]]) -> List[Dict]:
+    """Fresh cursors for the RANGE_MS ranges covering sorted [start, end) gaps."""
+    return [{"start_time": lo, "end_time": min(lo + RANGE_MS, end_ms), "next_id": None, "rows": 0}
+            for start_ms, end_ms in gaps for lo in range(start_ms, end_ms, RANGE_MS)]
+
+def subtract(gaps: List[Tuple[int, int]], cursors: List[Dict]) -> List[Tuple[int, int]]:
+    """Sorted gaps minus the spans of sorted cursors."""
+    spans = [(c["start_time"], c["end_time"]) for c in cursors]
+    left, i = [], 0
+    for lo, hi in gaps:
+        while i < len(spans) and spans[i][1] <= lo:
+            i += 1
+        j = i
+        while lo < hi and j < len(spans) and spans[j][0] < hi:
+            if spans[j][0] > lo:
+                left.append((lo, spans[j][0]))
+            lo = max(lo, spans[j][1])
+            j += 1
+        if lo < hi:
+            left.append((lo, hi))
+    return left
+
+def fetch_page(session: requests.Session, base_url: str, symbol: str, cursor: Dict) -> Dict:
+    """One aggTrades request for a range: its trades or an error, the reported used weight and any Retry-After."""
+    if cursor["next_id"] is None:
+        params = {"symbol": symbol, "startTime": cursor["start_time"], "endTime": cursor["end_time"] - 1, "limit": PAGE_LIMIT}
+    else:
+        params = {"symbol": symbol, "fromId": cursor["next_id"], "limit": PAGE_LIMIT}
+    page = {"trades": None, "error": None, "weight": None, "retry_after": None}
+    try:
+        response = session.get(base_url, params=params, headers={'Cache-Control': 'no-cache'}, timeout=REQUEST_TIMEOUT)
+        if "x-mbx-used-weight-1m" in response.headers:
+            page["weight"] = int(response.headers["x-mbx-used-weight-1m"])
+        if response.status_code in (418, 429):
+            page["retry_after"] = int(response.headers.get("Retry-After", RATE_LIMIT_WAIT))
+            page["error"] = f"HTTP {response.status_code}"
+            return page
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        page["error"] = str(e)
+        return page
+    if isinstance(data, dict):
+        page["error"] = data.get("msg", "Unknown error")
+    else:
+        page["trades"] = data
+    return page
+
+def take_page(cursor: Dict, trades: list, symbol: str) -> Optional[pd.DataFrame]:
+    """Advance a range's cursor past a page of trades; returns the page's trades inside the range as a unified frame.
+    Sets cursor["done"] once the range is complete."""
+    if not trades:
+        cursor["done"] = True
+        return None
+    page = pd.DataFrame(trades, columns=["a", "p", "q", "T"])
+    time_ms = page["T"].to_numpy(dtype=np.int64)
+    trade_ids = page["a"].to_numpy(dtype=np.int64)
+    cursor["next_id"] = int(trade_ids[-1]) + 1
+    cursor["done"] = len(trades) < PAGE_LIMIT or time_ms[-1] >= cursor["end_time"]
+    keep = (time_ms >= cursor["start_time"]) & (time_ms < cursor["end_time"])
+    if not keep.any():
+        return None
+    cursor["rows"] += int(keep.sum())
+    return pd.DataFrame({
+        "time": time_ms[keep],
+        "trade_id": trade_ids[keep],
+        "price": page["p"].to_numpy(dtype=np.float64)[keep],
+        "quantity": page["q"].to_numpy(dtype=np.float64)[keep],
+        "symbol": symbol
+    })
+
+def run(symbol: str, gaps: List[Tuple[int, int]], base_url: str, sink: Callable[[pd.DataFrame], None],
+        sync: Optional[Callable[[], None]] = None, used_weight: Optional[int] = None, path: Optional[str] = None,
+        from_id: Optional[int] = None) -> int:
+    """Fetch every aggTrade in the sorted [start, end) epoch-ms `gaps`, plus unfinished earlier ranges, into `sink`.
+
+    `sync` must return once the sink has saved what it was given; `from_id` starts the last gap at a known trade ID.
+    Returns the number of trades fetched.
+    """
+    cursors = catalog.backfill_ranges(symbol, path)
+    if cursors:
+        logger.info(f"Resuming {len(cursors)} unfinished backfill ranges of {symbol}")
+    gaps = subtract(gaps, cursors)
+    fresh = plan_ranges(gaps)
+    if fresh and from_id is not None and not cursors:
+        next(c for c in fresh if c["start_time"] == gaps[-1][0])["next_id"] = from_id
+    catalog.save_backfill_ranges(symbol, fresh, path=path)
+    cursors = sorted(cursors + fresh, key=lambda c: c["start_time"])
+    if not cursors:
+        return 0
+    logger.info(f"Backfilling {symbol} in {len(cursors)} ranges from {cursors[0]['start_time']} to {cursors[-1]['end_time']}")
+    throttle = Throttle(used_weight)
+    pending = deque(dict(c, done=False, failures=0) for c in cursors)
+    in_flight, touched, finished = {}, {}, []
+    buffered, buffered_rows, total, last, complete = [], 0, 0, None, True
+    started = time.perf_counter()
+
+    def flush() -> None:
+        nonlocal buffered, buffered_rows
+        if buffered:
+            sink(pd.concat(buffered, ignore_index=True))
+            if sync:
+                sync()
+        catalog.save_backfill_ranges(symbol, touched.values(), finished, path)
+        buffered, buffered_rows = [], 0
+        touched.clear()
+        finished.clear()
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+        while pending or in_flight:
+            while pending and len(in_flight) < throttle.concurrency and time.monotonic() >= throttle.paused_until:
+                cursor = pending.popleft()
+                in_flight[pool.submit(fetch_page, session, base_url, symbol, cursor)] = cursor
+            if not in_flight:
+                time.sleep(max(throttle.paused_until - time.monotonic(), 0))
+                continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                cursor = in_flight.pop(future)
+                page = future.result()
+                throttle.observe(page["weight"])
+                if page["retry_after"] is not None:
+                    logger.warning(f"Rate limited ({page['error']}), pausing {page['retry_after']}s; used weight {page['weight']}")
+                    throttle.back_off(page["retry_after"])
+                    pending.appendleft(cursor)
+                    continue
+                if page["error"]:
+                    cursor["failures"] += 1
+                    if cursor["failures"] >= MAX_API_RETRIES:
+                        logger.error(f"Giving up on {symbol} range from {cursor['start_time']} for this run: {page['error']}")
+                        complete = False
+                        continue
+                    logger.warning(f"Error fetching {symbol} range from {cursor['start_time']} (attempt {cursor['failures']}): {page['error']}")
+                    throttle.pause(RETRY_DELAY)
+                    pending.appendleft(cursor)
+                    continue
+                cursor["failures"] = 0
+                frame = take_page(cursor, page["trades"], symbol)
+                if frame is not None:
+                    buffered.append(frame)
+                    buffered_rows += len(frame)
+                    total += len(frame)
+                    if last is None or frame["trade_id"].iat[-1] > last[0]:
+                        last = (int(frame["trade_id"].iat[-1]), int(frame["time"].iat[-1]))
+                if cursor["done"]:
+                    finished.append(cursor)
+                    touched.pop(cursor["start_time"], None)
+                else:
+                    touched[cursor["start_time"]] = cursor
+                    pending.appendleft(cursor)  # Keep the range's slot until it is complete
+            if buffered_rows >= FLUSH_ROWS:
+                flush()
+        flush()
+    if complete and last is not None:
+        catalog.set_watermark(f"api:{symbol}", last[0], last[1], path=path)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Backfilled {total} {symbol} trades in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} trades/s), "
+                f"ending at concurrency {throttle.concurrency}")
+    return total
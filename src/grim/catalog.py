@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+from src.grim import store
+
+logger = logging.getLogger(__name__)
+
+# Catalog of the consolidated store: per-day stats and minute coverage, source file scans,
+# backfill cursors and ingestion watermarks
+CATALOG_PATH = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "data", "grim", "catalog.db")
+DAY_MS = 86400000
+MINUTE_MS = 60000
+DAY_MINUTES = 1440
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Open (creating if needed) the catalog database."""
+    path = path or CATALOG_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS days (
+            symbol TEXT,
+            date TEXT,
+            rows INTEGER,
+            min_time INTEGER,
+            max_time INTEGER,
+            sources TEXT,
+            checksum TEXT,
+            updated REAL,
+            PRIMARY KEY (symbol, date)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS days_max_time ON days (symbol, max_time)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS source_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            hash TEXT,
+            format TEXT,
+            min_time INTEGER,
+            max_time INTEGER,
+            days TEXT,
+            offsets TEXT,
+            checked REAL,
+            processed INTEGER,
+            tail TEXT
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(source_files)")}
+    for column, kind in (("offsets", "TEXT"), ("processed", "INTEGER"), ("tail", "TEXT")):  # Caches written by older versions
+        if column not in columns:
+            conn.execute(f"ALTER TABLE source_files ADD COLUMN {column} {kind}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_ranges (
+            symbol TEXT,
+            start_time INTEGER,
+            end_time INTEGER,
+            next_id INTEGER,
+            rows INTEGER,
+            updated REAL,
+            PRIMARY KEY (symbol, start_time)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS coverage (
+            symbol TEXT,
+            date TEXT,
+            bits BLOB,
+            checked BLOB,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS watermarks (
+            name TEXT PRIMARY KEY,
+            value INTEGER,
+            time INTEGER,
+            detail TEXT,
+            updated REAL
+        )
+    """)
+    return conn
+
+def day_start(date_str: str) -> int:
+    """Epoch ms of 00:00 UTC on a YYYYMMDD date."""
+    return int(np.datetime64(f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}", 'D').astype('datetime64[ms]').astype(np.int64))
+
+def date_of(day: int) -> str:
+    """YYYYMMDD of a day number (days since the epoch)."""
+    return str(np.datetime64(day, 'D')).replace("-", "")
+
+def minute_bits(time_ms: np.ndarray) -> np.ndarray:
+    """Coverage bitmap of the minutes one UTC day's trade times fall in."""
+    minutes = np.zeros(DAY_MINUTES, dtype=bool)
+    minutes[(time_ms % DAY_MS) // MINUTE_MS] = True
+    return np.packbits(minutes, bitorder='little')
+
+def fold_coverage(conn: sqlite3.Connection, symbol: str, date_str: str, column: str, bits: np.ndarray, replace: bool = False) -> None:
+    """OR a day's bitmap into its 'bits' or 'checked' coverage (or overwrite it with `replace`)."""
+    if not replace:
+        row = conn.execute(f"SELECT {column} FROM coverage WHERE symbol = ? AND date = ?", (symbol, date_str)).fetchone()
+        if row and row[0] is not None:
+            bits = bits | np.frombuffer(row[0], dtype=np.uint8)
+    conn.execute(f"""
+        INSERT INTO coverage (symbol, date, {column}) VALUES (?, ?, ?)
+        ON CONFLICT (symbol, date) DO UPDATE SET {column} = excluded.{column}
+    """, (symbol, date_str, bits.tobytes()))
+
+def day_stats(symbol: str, date_str: str, base_dir: Optional[str] = None) -> Optional[Dict]:
+    """Row count, time range and checksum of one stored day, or None if the store holds nothing for it."""
+    base_dir = base_dir or store.STORE_DIR
+    start = day_start(date_str)
+    day = store.query(symbol, start, start + DAY_MS, ["time", "trade_id", "price", "quantity"], base_dir=base_dir, as_frame=False)
+    if len(day["time"]) == 0:
+        return None
+    digest = hashlib.sha1()
+    for column in day.values():
+        digest.update(column.tobytes())
+    return {"rows": len(day["time"]), "min_time": int(day["time"][0]), "max_time": int(day["time"][-1]), "checksum": digest.hexdigest(),
+            "bits": minute_bits(day["time"])}
+
+def refresh(symbol: str, dates: Iterable[str], source: Optional[str] = None, base_dir: Optional[str] = None,
+            path: Optional[str] = None) -> None:
+    """Recompute the catalog rows of the given days from the store and commit them in one transaction."""
+    base_dir = base_dir or store.STORE_DIR
+    stats = {date_str: day_stats(symbol, date_str, base_dir) for date_str in sorted(set(dates))}
+    conn = connect(path)
+    try:
+        with conn:
+            for date_str, day in stats.items():
+                row = conn.execute("SELECT sources FROM days WHERE symbol = ? AND date = ?", (symbol, date_str)).fetchone()
+                if day is None:
+                    if row:
+                        conn.execute("DELETE FROM days WHERE symbol = ? AND date = ?", (symbol, date_str))
+                        fold_coverage(conn, symbol, date_str, "bits", np.zeros(DAY_MINUTES // 8, dtype=np.uint8), replace=True)
+                    continue
+                sources = json.loads(row[0]) if row and row[0] else []
+                if source and source not in sources:
+                    sources.append(source)
+                conn.execute("""
+                    INSERT OR REPLACE INTO days (symbol, date, rows, min_time, max_time, sources, checksum, updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (symbol, date_str, day["rows"], day["min_time"], day["max_time"], json.dumps(sources), day["checksum"], time.time()))
+                fold_coverage(conn, symbol, date_str, "bits", day["bits"], replace=True)
+    except sqlite3.Error as e:
+        logger.error(f"Error updating catalog for {symbol}: {e}")
+    finally:
+        conn.close()
+
+def note(symbol: str, records: np.ndarray, source: Optional[str] = None, path: Optional[str] = None) -> None:
+    """Fold a just-written batch of time-sorted store records into its days' rows in one transaction; pass only
+    records the store did not hold before (store.unstored()), or they are counted twice."""
+    if len(records) == 0:
+        return
+    days = records['time'].astype('datetime64[ms]').astype('datetime64[D]')
+    starts = np.concatenate([[0], np.flatnonzero(days[1:] != days[:-1]) + 1])
+    ends = np.append(starts[1:], len(records))
+    conn = connect(path)
+    try:
+        with conn:
+            for start, end in zip(starts, ends):
+                date_str = str(days[start]).replace("-", "")
+                row = conn.execute("SELECT rows, min_time, max_time, sources FROM days WHERE symbol = ? AND date = ?",
+                                   (symbol, date_str)).fetchone()
+                rows, min_time, max_time = int(end - start), int(records['time'][start]), int(records['time'][end - 1])
+                sources = []
+                if row:
+                    rows, min_time, max_time = row[0] + rows, min(row[1], min_time), max(row[2], max_time)
+                    sources = json.loads(row[3]) if row[3] else []
+                if source and source not in sources:
+                    sources.append(source)
+                conn.execute("""
+                    INSERT OR REPLACE INTO days (symbol, date, rows, min_time, max_time, sources, checksum, updated)
+                    VALUES (?, ?, ?, ?, ?, ?, NULL, ?)
+                """, (symbol, date_str, rows, min_time, max_time, json.dumps(sources), time.time()))
+                fold_coverage(conn, symbol, date_str, "bits", minute_bits(records['time'][start:end]))
+    except sqlite3.Error as e:
+        logger.error(f"Error updating catalog for {symbol}: {e}")
+    finally:
+        conn.close()
+
+def rebuild(symbol: str, base_dir: Optional[str] = None, path: Optional[str] = None,
+            months: Optional[Iterable[str]] = None) -> int:
+    """Recatalog every day held in the store for a symbol, or only in the given YYYYMM months (e.g. just compacted)."""
+    base_dir = base_dir or store.STORE_DIR
+    dates = set()
+    for month in (months if months is not None else store.list_months(symbol, base_dir)):
+        for records in store.read_month(symbol, month, base_dir=base_dir):
+            days = np.unique(records['time'].astype('datetime64[ms]').astype('datetime64[D]'))
+            dates.update(str(day).replace("-", "") for day in days)
+    refresh(symbol, dates, base_dir=base_dir, path=path)
+    logger.info(f"Catalogued {len(dates)} stored days for {symbol}")
+    return len(dates)
+
+def existing_dates(symbol: str, path: Optional[str] = None) -> Set[str]:
+    """YYYYMMDD dates the store holds data for."""
+    conn = connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT date FROM days WHERE symbol = ?", (symbol,))}
+    finally:
+        conn.close()
+
+def latest_time(symbol: str, path: Optional[str] = None) -> Optional[int]:
+    """Latest stored trade time (epoch ms), or None if nothing is catalogued."""
+    conn = connect(path)
+    try:
+        return conn.execute("SELECT MAX(max_time) FROM days WHERE symbol = ?", (symbol,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def is_empty(symbol: str, path: Optional[str] = None) -> bool:
+    """Whether no days are catalogued for a symbol."""
+    conn = connect(path)
+    try:
+        return conn.execute("SELECT 1 FROM days WHERE symbol = ? LIMIT 1", (symbol,)).fetchone() is None
+    finally:
+        conn.close()
+
+def has_coverage(symbol: str, path: Optional[str] = None) -> bool:
+    """Whether any per-minute coverage is recorded for a symbol (catalogs written by older versions have none)."""
+    conn = connect(path)
+    try:
+        return conn.execute("SELECT 1 FROM coverage WHERE symbol = ? LIMIT 1", (symbol,)).fetchone() is not None
+    finally:
+        conn.close()
+
+def coverage(symbol: str, start_ms: int, end_ms: int, checked: bool = True, path: Optional[str] = None) -> np.ndarray:
+    """Per-minute flags, from the minute holding start_ms to the one holding end_ms - 1: True where the store has
+    trades or, with `checked`, a finished backfill range found none."""
+    first_day, last_day = start_ms // DAY_MS, (end_ms - 1) // DAY_MS
+    grid = np.zeros((last_day - first_day + 1, DAY_MINUTES // 8), dtype=np.uint8)
+    conn = connect(path)
+    try:
+        rows = conn.execute("SELECT date, bits, checked FROM coverage WHERE symbol = ? AND date BETWEEN ? AND ?",
+                            (symbol, date_of(first_day), date_of(last_day))).fetchall()
+    finally:
+        conn.close()
+    if rows:
+        days = np.array([f"{r[0][:4]}-{r[0][4:6]}-{r[0][6:8]}" for r in rows], dtype='datetime64[D]').astype(np.int64) - first_day
+        empty = bytes(DAY_MINUTES // 8)
+        for column in (1, 2) if checked else (1,):
+            grid[days] |= np.frombuffer(b"".join(r[column] or empty for r in rows), dtype=np.uint8).reshape(len(rows), -1)
+    minutes = np.unpackbits(grid, axis=1, bitorder='little').ravel().astype(bool)
+    offset = first_day * DAY_MINUTES
+    return minutes[start_ms // MINUTE_MS - offset:(end_ms - 1) // MINUTE_MS + 1 - offset]
+
+def gaps(symbol: str, start_ms: int, end_ms: int, path: Optional[str] = None) -> List[Tuple[int, int]]:
+    """[start, end) epoch-ms ranges within start_ms <= time < end_ms of the minutes neither stored nor checked, oldest first."""
+    if end_ms <= start_ms:
+        return []
+    missing = ~coverage(symbol, start_ms, end_ms, path=path)
+    bounds = np.concatenate([[0], np.flatnonzero(missing[1:] != missing[:-1]) + 1, [len(missing)]])  # Runs of equal flags
+    first_minute = start_ms // MINUTE_MS
+    return [(max(int(first_minute + lo) * MINUTE_MS, start_ms), min(int(first_minute + hi) * MINUTE_MS, end_ms))
+            for lo, hi in zip(bounds[:-1], bounds[1:]) if missing[lo]]
+
+def mark_checked(conn: sqlite3.Connection, symbol: str, start_ms: int, end_ms: int) -> None:
+    """Record the whole minutes within start_ms <= time < end_ms as fetched in full from the API."""
+    first, last = -(-start_ms // MINUTE_MS), end_ms // MINUTE_MS  # Minutes [first, last)
+    for day in range(first // DAY_MINUTES, (last - 1) // DAY_MINUTES + 1) if last > first else ():
+        minutes = np.zeros(DAY_MINUTES, dtype=bool)
+        minutes[max(first - day * DAY_MINUTES, 0):min(last - day * DAY_MINUTES, DAY_MINUTES)] = True
+        fold_coverage(conn, symbol, date_of(day), "checked", np.packbits(minutes, bitorder='little'))
+
+def source_files(path: Optional[str] = None) -> Dict[str, Dict]:
+    """Cached fingerprints of every source file seen, keyed by path ('days' and 'offsets' decoded from JSON)."""
+    conn = connect(path)
+    try:
+        rows = conn.execute("""
+            SELECT path, size, mtime_ns, hash, format, min_time, max_time, days, offsets, processed, tail FROM source_files
+        """).fetchall()
+    finally:
+        conn.close()
+    keys = ["path", "size", "mtime_ns", "hash", "format", "min_time", "max_time", "days", "offsets", "processed", "tail"]
+    return {row[0]: dict(zip(keys, row[:7] + (json.loads(row[7]), json.loads(row[8]) if row[8] else None) + row[9:]))
+            for row in rows}
+
+def remember_sources(fingerprints: Iterable[Dict], path: Optional[str] = None) -> None:
+    """Store source file fingerprints (as returned by grim.source_fingerprint) in one transaction."""
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO source_files (path, size, mtime_ns, hash, format, min_time, max_time, days, offsets, checked,
+                                                     processed, tail)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(f["path"], f["size"], f["mtime_ns"], f["hash"], f["format"], f["min_time"], f["max_time"], json.dumps(f["days"]),
+                   json.dumps(f["offsets"]) if f.get("offsets") else None, time.time(), f.get("processed"), f.get("tail"))
+                  for f in fingerprints])
+    except sqlite3.Error as e:
+        logger.error(f"Error caching source fingerprints: {e}")
+    finally:
+        conn.close()
+
+def backfill_ranges(symbol: str, path: Optional[str] = None) -> List[Dict]:
+    """Checkpoints of a symbol's unfinished backfill ranges, oldest first."""
+    conn = connect(path)
+    try:
+        rows = conn.execute("SELECT start_time, end_time, next_id, rows FROM backfill_ranges WHERE symbol = ? ORDER BY start_time",
+                            (symbol,)).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(["start_time", "end_time", "next_id", "rows"], row)) for row in rows]
+
+def save_backfill_ranges(symbol: str, ranges: Iterable[Dict], finished: Iterable[Dict] = (), path: Optional[str] = None) -> None:
+    """Checkpoint backfill ranges (as returned by backfill_ranges()) and drop finished ones, marking their minutes
+    checked, in one transaction."""
+    finished = list(finished)
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO backfill_ranges (symbol, start_time, end_time, next_id, rows, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(symbol, r["start_time"], r["end_time"], r["next_id"], r["rows"], time.time()) for r in ranges])
+            conn.executemany("DELETE FROM backfill_ranges WHERE symbol = ? AND start_time = ?",
+                             [(symbol, r["start_time"]) for r in finished])
+            for r in finished:
+                mark_checked(conn, symbol, r["start_time"], r["end_time"])
+    except sqlite3.Error as e:
+        logger.error(f"Error checkpointing backfill of {symbol}: {e}")
+    finally:
+        conn.close()
+
+def watermark(name: str, path: Optional[str] = None) -> Optional[Dict]:
+    """A source's watermark ('value', e.g. the last trade ID ingested, its 'time' and JSON 'detail'), or None if unset."""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT value, time, detail FROM watermarks WHERE name = ?", (name,)).fetchone()
+    finally:
+        conn.close()
+    return {"value": row[0], "time": row[1], "detail": json.loads(row[2]) if row[2] else None} if row else None
+
+def set_watermark(name: str, value: int, time_ms: Optional[int] = None, detail: Optional[Dict] = None,
+                  path: Optional[str] = None) -> None:
+    """Advance a source's watermark; only set it once what it covers has been saved."""
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO watermarks (name, value, time, detail, updated) VALUES (?, ?, ?, ?, ?)",
+                         (name, value, time_ms, json.dumps(detail) if detail else None, time.time()))
+    except sqlite3.Error as e:
+        logger.error(f"Error setting watermark {name}: {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,330 @@
+import io
+import os
+import logging
+import importlib.util
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Source file formats G.R.I.M. ingests, recognised by sniff()
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+SNIFF_BYTES = 65536  # Bytes read to recognise a file
+DAY_MS = 86400000
+# Sparse (offset, time) index of time-sorted files, so reading a few days parses only their blocks
+SEEK_INDEX_ROWS = 65536
+SCAN_BLOCK_BYTES = 16 * 1024 * 1024  # Read size when locating line starts
+SCAN_CHUNK_ROWS = 1 << 20  # Rows of the time column parsed at a time by scan()
+# OHLCV bars have no trade ID; synthetic_ids() packs the format's source_id and the bar time
+SYNTHETIC_ID_FLAG = 1 << 62
+SYNTHETIC_TIME_BITS = 44  # Epoch ms up to the year 2527
+LEGACY_SOURCE_ID = 0  # Rows stored with the old md5 IDs, whatever their source
+
+BINANCE_AGGTRADE_COLUMNS = [
+    'agg_trade_id', 'price', 'quantity', 'first_trade_id',
+    'last_trade_id', 'transact_time', 'is_buyer_maker', 'is_best_match'
+]
+CDD_OHLCV_COLUMNS = ['unix', 'date', 'symbol', 'open', 'high', 'low', 'close', 'Volume BTC', 'Volume USD']  # CryptoDataDownload minute bars
+SCALE_CSV_COLUMNS = ['timestamp', 'price', 'quantity', 'quoteQty', 'tradeId']  # Legacy S.C.A.L.E. CSV (G.R.I.M.'s daily CSVs add 'symbol')
+
+FORMATS = {
+    "binance_aggtrades": {  # data.binance.vision aggTrades dumps, normally headerless
+        "kind": "trades",
+        "columns": BINANCE_AGGTRADE_COLUMNS,
+        "dtypes": {'agg_trade_id': np.int64, 'price': np.float64, 'quantity': np.float64, 'transact_time': np.int64},
+        "time": "transact_time",
+        "unit": "ms",  # Spot dumps from 2025 on use microseconds; sniff() picks the unit from the first row's magnitude
+        "price": "price",
+        "quantity": "quantity",
+        "trade_id": "agg_trade_id",
+    },
+    "bitstamp_ohlcv": {  # CryptoDataDownload Bitstamp minute bars, newest first
+        "kind": "ohlcv",
+        "columns": CDD_OHLCV_COLUMNS,
+        "dtypes": {'unix': np.float64, 'close': np.float64, 'Volume BTC': np.float64},
+        "time": "unix",
+        "unit": "s",
+        "price": "close",
+        "quantity": "Volume BTC",
+        "trade_id": None,
+        "source_id": 1,  # Packed into its bars' synthetic trade IDs
+    },
+    "bitfinex_ohlcv": {  # CryptoDataDownload Bitfinex minute bars, newest first
+        "kind": "ohlcv",
+        "columns": CDD_OHLCV_COLUMNS,
+        "dtypes": {'unix': np.float64, 'close': np.float64, 'Volume BTC': np.float64},
+        "time": "unix",
+        "unit": "ms",
+        "price": "close",
+        "quantity": "Volume BTC",
+        "trade_id": None,
+        "source_id": 2,
+    },
+    "scale_csv": {  # Legacy S.C.A.L.E. CSV and G.R.I.M.'s own daily CSVs
+        "kind": "trades",
+        "columns": SCALE_CSV_COLUMNS,
+        "dtypes": {'timestamp': 'object', 'price': np.float64, 'quantity': np.float64, 'tradeId': 'object'},
+        "time": "timestamp",
+        "unit": "iso",
+        "price": "price",
+        "quantity": "quantity",
+        "trade_id": "tradeId",
+    },
+}
+
+def epoch_unit(value: float) -> str:
+    """Unit of an epoch timestamp judged by its magnitude ('s', 'ms' or 'us')."""
+    value = abs(float(value))
+    return "us" if value >= 1e14 else "ms" if value >= 1e11 else "s"
+
+def sniff(path: str) -> Optional[Dict]:
+    """Recognise a source file from its first bytes: the FORMATS entry plus 'name', 'skiprows' (rows before the
+    data), the actual 'columns' and the effective time 'unit'; None if the layout is unknown."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(SNIFF_BYTES).decode('utf-8', errors='replace')
+    except OSError as e:
+        logger.error(f"Error sniffing {path}: {e}")
+        return None
+    lines = [line.strip() for line in head.splitlines() if line.strip()]
+    skip = 1 if lines and lines[0].lower().startswith("http") else 0  # CryptoDataDownload banner line
+    if len(lines) <= skip:
+        return None
+    fields = [field.strip() for field in lines[skip].split(',')]
+    lower = [field.lower() for field in fields]
+    header = True
+    if len(fields) == len(BINANCE_AGGTRADE_COLUMNS) and fields[0].isdigit():
+        name, header = "binance_aggtrades", False
+    elif lower[:len(BINANCE_AGGTRADE_COLUMNS)] == BINANCE_AGGTRADE_COLUMNS:
+        name = "binance_aggtrades"
+    elif {'unix', 'open', 'high', 'low', 'close'} <= set(lower):
+        name = "bitfinex_ohlcv" if 'bitfinex' in os.path.basename(path).lower() else "bitstamp_ohlcv"
+    elif lower[:3] == ['timestamp', 'price', 'quantity'] and 'tradeid' in lower:
+        name = "scale_csv"
+    else:
+        return None
+    canonical = {col.lower(): col for col in FORMATS[name]["columns"]}
+    columns = [canonical.get(field, field) for field in lower] if header else FORMATS[name]["columns"]
+    source = dict(FORMATS[name], name=name, columns=columns, skiprows=skip + (1 if header else 0))
+    if source["unit"] != "iso" and len(lines) > source["skiprows"]:
+        first = lines[source["skiprows"]].split(',')[columns.index(source["time"])]
+        try:
+            source["unit"] = epoch_unit(float(first))
+        except ValueError:
+            pass
+    logger.debug(f"Sniffed {path} as {name} (skip {source['skiprows']} rows, time unit {source['unit']})")
+    return source
+
+def to_epoch_ms(values: pd.Series, unit: str) -> np.ndarray:
+    """Epoch-ms int64 array from a time column in `unit` ('s', 'ms', 'us' or 'iso'); unparseable times become -1."""
+    if unit == "iso":
+        times = pd.to_datetime(values, utc=True, errors='coerce', format='ISO8601')
+        return np.where(times.isna(), -1, times.dt.tz_localize(None).to_numpy().astype('datetime64[ms]').astype(np.int64))
+    values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64) if values.dtype == object else values.to_numpy()
+    if unit == "s":
+        ms = np.round(values * 1000)
+    elif unit == "us":
+        ms = values // 1000
+    else:
+        ms = values
+    if ms.dtype.kind == 'f':
+        return np.where(np.isnan(ms), -1, ms).astype(np.int64)
+    return ms.astype(np.int64)
+
+def iso_timestamps(time_ms: np.ndarray, unit: str = 's') -> np.ndarray:
+    """'%Y-%m-%dT%H:%M:%SZ' strings (with milliseconds if `unit` is 'ms') for epoch-ms times, vectorised
+    (pandas strftime is ~16x slower)."""
+    return np.char.add(np.datetime_as_string(np.asarray(time_ms, dtype=np.int64).astype('datetime64[ms]').astype(f'datetime64[{unit}]')), 'Z')
+
+def synthetic_ids(time_ms: np.ndarray, source_id: int) -> np.ndarray:
+    """int64 trade IDs for OHLCV bars of one source from their epoch-ms times, vectorised."""
+    return SYNTHETIC_ID_FLAG | (np.int64(source_id) << SYNTHETIC_TIME_BITS) | np.asarray(time_ms, dtype=np.int64)
+
+def trade_ids(ids: pd.Series, time_ms: np.ndarray) -> np.ndarray:
+    """int64 trade IDs for tradeId values: numeric IDs as-is, others (md5-hashed OHLCV IDs from older
+    G.R.I.M. versions) replaced by synthetic IDs from the rows' times."""
+    if ids.dtype.kind in 'iu':
+        return ids.to_numpy(dtype=np.int64)
+    numeric = pd.to_numeric(ids, errors='coerce', dtype_backend='numpy_nullable')  # Nullable, so 63-bit IDs stay exact
+    hashed = numeric.isna().to_numpy()
+    result = numeric.fillna(0).to_numpy(dtype=np.int64)
+    if hashed.any():
+        result[hashed] = synthetic_ids(np.asarray(time_ms, dtype=np.int64)[hashed], LEGACY_SOURCE_ID)
+    return result
+
+def day_numbers(date_strs: Iterable[str]) -> np.ndarray:
+    """Days since the epoch for YYYYMMDD strings, for fast membership tests against time_ms // DAY_MS."""
+    days = [f"{d[:4]}-{d[4:6]}-{d[6:8]}" for d in date_strs]
+    return np.array(days, dtype='datetime64[D]').astype(np.int64) if days else np.empty(0, dtype=np.int64)
+
+def _read_csv(path: str, source: Dict, usecols: list, chunksize: Optional[int]):
+    kwargs = dict(header=None, names=source["columns"], skiprows=source["skiprows"], usecols=usecols,
+                  dtype={col: source["dtypes"][col] for col in usecols if col in source["dtypes"]},
+                  encoding='utf-8', encoding_errors='replace')
+    if chunksize is None and CSV_ENGINE == "pyarrow":
+        try:
+            return pd.read_csv(path, engine="pyarrow", **kwargs)
+        except ValueError as e:
+            logger.debug(f"pyarrow engine declined {path} ({e}), using the C engine")
+    return pd.read_csv(path, engine="c", chunksize=chunksize, **kwargs)
+
+def _batches(chunks: Iterable[pd.DataFrame], source: Dict, names: Dict[str, str]) -> Iterator[pd.DataFrame]:
+    for chunk in chunks:
+        batch = pd.DataFrame({key: chunk[col].to_numpy() for key, col in names.items() if key != "time"}, index=chunk.index)
+        batch.insert(0, "time", to_epoch_ms(chunk[names["time"]], source["unit"]))
+        if "quantity" not in names:  # e.g. a CryptoDataDownload file for another base asset
+            batch["quantity"] = 0.0
+        yield batch[(batch["time"] >= 0) & batch["price"].notna() & batch["quantity"].notna()]
+
+def _batch_columns(source: Dict) -> Dict[str, str]:
+    names = {"time": source["time"], "price": source["price"], "quantity": source["quantity"], "trade_id": source["trade_id"]}
+    return {key: col for key, col in names.items() if col and col in source["columns"]}
+
+def read_batches(path: str, source: Dict, chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Parse a sniffed file into frames of 'time' (epoch ms), 'price', 'quantity' and, for trade sources,
+    'trade_id'; rows with an unparseable time, price or quantity are dropped."""
+    names = _batch_columns(source)
+    reader = _read_csv(path, source, list(dict.fromkeys(names.values())), chunksize)
+    yield from _batches([reader] if chunksize is None else reader, source, names)
+
+def read_blocks(path: str, source: Dict, blocks: List[Tuple[int, int]]) -> Iterator[pd.DataFrame]:
+    """Like read_batches(), but parsing only the (start byte, end byte) `blocks` from seek_blocks() or split_lines(),
+    one batch per block."""
+    names = _batch_columns(source)
+    usecols = list(dict.fromkeys(names.values()))
+    with open(path, 'rb') as f:
+        for lo, hi in blocks:
+            f.seek(lo)
+            chunk = _read_csv(io.BytesIO(f.read(hi - lo)), dict(source, skiprows=0), usecols, None)
+            yield from _batches([chunk], source, names)
+
+def day_runs(days: np.ndarray) -> List[List[int]]:
+    """Runs [first, last] of consecutive values in sorted, unique epoch day numbers."""
+    if len(days) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(days) > 1)
+    return [[int(days[first]), int(days[last])] for first, last in zip(np.r_[0, breaks + 1], np.r_[breaks, len(days) - 1])]
+
+def _line_starts(path: str, skiprows: int, every: int) -> Tuple[List[int], int]:
+    """Byte offsets of data rows 0, every, 2 * every, ... (rows start after `skiprows` lines) and the data row count."""
+    offsets, lines, base = [], 0, 0
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(SCAN_BLOCK_BYTES)
+            if not block:
+                break
+            starts = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10) + base + 1
+            if base == 0:
+                starts = np.r_[0, starts]
+            starts = starts[starts < size]
+            rows = lines + np.arange(len(starts)) - skiprows
+            offsets.extend(int(offset) for offset in starts[(rows >= 0) & (rows % every == 0)])
+            lines += len(starts)
+            base += len(block)
+    return offsets, max(lines - skiprows, 0)
+
+def seek_index(path: str, source: Dict, count: int, times: List[int]) -> Optional[List[List[int]]]:
+    """Sparse [byte offset, time] entries every SEEK_INDEX_ROWS data rows of a sorted file with `count` parsed
+    rows, given the epoch-ms `times` of rows 0, SEEK_INDEX_ROWS, ...; None if rows and lines disagree."""
+    offsets, rows = _line_starts(path, source["skiprows"], SEEK_INDEX_ROWS)
+    if rows != count:  # e.g. blank lines, which the parser skips
+        logger.debug(f"Not indexing {path}: {rows} lines but {count} rows")
+        return None
+    return [[offset, time_ms] for offset, time_ms in zip(offsets, times)]
+
+def index_blocks(index: List[List[int]], size: int) -> List[Tuple[int, int]]:
+    """(start byte, end byte) of every block of a seek index over a `size`-byte file, in file order."""
+    starts = [entry[0] for entry in index]
+    return list(zip(starts, starts[1:] + [size]))
+
+def seek_blocks(index: List[List[int]], size: int, ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """The index_blocks() that can hold times in any of the [start, end) epoch-ms `ranges`, in file order."""
+    times = np.array([entry[-1] for entry in index], dtype=np.int64)
+    descending = times[-1] < times[0]
+    keys = -times if descending else times
+    wanted = set()
+    for start, end in ranges:
+        lo, hi = (1 - end, 1 - start) if descending else (start, end)  # Times are integers: t < end <=> -t >= 1 - end
+        first = max(int(np.searchsorted(keys, lo, side='left')) - 1, 0)  # The block before may end on a row equal to lo
+        wanted.update(range(first, int(np.searchsorted(keys, hi, side='left'))))
+    blocks = index_blocks(index, size)
+    return [blocks[i] for i in sorted(wanted)]
+
+def split_lines(path: str, source: Dict, parts: int, start: Optional[int] = None) -> List[Tuple[int, int]]:
+    """About `parts` newline-aligned (start byte, end byte) blocks covering a file's data rows, or only those from
+    the line start `start` on."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if start is None:
+            for _ in range(source["skiprows"]):
+                f.readline()
+        else:
+            f.seek(start)
+        bounds = [f.tell()]
+        for part in range(1, parts):
+            f.seek(max(bounds[0] + (size - bounds[0]) * part // parts - 1, bounds[-1]))
+            f.readline()  # Finish the line the split point falls in
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+def line_start(path: str, offset: int) -> int:
+    """Byte offset of the start of the line holding byte `offset` - 1, i.e. the last line of a file's first `offset` bytes."""
+    with open(path, 'rb') as f:
+        end = offset
+        while end > 0:
+            lo = max(end - SNIFF_BYTES, 0)
+            f.seek(lo)
+            block = f.read(end - lo)
+            newline = block.rfind(b"\n", 0, len(block) - 1 if end == offset else len(block))
+            if newline >= 0:
+                return lo + newline + 1
+            end = lo
+    return 0
+
+def scan(path: str, source: Dict, start: Optional[int] = None) -> Optional[Dict]:
+    """Time coverage of a sniffed file from its time column alone: 'min_time'/'max_time' (epoch ms), 'days', the
+    runs [first, last] of epoch day numbers it has rows on, and its seek 'offsets' index; None if it has no valid times.
+    With `start` (a line start), only the rows from there on are scanned, and no seek index is built.
+    The time column is parsed SCAN_CHUNK_ROWS rows at a time."""
+    min_time, max_time, days, count, samples = None, None, np.empty(0, dtype=np.int64), 0, []
+    ascending = descending = sortable = True
+    last = None
+    with open(path, 'rb') as f:
+        if start is not None:
+            f.seek(start)
+        for chunk in _read_csv(f, source if start is None else dict(source, skiprows=0), [source["time"]], SCAN_CHUNK_ROWS):
+            times = to_epoch_ms(chunk[source["time"]], source["unit"])
+            valid = times[times >= 0]
+            if len(valid):
+                min_time = min(int(valid.min()), min_time if min_time is not None else int(valid.min()))
+                max_time = max(int(valid.max()), max_time if max_time is not None else int(valid.max()))
+                days = np.union1d(days, np.unique(valid // DAY_MS))
+            if start is None and sortable and len(times):
+                sortable = len(valid) == len(times)
+                steps = np.diff(np.r_[[last] if last is not None else [], times])
+                ascending, descending = ascending and (steps >= 0).all(), descending and (steps <= 0).all()
+                samples.extend(int(t) for t in times[(count + np.arange(len(times))) % SEEK_INDEX_ROWS == 0])
+                last = times[-1]
+            count += len(times)
+    if min_time is None:
+        return None
+    indexable = start is None and sortable and (ascending or descending) and count > SEEK_INDEX_ROWS
+    return {"min_time": min_time, "max_time": max_time, "days": day_runs(days),
+            "offsets": seek_index(path, source, count, samples) if indexable else None}
+
+def merge_runs(runs: list, other: list) -> List[List[int]]:
+    """Union of two lists of [first, last] day runs, as runs."""
+    days = [np.arange(first, last + 1) for first, last in list(runs) + list(other)]
+    return day_runs(np.unique(np.concatenate(days))) if days else []
+
+def runs_overlap(runs: list, days: np.ndarray) -> bool:
+    """Whether any of the sorted epoch day numbers `days` falls in one of the [first, last] `runs`."""
+    for first, last in runs:
+        i = np.searchsorted(days, first)
+        if i < len(days) and days[i] <= last:
+            return True
+    return False
@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import argparse
+import logging
+from glob import glob
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+
+try:
+    from src.scale.tape import BAR_DTYPE, TAPE_EXTENSION, open_bars, symbol_dir
+    from src.grim import store
+except ImportError:  # Run directly as a script: make the project root importable
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from src.scale.tape import BAR_DTYPE, TAPE_EXTENSION, open_bars, symbol_dir
+    from src.grim import store
+
+logger = logging.getLogger(__name__)
+
+# OHLCV candles G.R.I.M. keeps next to the trade store, so consumers read bars instead
+# of resampling raw trades. One BAR_DTYPE record file (the S.C.A.L.E. bar format: OHLC,
+# volume, quote volume, VWAP and trade count) per symbol, resolution and UTC month,
+# sorted by open time, with no record for a bucket without trades:
+#     data/grim/candles/<SYMBOL>/<resolution>/YYYYMM.bin
+# update() runs after every store write: it recomputes the 1m buckets the new trades
+# fall in from the store (which also holds the older trades of those buckets), then
+# each coarser resolution's touched buckets from the 1m bars. Every resolution divides
+# a UTC day, so a bucket never spans two months (or two writer shards).
+CANDLE_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "data", "grim", "candles")
+RESOLUTIONS = {"1m": 60000, "5m": 300000, "15m": 900000, "1h": 3600000, "4h": 14400000, "1d": 86400000}  # Milliseconds
+BASE_RESOLUTION = "1m"  # Built from trades; the others are rolled up from it
+SPAN_GAP_MS = 3600000  # New trades further apart than this are recomputed as separate spans
+
+TimeLike = store.TimeLike
+
+def month_path(base_dir: str, symbol: str, resolution: str, month: str) -> str:
+    """Path of a symbol's candle file for a resolution and YYYYMM month."""
+    return os.path.join(symbol_dir(base_dir, symbol), resolution, f"{month}{TAPE_EXTENSION}")
+
+def list_months(symbol: str, resolution: str, base_dir: Optional[str] = None) -> Dict[str, str]:
+    """Map YYYYMM -> candle file path for every month of a symbol's bars at a resolution, oldest first."""
+    base_dir = base_dir or CANDLE_DIR
+    months = {}
+    for path in glob(os.path.join(symbol_dir(base_dir, symbol), resolution, f"*{TAPE_EXTENSION}")):
+        month = os.path.basename(path)[:-len(TAPE_EXTENSION)]
+        if len(month) == 6 and month.isdigit():
+            months[month] = path
+    return dict(sorted(months.items()))
+
+def month_bounds(start_ms: int, end_ms: int) -> List[Tuple[str, int, int]]:
+    """(YYYYMM, start, end) of each UTC month overlapping start_ms <= time < end_ms, clipped to it."""
+    first = np.datetime64(start_ms, 'ms').astype('datetime64[M]')
+    last = np.datetime64(end_ms - 1, 'ms').astype('datetime64[M]')
+    bounds = []
+    for month in np.arange(first, last + 1):
+        lo = int(month.astype('datetime64[ms]').astype(np.int64))
+        hi = int((month + 1).astype('datetime64[ms]').astype(np.int64))
+        bounds.append((str(month).replace("-", ""), max(lo, start_ms), min(hi, end_ms)))
+    return bounds
+
+def trade_bars(time_ms: np.ndarray, price: np.ndarray, quantity: np.ndarray, interval_ms: int) -> np.ndarray:
+    """BAR_DTYPE bars of time-sorted trades, one per `interval_ms` bucket with trades."""
+    if len(time_ms) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    buckets = time_ms - time_ms % interval_ms
+    starts = np.r_[0, np.flatnonzero(buckets[1:] != buckets[:-1]) + 1]
+    ends = np.r_[starts[1:], len(time_ms)]
+    bars = np.empty(len(starts), dtype=BAR_DTYPE)
+    bars['open_time'] = buckets[starts]
+    bars['open'] = price[starts]
+    bars['high'] = np.maximum.reduceat(price, starts)
+    bars['low'] = np.minimum.reduceat(price, starts)
+    bars['close'] = price[ends - 1]
+    bars['volume'] = np.add.reduceat(quantity, starts)
+    bars['quote_volume'] = np.add.reduceat(price * quantity, starts)
+    bars['trades'] = ends - starts
+    return with_vwap(bars)
+
+def rollup(bars: np.ndarray, interval_ms: int) -> np.ndarray:
+    """Bars of a coarser `interval_ms` from sorted finer BAR_DTYPE bars."""
+    if len(bars) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    buckets = bars['open_time'] - bars['open_time'] % interval_ms
+    starts = np.r_[0, np.flatnonzero(buckets[1:] != buckets[:-1]) + 1]
+    ends = np.r_[starts[1:], len(bars)]
+    rolled = np.empty(len(starts), dtype=BAR_DTYPE)
+    rolled['open_time'] = buckets[starts]
+    rolled['open'] = bars['open'][starts]
+    rolled['high'] = np.maximum.reduceat(bars['high'], starts)
+    rolled['low'] = np.minimum.reduceat(bars['low'], starts)
+    rolled['close'] = bars['close'][ends - 1]
+    for field in ('volume', 'quote_volume', 'trades'):
+        rolled[field] = np.add.reduceat(bars[field], starts)
+    return with_vwap(rolled)
+
+def with_vwap(bars: np.ndarray) -> np.ndarray:
+    """Fill bars' VWAP from their quote volume and volume (the close for a bar without volume)."""
+    volume = bars['volume']
+    bars['vwap'] = np.where(volume > 0, bars['quote_volume'] / np.where(volume > 0, volume, 1), bars['close'])
+    return bars
+
+def read_bars(symbol: str, resolution: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+              base_dir: Optional[str] = None) -> List[np.ndarray]:
+    """Bars with start_ms <= open_time < end_ms, as memory-mapped slices of the month files, oldest first."""
+    base_dir = base_dir or CANDLE_DIR
+    first_month = store.month_of(start_ms) if start_ms is not None else None
+    last_month = store.month_of(end_ms - 1) if end_ms is not None else None
+    slices = []
+    for month, path in list_months(symbol, resolution, base_dir).items():
+        if (first_month and month < first_month) or (last_month and month > last_month):
+            continue
+        bars = open_bars(path)
+        times = bars['open_time']
+        lo = int(np.searchsorted(times, start_ms, side='left')) if start_ms is not None else 0
+        hi = int(np.searchsorted(times, end_ms, side='left')) if end_ms is not None else len(bars)
+        if hi > lo:
+            slices.append(bars[lo:hi])
+    return slices
+
+def latest_time(symbol: str, resolution: str, base_dir: Optional[str] = None) -> Optional[int]:
+    """Open time in epoch ms of a symbol's newest bar at a resolution, or None if it has none."""
+    base_dir = base_dir or CANDLE_DIR
+    for path in reversed(list(list_months(symbol, resolution, base_dir).values())):
+        bars = open_bars(path)
+        if len(bars):
+            return int(bars['open_time'][-1])
+    return None
+
+def replace_bars(symbol: str, resolution: str, start_ms: int, end_ms: int, bars: np.ndarray, base_dir: Optional[str] = None) -> None:
+    """Make `bars` (sorted) the only bars with start_ms <= open_time < end_ms."""
+    base_dir = base_dir or CANDLE_DIR
+    for month, lo, hi in month_bounds(start_ms, end_ms):
+        path = month_path(base_dir, symbol, resolution, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new = bars[(bars['open_time'] >= lo) & (bars['open_time'] < hi)]
+        existing = open_bars(path) if os.path.exists(path) else np.empty(0, dtype=BAR_DTYPE)
+        first = int(np.searchsorted(existing['open_time'], lo, side='left'))
+        last = int(np.searchsorted(existing['open_time'], hi, side='left'))
+        if last == len(existing):
+            # Common case (new trades at the end): drop the recomputed tail and append
+            del existing
+            with open(path, 'ab') as f:
+                f.truncate(first * BAR_DTYPE.itemsize)
+                f.write(new.tobytes())
+        else:
+            merged = np.concatenate([existing[:first], new, existing[last:]])
+            del existing
+            tmp_path = f"{path}.tmp"
+            merged.tofile(tmp_path)
+            os.replace(tmp_path, path)
+
+def spans(time_ms: np.ndarray, interval_ms: int) -> List[Tuple[int, int]]:
+    """[start, end) spans of `interval_ms` buckets covering sorted times, split where they are over SPAN_GAP_MS apart."""
+    if len(time_ms) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(time_ms) > SPAN_GAP_MS)
+    firsts, lasts = time_ms[np.r_[0, breaks + 1]], time_ms[np.r_[breaks, len(time_ms) - 1]]
+    return [(int(lo - lo % interval_ms), int(hi - hi % interval_ms + interval_ms)) for lo, hi in zip(firsts, lasts)]
+
+def refresh(symbol: str, start_ms: int, end_ms: int, base_dir: Optional[str] = None, store_dir: Optional[str] = None) -> int:
+    """Recompute every resolution's bars whose buckets overlap start_ms <= time < end_ms from the store; returns 1m bars written."""
+    base_dir = base_dir or CANDLE_DIR
+    store_dir = store_dir or store.STORE_DIR
+    base_ms = RESOLUTIONS[BASE_RESOLUTION]
+    start_ms, end_ms = start_ms - start_ms % base_ms, end_ms - (end_ms - 1) % base_ms - 1 + base_ms
+    trades = store.query(symbol, start_ms, end_ms, ["time", "price", "quantity"], base_dir=store_dir, as_frame=False)
+    minute_bars = trade_bars(trades["time"], trades["price"], trades["quantity"], base_ms)
+    replace_bars(symbol, BASE_RESOLUTION, start_ms, end_ms, minute_bars, base_dir)
+    for resolution, interval_ms in RESOLUTIONS.items():
+        if resolution == BASE_RESOLUTION:
+            continue
+        lo, hi = start_ms - start_ms % interval_ms, end_ms - (end_ms - 1) % interval_ms - 1 + interval_ms
+        base = read_bars(symbol, BASE_RESOLUTION, lo, hi, base_dir)
+        replace_bars(symbol, resolution, lo, hi, rollup(np.concatenate(base) if base else np.empty(0, dtype=BAR_DTYPE), interval_ms), base_dir)
+    return len(minute_bars)
+
+def update(symbol: str, records: np.ndarray, base_dir: Optional[str] = None, store_dir: Optional[str] = None) -> int:
+    """Refresh the candles of the buckets that just-written, time-sorted store records fall in; returns 1m bars written."""
+    base_dir = base_dir or CANDLE_DIR
+    store_dir = store_dir or store.STORE_DIR
+    try:
+        return sum(refresh(symbol, lo, hi, base_dir, store_dir) for lo, hi in spans(records['time'], RESOLUTIONS[BASE_RESOLUTION]))
+    except (OSError, ValueError) as e:
+        logger.error(f"Error updating {symbol} candles: {e}")
+        return 0
+
+def rebuild(symbol: str, months: Optional[List[str]] = None, base_dir: Optional[str] = None, store_dir: Optional[str] = None) -> int:
+    """Recompute a symbol's candles for every stored month, or only the given YYYYMM months; returns 1m bars written."""
+    base_dir = base_dir or CANDLE_DIR
+    store_dir = store_dir or store.STORE_DIR
+    written = 0
+    for month in (months if months is not None else store.list_months(symbol, store_dir)):
+        start = np.datetime64(f"{month[:4]}-{month[4:]}", 'M')
+        start_ms = int(start.astype('datetime64[ms]').astype(np.int64))
+        end_ms = int((start + 1).astype('datetime64[ms]').astype(np.int64))
+        written += refresh(symbol, start_ms, end_ms, base_dir, store_dir)
+    logger.info(f"Rebuilt {symbol} candles: {written} {BASE_RESOLUTION} bars")
+    return written
+
+def candles(symbol: str, resolution: str, start: TimeLike = None, end: TimeLike = None, columns: Optional[List[str]] = None,
+            base_dir: Optional[str] = None, as_frame: bool = True) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+    """Bars of `symbol` at `resolution` (a RESOLUTIONS key) with start <= open_time < end (either bound may be None), oldest first.
+
+    `columns` is any subset of BAR_DTYPE's fields (default: all); open_time is epoch ms.
+    Returns a DataFrame, or a dict of numpy arrays if `as_frame` is False.
+    """
+    base_dir = base_dir or CANDLE_DIR
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}; expected one of {list(RESOLUTIONS)}")
+    columns = list(columns or BAR_DTYPE.names)
+    unknown = set(columns) - set(BAR_DTYPE.names)
+    if unknown:
+        raise ValueError(f"Unknown candle columns: {sorted(unknown)}")
+    slices = read_bars(symbol, resolution, store.to_epoch_ms(start), store.to_epoch_ms(end), base_dir)
+    result = {col: np.concatenate([bars[col] for bars in slices]) if slices else np.empty(0, dtype=BAR_DTYPE[col]) for col in columns}
+    return pd.DataFrame(result, copy=False) if as_frame else result
+
+def main() -> None:
+    """Rebuild a symbol's candles from the consolidated store."""
+    parser = argparse.ArgumentParser(description="Rebuild G.R.I.M. candle rollups from the consolidated trade store")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--months", help="Comma-separated YYYYMM months (default: every stored month)")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    rebuild(args.symbol.upper(), args.months.split(",") if args.months else None)
+    logger.info(f"Done in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    main()
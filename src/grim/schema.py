@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import logging
+from glob import glob
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+try:
+    from src.grim import formats
+except ImportError:  # Run directly as a script: make the project root importable
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from src.grim import formats
+
+logger = logging.getLogger(__name__)
+
+# Schema of G.R.I.M.'s daily SQLite files (data/grim/YYYYMM/chart/sqlite/YYYYMMDD.db).
+# Version 2 stores a trade as numbers only: epoch-ms time, int64 trade ID and an ID into
+# the file's symbols dictionary, clustered on (time, symbol_id, trade_id) in a WITHOUT
+# ROWID table. ISO strings only exist in the market_data_text view and in exported CSVs.
+# Version 1 (TEXT timestamp/tradeId/symbol key, a redundant quoteQty column) and the
+# older 'trades'/'ohlcv' tables are converted by migrate(); run this module to convert
+# every daily file at once.
+SCHEMA_VERSION = 2  # Kept in PRAGMA user_version
+GRIM_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "data", "grim")
+FRAME_COLUMNS = ["time", "trade_id", "price", "quantity", "symbol"]  # G.R.I.M.'s unified in-memory frame
+DEFAULT_SYMBOL = "BTCUSDT"  # For legacy rows without a symbol
+
+def create(conn: sqlite3.Connection) -> None:
+    """Create the current schema's tables and view if missing and stamp the version."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS symbols (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS market_data (
+            time INTEGER NOT NULL,
+            symbol_id INTEGER NOT NULL,
+            trade_id INTEGER NOT NULL,
+            price REAL,
+            quantity REAL,
+            PRIMARY KEY (time, symbol_id, trade_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS market_data_text AS
+        SELECT strftime('%Y-%m-%dT%H:%M:%fZ', m.time / 1000.0, 'unixepoch') AS timestamp, m.price, m.quantity,
+               m.price * m.quantity AS quoteQty, CAST(m.trade_id AS TEXT) AS tradeId, s.name AS symbol
+        FROM market_data m JOIN symbols s ON s.id = m.symbol_id
+    """)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def version(conn: sqlite3.Connection) -> Optional[int]:
+    """Schema version of an open daily file: PRAGMA user_version, 1 for older files with data tables, None if empty."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    if current:
+        return current
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return 1 if tables & {"market_data", "trades", "ohlcv"} else None
+
+def symbol_ids(conn: sqlite3.Connection, names) -> Dict[str, int]:
+    """IDs of symbol names in a file's dictionary, adding any new ones."""
+    names = [str(name) for name in pd.unique(pd.Series(names, dtype=object))]
+    conn.executemany("INSERT OR IGNORE INTO symbols (name) VALUES (?)", [(name,) for name in names])
+    placeholders = ", ".join("?" * len(names))
+    return dict(conn.execute(f"SELECT name, id FROM symbols WHERE name IN ({placeholders})", names).fetchall())
+
+def rows(conn: sqlite3.Connection, df: pd.DataFrame):
+    """(time, symbol_id, trade_id, price, quantity) tuples of a unified frame, for executemany()."""
+    ids = symbol_ids(conn, df["symbol"])
+    symbol_id = df["symbol"].map(ids).to_numpy(dtype=np.int64)
+    return zip(df["time"].to_numpy(dtype=np.int64).tolist(), symbol_id.tolist(), df["trade_id"].to_numpy(dtype=np.int64).tolist(),
+               df["price"].to_numpy(dtype=np.float64).tolist(), df["quantity"].to_numpy(dtype=np.float64).tolist())
+
+def insert(conn: sqlite3.Connection, df: pd.DataFrame) -> None:
+    """Insert a unified frame's rows, replacing any with the same key."""
+    conn.executemany("INSERT OR REPLACE INTO market_data (time, symbol_id, trade_id, price, quantity) VALUES (?, ?, ?, ?, ?)",
+                     rows(conn, df))
+
+def read(conn: sqlite3.Connection, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> pd.DataFrame:
+    """Unified frame of a current-schema file's rows with start_ms <= time < end_ms, in key order."""
+    df = pd.read_sql("""
+        SELECT m.time, m.trade_id, m.price, m.quantity, s.name AS symbol
+        FROM market_data m JOIN symbols s ON s.id = m.symbol_id
+        WHERE m.time >= ? AND m.time < ?
+        ORDER BY m.time, m.symbol_id, m.trade_id
+    """, conn, params=(start_ms if start_ms is not None else -2**63, end_ms if end_ms is not None else 2**63 - 1))
+    return df[FRAME_COLUMNS]
+
+def legacy_frame(conn: sqlite3.Connection) -> pd.DataFrame:
+    """Unified frame of a version 1 file: its TEXT-keyed 'market_data' plus any legacy 'trades' and 'ohlcv' tables."""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    frames = []
+    for table in ("trades", "market_data"):  # market_data rows win over legacy trades with the same key
+        if table in tables:
+            df = pd.read_sql(f"SELECT timestamp, price, quantity, tradeId, symbol FROM {table}", conn)
+            time_ms = formats.to_epoch_ms(df["timestamp"], "iso")
+            frames.append(pd.DataFrame({
+                "time": time_ms,
+                "trade_id": formats.trade_ids(df["tradeId"], time_ms),
+                "price": df["price"].to_numpy(dtype=np.float64),
+                "quantity": df["quantity"].to_numpy(dtype=np.float64),
+                "symbol": df["symbol"].fillna(DEFAULT_SYMBOL).astype(str),
+            }))
+    if "ohlcv" in tables:
+        df = pd.read_sql("SELECT unix, close, `Volume BTC`, symbol FROM ohlcv", conn)
+        times = df["unix"].to_numpy(dtype=np.int64)
+        frames.insert(0, pd.DataFrame({  # IDs match those trade_ids() gives the old md5-hashed copies of these rows
+            "time": times,
+            "trade_id": formats.synthetic_ids(times, formats.LEGACY_SOURCE_ID),
+            "price": df["close"].fillna(0.0).to_numpy(dtype=np.float64),
+            "quantity": df["Volume BTC"].fillna(0.0).to_numpy(dtype=np.float64),
+            "symbol": df["symbol"].fillna(DEFAULT_SYMBOL).astype(str),
+        }))
+    if not frames:
+        return pd.DataFrame({col: [] for col in FRAME_COLUMNS})
+    df = pd.concat(frames, ignore_index=True)
+    return df[df["time"] >= 0]
+
+def migrate(path: str) -> Optional[Tuple[int, int]]:
+    """Rewrite an older daily file in the current schema, replacing it atomically.
+    Returns its (bytes before, bytes after), or None if it was already current."""
+    conn = sqlite3.connect(path)
+    try:
+        if version(conn) in (None, SCHEMA_VERSION):
+            return None
+        df = legacy_frame(conn)
+    finally:
+        conn.close()
+    before = sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+    tmp_path = f"{path}.migrate.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        create(conn)
+        df = df.sort_values(["time", "symbol", "trade_id"], kind="stable")
+        insert(conn, df)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    for stale in (f"{path}-wal", f"{path}-shm"):  # Left by the old file's WAL mode
+        if os.path.exists(stale):
+            os.remove(stale)
+    after = os.path.getsize(path)
+    logger.info(f"Migrated {path} to schema {SCHEMA_VERSION}: {len(df)} rows, {before / 1e6:.1f} -> {after / 1e6:.1f} MB")
+    return before, after
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a daily file in WAL mode with the current schema, migrating an older one first."""
+    if os.path.exists(path):
+        migrate(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    create(conn)
+    conn.commit()
+    return conn
+
+def main() -> None:
+    """Migrate every daily SQLite file under a G.R.I.M. data directory to the current schema."""
+    parser = argparse.ArgumentParser(description=f"Convert G.R.I.M. daily SQLite files to schema version {SCHEMA_VERSION}")
+    parser.add_argument("--base-dir", default=GRIM_DIR, help="G.R.I.M. data directory holding YYYYMM/chart/sqlite/*.db")
+    args = parser.parse_args()
+    files = sorted(glob(os.path.join(args.base_dir, "*", "chart", "sqlite", "*.db")))
+    logger.info(f"Checking {len(files)} daily SQLite files under {args.base_dir}")
+    started, migrated, before, after = time.perf_counter(), 0, 0, 0
+    for path in files:
+        try:
+            sizes = migrate(path)
+        except (sqlite3.Error, pd.errors.DatabaseError, OSError) as e:
+            logger.error(f"Error migrating {path}: {e}")
+            continue
+        if sizes:
+            migrated += 1
+            before += sizes[0]
+            after += sizes[1]
+    logger.info(f"Migrated {migrated} of {len(files)} files in {time.perf_counter() - started:.1f}s: "
+                f"{before / 1e6:.1f} -> {after / 1e6:.1f} MB" + (f" ({after / before:.0%})" if before else ""))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    main()
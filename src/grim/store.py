@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+from datetime import datetime, timezone
+from glob import glob
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+
+from src.scale.tape import TRADE_DTYPE, TAPE_EXTENSION, open_tape, symbol_dir
+
+logger = logging.getLogger(__name__)
+
+# Consolidated trade store: per symbol, one sorted TRADE_DTYPE file per UTC month
+# (data/grim/store/<SYMBOL>/YYYYMM.bin) plus pending .seg files that compact() folds in
+STORE_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "data", "grim", "store")
+STORE_COLUMNS = ["time", "trade_id", "price", "quantity", "quote_qty"]  # quote_qty is derived (price * quantity)
+SEGMENT_EXTENSION = ".seg"
+COMPACT_SEGMENTS = 16  # Pending segments of an open month that get merged into one
+COMPACT_FRACTION = 0.25  # Segment bytes, as a share of the partition's, that make an open month due for compaction
+
+TimeLike = Union[None, int, float, str, datetime, pd.Timestamp]
+
+def to_epoch_ms(value: TimeLike) -> Optional[int]:
+    """Epoch milliseconds for a datetime, ISO string or epoch-ms number (naive times are UTC); None passes through."""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(timezone.utc)
+    return int(ts.value // 1_000_000)
+
+def month_of(time_ms: int) -> str:
+    """YYYYMM partition key of an epoch-ms time."""
+    return datetime.fromtimestamp(time_ms / 1000, tz=timezone.utc).strftime("%Y%m")
+
+def partition_path(base_dir: str, symbol: str, month: str) -> str:
+    """Path of a symbol's partition file for a YYYYMM month."""
+    return os.path.join(symbol_dir(base_dir, symbol), f"{month}{TAPE_EXTENSION}")
+
+def list_partitions(symbol: str, base_dir: Optional[str] = None) -> Dict[str, str]:
+    """Map YYYYMM -> partition path for every stored month of a symbol, oldest first."""
+    base_dir = base_dir or STORE_DIR
+    partitions = {}
+    for path in glob(os.path.join(symbol_dir(base_dir, symbol), f"*{TAPE_EXTENSION}")):
+        month = os.path.basename(path)[:-len(TAPE_EXTENSION)]
+        if len(month) == 6 and month.isdigit():
+            partitions[month] = path
+    return dict(sorted(partitions.items()))
+
+def segment_paths(base_dir: str, symbol: str, month: str) -> List[str]:
+    """Pending segment files of a partition, oldest first."""
+    return sorted(glob(os.path.join(symbol_dir(base_dir, symbol), f"{month}.*{SEGMENT_EXTENSION}")))
+
+def list_segments(symbol: str, base_dir: Optional[str] = None) -> Dict[str, List[str]]:
+    """Map YYYYMM -> pending segment paths for every month of a symbol that has any."""
+    base_dir = base_dir or STORE_DIR
+    segments = {}
+    for path in sorted(glob(os.path.join(symbol_dir(base_dir, symbol), f"*{SEGMENT_EXTENSION}"))):
+        segments.setdefault(os.path.basename(path)[:6], []).append(path)
+    return segments
+
+def sort_unique(records: np.ndarray) -> np.ndarray:
+    """Sort records by (time, trade_id), keeping the last of any duplicate (time, trade_id) pair."""
+    if len(records) < 2:
+        return records
+    records = records[np.lexsort((records['trade_id'], records['time']))]  # Stable: later rows stay after earlier ones
+    keep = np.ones(len(records), dtype=bool)
+    keep[:-1] = (records['time'][1:] != records['time'][:-1]) | (records['trade_id'][1:] != records['trade_id'][:-1])
+    return records[keep]
+
+def _replace(path: str, records: np.ndarray) -> None:
+    tmp_path = f"{path}.tmp"
+    records.tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+def write_partition(base_dir: str, symbol: str, month: str, records: np.ndarray) -> int:
+    """Append sorted, unique records to a month partition, or to a new segment if they are not all newer than it."""
+    path = partition_path(base_dir, symbol, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    existing = open_tape(path) if os.path.exists(path) else np.empty(0, dtype=TRADE_DTYPE)
+    newer = len(existing) == 0 or (records['time'][0], records['trade_id'][0]) > (existing['time'][-1], existing['trade_id'][-1])
+    del existing
+    if newer and not segment_paths(base_dir, symbol, month):
+        # Common case (live capture, forward backfill): a plain append keeps the partition sorted
+        with open(path, 'ab') as f:
+            f.write(records.tobytes())
+    else:
+        _replace(os.path.join(os.path.dirname(path), f"{month}.{time.time_ns()}-{os.getpid()}{SEGMENT_EXTENSION}"), records)
+    return len(records)
+
+def write(symbol: str, records: np.ndarray, base_dir: Optional[str] = None) -> int:
+    """Add TRADE_DTYPE records for a symbol; rows with the same (time, trade_id) replace older ones. Returns rows written."""
+    base_dir = base_dir or STORE_DIR
+    if len(records) == 0:
+        return 0
+    records = sort_unique(np.asarray(records, dtype=TRADE_DTYPE))
+    months = records['time'].astype('datetime64[ms]').astype('datetime64[M]')
+    bounds = np.flatnonzero(months[1:] != months[:-1]) + 1  # Records are time-sorted, so each month is one run
+    written = 0
+    for chunk in np.split(records, bounds):
+        month = month_of(int(chunk['time'][0]))
+        try:
+            written += write_partition(base_dir, symbol, month, chunk)
+        except OSError as e:
+            logger.error(f"Error writing store partition {symbol} {month}: {e}")
+    logger.debug(f"Wrote {written} {symbol} rows to the store")
+    return written
+
+def record_keys(records: np.ndarray) -> np.ndarray:
+    """(time, trade_id) of each record as one opaque 16-byte key, for set operations."""
+    keys = np.empty((len(records), 2), dtype=np.int64)
+    keys[:, 0] = records['time']
+    keys[:, 1] = records['trade_id']
+    return keys.view('V16').ravel()
+
+def unstored(symbol: str, records: np.ndarray, base_dir: Optional[str] = None) -> np.ndarray:
+    """Mask of sorted records whose (time, trade_id) the store does not hold yet."""
+    base_dir = base_dir or STORE_DIR
+    mask = np.ones(len(records), dtype=bool)
+    if len(records) == 0:
+        return mask
+    first, last = int(records['time'][0]), int(records['time'][-1])
+    stored = [part for month in list_months(symbol, base_dir) if month_of(first) <= month <= month_of(last)
+              for part in read_month(symbol, month, first, last + 1, base_dir)]
+    if stored:
+        mask = ~np.isin(record_keys(records), record_keys(np.concatenate(stored)))
+    return mask
+
+def compact(symbol: str, month: str, base_dir: Optional[str] = None) -> Optional[int]:
+    """Merge a partition's pending segments into it (sorted, duplicates resolved newest-wins); returns its row count."""
+    base_dir = base_dir or STORE_DIR
+    path = partition_path(base_dir, symbol, month)
+    segments = segment_paths(base_dir, symbol, month)
+    if not segments:
+        return None
+    try:
+        parts = [open_tape(path)] if os.path.exists(path) else []
+        parts += [open_tape(segment) for segment in segments]
+        merged = sort_unique(np.concatenate(parts)) if parts else np.empty(0, dtype=TRADE_DTYPE)
+        del parts
+        _replace(path, merged)
+        for segment in segments:
+            os.remove(segment)
+    except OSError as e:
+        logger.error(f"Error compacting store partition {path}: {e}")
+        return None
+    logger.info(f"Compacted {len(segments)} segments into {path} ({len(merged)} rows)")
+    return len(merged)
+
+def merge_segments(symbol: str, month: str, base_dir: Optional[str] = None) -> Optional[int]:
+    """Merge a partition's pending segments into one new segment, leaving the partition alone; returns its row count."""
+    base_dir = base_dir or STORE_DIR
+    segments = segment_paths(base_dir, symbol, month)
+    if len(segments) < 2:
+        return None
+    try:
+        merged = sort_unique(np.concatenate([open_tape(segment) for segment in segments]))  # Later segments win
+        _replace(os.path.join(os.path.dirname(segments[0]), f"{month}.{time.time_ns()}-{os.getpid()}{SEGMENT_EXTENSION}"), merged)
+        for segment in segments:
+            os.remove(segment)
+    except OSError as e:
+        logger.error(f"Error merging store segments of {symbol} {month}: {e}")
+        return None
+    logger.info(f"Merged {len(segments)} segments of {symbol} {month} ({len(merged)} rows)")
+    return len(merged)
+
+def compact_due(symbol: str, base_dir: Optional[str] = None, max_segments: int = COMPACT_SEGMENTS,
+                open_month: Optional[str] = None, owns: Optional[Callable[[str], bool]] = None) -> List[str]:
+    """Compact every month with pending segments that is sealed (before `open_month`, default the current
+    UTC month) or whose segments reach COMPACT_FRACTION of its partition's size, and merge the segments
+    of any other month with at least `max_segments` of them, limited to months `owns(month)` accepts if
+    given; returns the compacted months."""
+    base_dir = base_dir or STORE_DIR
+    open_month = open_month or datetime.now(timezone.utc).strftime("%Y%m")
+    compacted = []
+    for month, segments in list_segments(symbol, base_dir).items():
+        if owns is not None and not owns(month):
+            continue
+        try:
+            segment_bytes = sum(os.path.getsize(segment) for segment in segments)
+            path = partition_path(base_dir, symbol, month)
+            partition_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        except OSError as e:
+            logger.error(f"Error sizing store partition {symbol} {month}: {e}")
+            continue
+        if month < open_month or segment_bytes >= partition_bytes * COMPACT_FRACTION:
+            if compact(symbol, month, base_dir) is not None:
+                compacted.append(month)
+        elif len(segments) >= max_segments:
+            merge_segments(symbol, month, base_dir)
+    return compacted
+
+def read_month(symbol: str, month: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+               base_dir: Optional[str] = None) -> List[np.ndarray]:
+    """Records of one month with start_ms <= time < end_ms, as sorted slices: memory-mapped views of the
+    partition when it has no pending segments, otherwise one merged array."""
+    base_dir = base_dir or STORE_DIR
+    for _ in range(3):  # A concurrent compact() may remove a segment between listing and opening it
+        path = partition_path(base_dir, symbol, month)
+        files = ([path] if os.path.exists(path) else []) + segment_paths(base_dir, symbol, month)
+        try:
+            slices = []
+            for file in files:
+                part = open_tape(file)
+                times = part['time']
+                lo = int(np.searchsorted(times, start_ms, side='left')) if start_ms is not None else 0
+                hi = int(np.searchsorted(times, end_ms, side='left')) if end_ms is not None else len(part)
+                if hi > lo:
+                    slices.append(part[lo:hi])
+        except FileNotFoundError:
+            continue
+        return [sort_unique(np.concatenate(slices))] if len(slices) > 1 else slices
+    logger.error(f"Store partition {symbol} {month} kept changing while being read")
+    return []
+
+def list_months(symbol: str, base_dir: Optional[str] = None) -> List[str]:
+    """YYYYMM of every month holding data for a symbol, in a partition or only in segments."""
+    base_dir = base_dir or STORE_DIR
+    return sorted(set(list_partitions(symbol, base_dir)) | set(list_segments(symbol, base_dir)))
+
+def time_range(symbol: str, base_dir: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """(first, last) stored trade time in epoch ms for a symbol, or None if nothing is stored."""
+    base_dir = base_dir or STORE_DIR
+    months = list_months(symbol, base_dir)
+    first = next((int(s[0]['time'][0]) for s in (read_month(symbol, m, base_dir=base_dir) for m in months) if s), None)
+    last = next((int(s[0]['time'][-1]) for s in (read_month(symbol, m, base_dir=base_dir) for m in reversed(months)) if s), None)
+    return (first, last) if first is not None else None
+
+def query(symbol: str, start: TimeLike = None, end: TimeLike = None, columns: Optional[List[str]] = None,
+          base_dir: Optional[str] = None, as_frame: bool = True) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+    """Trades of `symbol` with start <= time < end (either bound may be None), oldest first.
+
+    `columns` is any subset of STORE_COLUMNS (default: all); times are epoch ms.
+    Returns a DataFrame, or a dict of numpy arrays if `as_frame` is False.
+    """
+    base_dir = base_dir or STORE_DIR
+    columns = list(columns or STORE_COLUMNS)
+    unknown = set(columns) - set(STORE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown store columns: {sorted(unknown)}")
+    start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+    first_month = month_of(start_ms) if start_ms is not None else None
+    last_month = month_of(end_ms - 1) if end_ms is not None else None
+    fields = {"price", "quantity"} if "quote_qty" in columns else set()
+    fields.update(col for col in columns if col != "quote_qty")
+    parts = {field: [] for field in fields}
+    for month in list_months(symbol, base_dir):
+        if (first_month and month < first_month) or (last_month and month > last_month):
+            continue
+        try:
+            for records in read_month(symbol, month, start_ms, end_ms, base_dir):
+                for field in fields:
+                    parts[field].append(np.array(records[field]))
+        except OSError as e:
+            logger.error(f"Error reading store partition {symbol} {month}: {e}")
+    result = {}
+    for col in columns:
+        if col == "quote_qty":
+            continue
+        result[col] = np.concatenate(parts[col]) if parts[col] else np.empty(0, dtype=TRADE_DTYPE[col])
+    if "quote_qty" in columns:
+        price = np.concatenate(parts["price"]) if parts["price"] else np.empty(0)
+        quantity = np.concatenate(parts["quantity"]) if parts["quantity"] else np.empty(0)
+        result["quote_qty"] = price * quantity
+    result = {col: result[col] for col in columns}
+    return pd.DataFrame(result, copy=False) if as_frame else result
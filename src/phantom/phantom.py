@@ -6,8 +6,19 @@ from datetime import datetime
 import os
 import requests
 import json
+import sys
 from dotenv import load_dotenv
 
+try:
+    from src.scale.tape import BAR_DTYPE, list_bars, list_tapes, open_bars, open_tape, symbol_dir
+    from src.scale.ring import SharedRing, ring_name
+    from src.grim import rollups
+except ImportError:  # Run directly as a script: make the project root importable
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+    from src.scale.tape import BAR_DTYPE, list_bars, list_tapes, open_bars, open_tape, symbol_dir
+    from src.scale.ring import SharedRing, ring_name
+    from src.grim import rollups
+
 # Load environment variables
 load_dotenv()
 
@@ -16,6 +27,10 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 
 # Configuration
 DATA_PATH = os.path.join(PROJECT_ROOT, 'data', 'grim', 'historical_data.csv')  # Historical data from G.R.I.M.
+SCALE_DATA_PATH = os.path.join(PROJECT_ROOT, 'data', 'scale')  # Binary trade tapes from S.C.A.L.E. (fallback)
+SYMBOL = "BTCUSDT"  # Symbol whose S.C.A.L.E. tapes are used
+BAR_INTERVAL = "1m"  # S.C.A.L.E. live bar and G.R.I.M. candle interval, preferred over raw trades
+HISTORY_DAYS = 30  # Days of G.R.I.M. candles read, ending at its latest bar
 NEWS_LOGS_PATH = os.path.join(PROJECT_ROOT, 'data', 'news_logs')  # News logs from F.L.A.R.E.
 MODELS_PATH = os.path.join(PROJECT_ROOT, 'models')  # Directory for pre-trained models
 OUTPUT_PATH = os.path.join(PROJECT_ROOT, 'data', 'trades')  # Directory for predictions
@@ -35,13 +50,72 @@ def get_news_log_path(date_str):
     day = date_str[6:]
     return os.path.join(NEWS_LOGS_PATH, year, month, day, 'CSV', f'{date_str}.csv')
 
+def load_store_prices():
+    """Load timestamp/close/volume for the last HISTORY_DAYS of the candles G.R.I.M. rolls up from its store."""
+    latest = rollups.latest_time(SYMBOL, BAR_INTERVAL)
+    if latest is None:
+        return None
+    bars = rollups.candles(SYMBOL, BAR_INTERVAL, latest - HISTORY_DAYS * 86400000, latest + 1, ['open_time', 'close', 'volume'],
+                           as_frame=False)
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(bars['open_time'], unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'close': bars['close'],
+        'volume': bars['volume']
+    })
+
+def load_tape_prices():
+    """Load timestamp/close/volume from memory-mapped S.C.A.L.E. bars, or its raw trade tapes if no bars exist."""
+    bar_files = list_bars(symbol_dir(SCALE_DATA_PATH, SYMBOL), BAR_INTERVAL)
+    if bar_files:
+        bars = np.concatenate([open_bars(path) for path in bar_files.values()])
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(bars['open_time'], unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'close': bars['close'],
+            'volume': bars['volume']
+        })
+    tapes = list_tapes(symbol_dir(SCALE_DATA_PATH, SYMBOL))
+    if not tapes:
+        return None
+    trades = np.concatenate([open_tape(path) for path in tapes.values()])
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(trades['time'], unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'close': trades['price'],
+        'volume': trades['quantity']
+    })
+
+def load_live_bars(after=None):
+    """Closed bars opened after `after` (epoch ms) from S.C.A.L.E.'s shared-memory ring, or None if it is not running."""
+    ring = SharedRing.attach(ring_name(SYMBOL, f"bars_{BAR_INTERVAL}"), BAR_DTYPE)
+    if ring is None:
+        return None
+    try:
+        bars = ring.latest()
+    finally:
+        ring.close()
+    if after is not None:
+        bars = bars[bars['open_time'] > after]
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(bars['open_time'], unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'close': bars['close'],
+        'volume': bars['volume']
+    })
+
 def load_data():
     """Load and combine price and sentiment data."""
-    # Load historical price data from G.R.I.M.
-    if not os.path.exists(DATA_PATH):
-        raise FileNotFoundError(f"Historical data not found at {DATA_PATH}")
-    price_data = pd.read_csv(DATA_PATH)
+    # Load historical price data from G.R.I.M.'s candles (or legacy CSV), falling back to S.C.A.L.E.'s live tapes
+    price_data = load_store_prices()
+    if price_data is None and os.path.exists(DATA_PATH):
+        price_data = pd.read_csv(DATA_PATH)
+    elif price_data is None:
+        price_data = load_tape_prices()
+        if price_data is None:
+            raise FileNotFoundError(f"Historical data not found in {rollups.CANDLE_DIR}, at {DATA_PATH} or in {SCALE_DATA_PATH}")
     price_data = price_data[['timestamp', 'close', 'volume']].sort_values('timestamp')
+    # Top up with bars S.C.A.L.E. closed after the last minute the files hold
+    last = pd.to_datetime(price_data['timestamp'].iloc[-1], utc=True) if len(price_data) else None
+    live_bars = load_live_bars(int(last.timestamp() * 1000) if last is not None else None)
+    if live_bars is not None and len(live_bars):
+        price_data = pd.concat([price_data, live_bars], ignore_index=True)
     
     # Get current date's news log path
     current_date_str = get_current_date_str()
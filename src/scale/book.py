@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional
+import numpy as np
+from sortedcontainers import SortedDict
+
+# Local L2 order book maintained from a Binance depth snapshot plus diff updates.
+# Price levels live in SortedDicts keyed by float price, so every level change is
+# O(log n) and the best N levels are read straight off either end.
+
+class OrderBook:
+    """Price -> quantity levels for one symbol, kept in sync by update ID."""
+
+    def __init__(self):
+        self.bids = SortedDict()  # Ascending; best bid is the last key
+        self.asks = SortedDict()  # Ascending; best ask is the first key
+        self.update_id = None  # Last applied update ID; None until a snapshot is loaded
+        self.event_time = 0  # Exchange time (ms) of the last applied diff
+
+    def load_snapshot(self, snapshot: Dict) -> None:
+        """Replace the book with a REST /api/v3/depth snapshot."""
+        self.bids = SortedDict((float(price), float(qty)) for price, qty in snapshot["bids"] if float(qty))
+        self.asks = SortedDict((float(price), float(qty)) for price, qty in snapshot["asks"] if float(qty))
+        self.update_id = int(snapshot["lastUpdateId"])
+
+    @staticmethod
+    def _apply_levels(side: SortedDict, levels: List) -> None:
+        for price, qty in levels:
+            price, qty = float(price), float(qty)
+            if qty:
+                side[price] = qty
+            else:
+                side.pop(price, None)  # Zero quantity removes the level (it may already be outside our snapshot)
+
+    def apply_diff(self, event: Dict) -> Optional[bool]:
+        """Apply a depthUpdate event.
+
+        Returns True if applied, None if it is already covered by the book
+        (u <= update_id), and False on a sequence gap, in which case the
+        book must be re-synced from a new snapshot.
+        """
+        first_id, last_id = int(event["U"]), int(event["u"])
+        if last_id <= self.update_id:
+            return None
+        if first_id > self.update_id + 1:
+            return False
+        self._apply_levels(self.bids, event["b"])
+        self._apply_levels(self.asks, event["a"])
+        self.update_id = last_id
+        self.event_time = int(event.get("E", 0))
+        return True
+
+    def best_bid(self) -> Optional[float]:
+        return self.bids.peekitem(-1)[0] if self.bids else None
+
+    def best_ask(self) -> Optional[float]:
+        return self.asks.peekitem(0)[0] if self.asks else None
+
+    def top(self, levels: int) -> Dict[str, np.ndarray]:
+        """Best `levels` bid and ask prices/quantities, best first, NaN/0 padded."""
+        bid_price = np.full(levels, np.nan)
+        ask_price = np.full(levels, np.nan)
+        bid_qty = np.zeros(levels)
+        ask_qty = np.zeros(levels)
+        for i, price in enumerate(self.bids.islice(-min(levels, len(self.bids)), None, reverse=True) if self.bids else []):
+            bid_price[i], bid_qty[i] = price, self.bids[price]
+        for i, price in enumerate(self.asks.islice(0, levels)):
+            ask_price[i], ask_qty[i] = price, self.asks[price]
+        return {"bid_price": bid_price, "bid_qty": bid_qty, "ask_price": ask_price, "ask_qty": ask_qty}
+
+    def sample(self, levels: int, dtype: np.dtype, now_ms: int) -> np.ndarray:
+        """One `dtype` record (see tape.book_dtype) with the top levels, mid, spread and imbalance."""
+        top = self.top(levels)
+        bid, ask = top["bid_price"][0], top["ask_price"][0]
+        bid_total, ask_total = top["bid_qty"].sum(), top["ask_qty"].sum()
+        record = np.zeros(1, dtype=dtype)
+        record['time'] = now_ms
+        record['event_time'] = self.event_time
+        record['update_id'] = self.update_id
+        for field, values in top.items():
+            record[field] = values
+        record['mid'] = (bid + ask) / 2
+        record['spread'] = ask - bid
+        record['imbalance'] = (bid_total - ask_total) / (bid_total + ask_total) if bid_total + ask_total else 0.0
+        return record
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Per-trade latency histograms for the S.C.A.L.E. capture path, exported as
+# Prometheus text both to a periodically rewritten file and (optionally) over HTTP.
+# Buckets are log-spaced, BUCKETS_PER_OCTAVE per doubling from 1 us to ~2 min, so a
+# sample is an O(1) bisect and quantiles are within ~9% of the true value.
+BUCKETS_PER_OCTAVE = 8
+BUCKET_BOUNDS = [2 ** (k / BUCKETS_PER_OCTAVE) * 1e-6 for k in range(27 * BUCKETS_PER_OCTAVE + 1)]  # Upper bounds, seconds
+QUANTILES = [0.5, 0.9, 0.99]
+METRIC_PREFIX = "scale_latency"
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with cumulative totals and a resettable reporting window."""
+
+    def __init__(self):
+        self.counts = np.zeros(len(BUCKET_BOUNDS) + 1, dtype=np.int64)  # Last bucket catches overflow
+        self.reported = self.counts.copy()  # Counts at the end of the previous reporting window
+        self.total = 0
+        self.sum = 0.0
+        self.window_max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Add one sample (negative values, e.g. from clock skew, count as zero)."""
+        seconds = max(seconds, 0.0)
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+        if seconds > self.window_max:
+            self.window_max = seconds
+
+    def record_many(self, seconds: np.ndarray) -> None:
+        """Add a batch of samples."""
+        if len(seconds) == 0:
+            return
+        seconds = np.maximum(seconds, 0.0)
+        self.counts += np.bincount(np.searchsorted(BUCKET_BOUNDS, seconds), minlength=len(self.counts))
+        self.total += len(seconds)
+        self.sum += float(seconds.sum())
+        self.window_max = max(self.window_max, float(seconds.max()))
+
+    def roll(self) -> Dict[str, float]:
+        """Close the reporting window: quantiles, max and count of the samples recorded since the last roll."""
+        window = self.counts - self.reported
+        count = int(window.sum())
+        summary = {"count": count, "max": self.window_max}
+        cumulative = np.cumsum(window)
+        for q in QUANTILES:
+            if count:
+                bucket = int(np.searchsorted(cumulative, q * count))
+                summary[q] = min(BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.window_max, self.window_max)
+            else:
+                summary[q] = 0.0
+        self.reported = self.counts.copy()
+        self.window_max = 0.0
+        return summary
+
+class LatencyMetrics:
+    """Named per-stage histograms plus their Prometheus-text export."""
+
+    def __init__(self, stages: List[str], labels: Optional[Dict[str, str]] = None):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.labels = labels or {}
+        self.text = ""  # Last rendered export, served as-is by the HTTP endpoint
+        self.server = None
+        self.path = None  # Metrics file rewritten every `interval` seconds by tick()
+        self.interval = 0
+        self.last_report = time.time()
+
+    def __getitem__(self, stage: str) -> LatencyHistogram:
+        return self.histograms[stage]
+
+    def render(self) -> str:
+        """Roll every histogram's window and render it as Prometheus text exposition."""
+        extra = "".join(f',{k}="{v}"' for k, v in self.labels.items())
+        lines = [
+            f"# HELP {METRIC_PREFIX}_seconds Per-trade capture latency by stage over the last reporting window",
+            f"# TYPE {METRIC_PREFIX}_seconds summary",
+        ]
+        max_lines = [
+            f"# HELP {METRIC_PREFIX}_max_seconds Largest per-trade latency by stage over the last reporting window",
+            f"# TYPE {METRIC_PREFIX}_max_seconds gauge",
+        ]
+        for stage, histogram in self.histograms.items():
+            summary = histogram.roll()
+            for q in QUANTILES:
+                lines.append(f'{METRIC_PREFIX}_seconds{{stage="{stage}"{extra},quantile="{q}"}} {summary[q]:.6f}')
+            lines.append(f'{METRIC_PREFIX}_seconds_sum{{stage="{stage}"{extra}}} {histogram.sum:.6f}')
+            lines.append(f'{METRIC_PREFIX}_seconds_count{{stage="{stage}"{extra}}} {histogram.total}')
+            max_lines.append(f'{METRIC_PREFIX}_max_seconds{{stage="{stage}"{extra}}} {summary["max"]:.6f}')
+            if summary["count"]:
+                logger.info(f"Latency {stage}: p50 {summary[0.5] * 1e3:.2f} ms, p90 {summary[0.9] * 1e3:.2f} ms, "
+                            f"p99 {summary[0.99] * 1e3:.2f} ms, max {summary['max'] * 1e3:.2f} ms over {summary['count']} trades")
+        self.text = "\n".join(lines + max_lines) + "\n"
+        return self.text
+
+    def tick(self, now: float) -> None:
+        """Roll the reporting window if `interval` has elapsed: rewrite the file, or just refresh the HTTP text."""
+        if not self.interval or now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        if self.path:
+            self.write(self.path)
+        else:
+            self.render()
+
+    def write(self, path: str) -> None:
+        """Render and atomically replace the metrics file (suitable for node_exporter's textfile collector)."""
+        text = self.render()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing metrics file {path}: {e}")
+
+    def serve(self, host: str, port: int) -> None:
+        """Serve the last rendered export at http://host:port/metrics from a daemon thread."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.text.encode()
+                self.send_response(200 if self.path.rstrip("/") in ("", "/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logger.error(f"Error starting metrics endpoint on {host}:{port}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Serving latency metrics at http://{host}:{port}/metrics")
+
+    def close(self) -> None:
+        """Stop the HTTP endpoint, if any."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
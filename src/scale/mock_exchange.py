@@ -0,0 +1,437 @@
+import argparse
+import base64
+import bisect
+import hashlib
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from typing import Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Configuration
+HOST = "127.0.0.1"
+PORT = 8765
+SYMBOL = "BTCUSDT"
+PING_INTERVAL = 20  # Seconds between server pings, as on the real stream
+WS_MAGIC = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"  # RFC 6455 handshake GUID
+REST_DEFAULT_LIMIT = 500  # Binance defaults for /api/v3/aggTrades
+REST_MAX_LIMIT = 1000
+REST_TRADE_KEYS = ["a", "p", "q", "f", "l", "T", "m", "M"]  # Stream fields that also appear in REST responses
+DEPTH_LEVELS = 200  # Price levels per side in the synthetic order book
+DEPTH_TICK = 0.01
+DEPTH_DEFAULT_LIMIT = 100  # Binance defaults for /api/v3/depth
+DEPTH_MAX_LIMIT = 5000
+REST_WEIGHTS = {"/api/v3/aggTrades": 2, "/api/v3/depth": 5, "/api/v3/ping": 1}  # Request weight per endpoint, as on Binance
+MAX_TIME_WINDOW_MS = 3600000  # Binance rejects aggTrades startTime/endTime windows of an hour or more
+
+def synthetic_trades(count: int, start_id: int = 1, start_time_ms: Optional[int] = None, start_price: float = 60000.0, symbol: str = SYMBOL) -> List[Dict]:
+    """Generate `count` aggTrade stream messages for one symbol with consecutive IDs and a random-walk price."""
+    trade_time = start_time_ms if start_time_ms is not None else int(time.time() * 1000)
+    price = start_price
+    trades = []
+    for agg_id in range(start_id, start_id + count):
+        price = max(price + random.uniform(-5, 5), 1.0)
+        trade_time += random.randint(0, 50)
+        trades.append({
+            "e": "aggTrade",
+            "E": trade_time,
+            "s": symbol,
+            "a": agg_id,
+            "p": f"{price:.2f}",
+            "q": f"{random.uniform(0.0001, 0.5):.5f}",
+            "f": agg_id * 2,
+            "l": agg_id * 2 + 1,
+            "T": trade_time,
+            "m": random.random() < 0.5,
+            "M": True
+        })
+    return trades
+
+def synthetic_market(symbols: List[str], count: int, start_time_ms: Optional[int] = None) -> List[Dict]:
+    """Interleave `count` synthetic trades per symbol in trade-time order, as a combined stream would deliver them."""
+    messages = []
+    for symbol in symbols:
+        messages.extend(synthetic_trades(count, start_time_ms=start_time_ms, symbol=symbol))
+    return sorted(messages, key=lambda m: m["T"])
+
+def synthetic_depth(count: int, symbol: str = SYMBOL, mid: float = 60000.0, start_update_id: int = 1000) -> tuple:
+    """Generate an order book snapshot and `count` depthUpdate diff events following it.
+
+    Levels sit on a fixed tick grid around `mid` (bids below, asks above); each
+    event changes a handful of levels, removing some with zero quantity.
+    """
+    bids = {round(mid - DEPTH_TICK * k, 2): round(random.uniform(0.01, 5), 5) for k in range(1, DEPTH_LEVELS + 1)}
+    asks = {round(mid + DEPTH_TICK * k, 2): round(random.uniform(0.01, 5), 5) for k in range(1, DEPTH_LEVELS + 1)}
+    snapshot = {
+        "lastUpdateId": start_update_id,
+        "bids": [[f"{p:.2f}", f"{q:.5f}"] for p, q in sorted(bids.items(), reverse=True)],
+        "asks": [[f"{p:.2f}", f"{q:.5f}"] for p, q in sorted(asks.items())]
+    }
+    events = []
+    update_id = start_update_id
+    event_time = int(time.time() * 1000)
+    for _ in range(count):
+        changes = {"b": [], "a": []}
+        for _ in range(random.randint(1, 10)):
+            side = random.choice("ba")
+            k = random.randint(1, DEPTH_LEVELS)
+            price = mid - DEPTH_TICK * k if side == "b" else mid + DEPTH_TICK * k
+            qty = 0.0 if random.random() < 0.2 else random.uniform(0.01, 5)
+            changes[side].append([f"{price:.2f}", f"{qty:.5f}"])
+        first_id = update_id + 1
+        update_id += random.randint(1, 5)  # One event can aggregate several updates
+        event_time += random.randint(0, 100)
+        events.append({"e": "depthUpdate", "E": event_time, "s": symbol, "U": first_id, "u": update_id, "b": changes["b"], "a": changes["a"]})
+    return snapshot, events
+
+def book_at(snapshot: Dict, events: List[Dict], applied: int) -> Dict:
+    """The snapshot with the first `applied` events folded in (the book a live exchange would report then)."""
+    bids = {p: q for p, q in snapshot["bids"]}
+    asks = {p: q for p, q in snapshot["asks"]}
+    for event in events[:applied]:
+        for side, levels in ((bids, event["b"]), (asks, event["a"])):
+            for price, qty in levels:
+                if float(qty):
+                    side[price] = qty
+                else:
+                    side.pop(price, None)
+    return {
+        "lastUpdateId": events[applied - 1]["u"] if applied else snapshot["lastUpdateId"],
+        "bids": sorted(([p, q] for p, q in bids.items()), key=lambda level: -float(level[0])),
+        "asks": sorted(([p, q] for p, q in asks.items()), key=lambda level: float(level[0]))
+    }
+
+def load_messages(path: str) -> List[Dict]:
+    """Load recorded stream messages (one JSON object per line, raw or combined-stream wrapped)."""
+    messages = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                message = json.loads(line)
+                messages.append(message.get("data", message))  # Accept combined-stream recordings too
+    logger.info(f"Loaded {len(messages)} recorded messages from {path}")
+    return messages
+
+def encode_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Encode a single unmasked server-to-client WebSocket frame."""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+def read_frame(sock: socket.socket) -> Optional[tuple]:
+    """Read one masked client-to-server frame, returning (opcode, payload) or None on EOF."""
+    def read_exact(n: int) -> Optional[bytes]:
+        buf = b""
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                return None
+            buf += chunk
+        return buf
+
+    head = read_exact(2)
+    if head is None:
+        return None
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", read_exact(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", read_exact(8))[0]
+    mask = read_exact(4) if masked else b"\x00\x00\x00\x00"
+    payload = read_exact(length) if length else b""
+    if mask is None or payload is None:
+        return None
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+    """Serves the aggTrade WebSocket stream and REST endpoints from the server's message list."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self.serve_stream()
+        elif path in REST_WEIGHTS and not self.use_weight(REST_WEIGHTS[path]):
+            return
+        elif path == "/api/v3/ping":
+            self.send_json({})
+        elif path == "/api/v3/aggTrades":
+            self.serve_agg_trades()
+        elif path == "/api/v3/depth":
+            self.serve_depth()
+        else:
+            self.send_json({"code": -1, "msg": f"Unknown endpoint {self.path}"}, status=404)
+
+    def use_weight(self, weight: int) -> bool:
+        """Count a REST request against the current minute's weight; answer 429 and return False over the limit."""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.weight_lock:
+            minute = int(time.time() // 60)
+            if self.server.weight_minute != minute:
+                self.server.weight_minute, self.server.used_weight = minute, 0
+            self.server.used_weight += weight
+            used = self.server.used_weight
+        if self.server.weight_limit and used > self.server.weight_limit:
+            retry_after = max(int(60 - time.time() % 60), 1)
+            self.send_json({"code": -1003, "msg": f"Too many requests; current limit is {self.server.weight_limit} request weight per 1 MINUTE."},
+                           status=429, headers={"Retry-After": str(retry_after)})
+            return False
+        return True
+
+    def send_json(self, body, status: int = 200, headers: Optional[Dict] = None) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-mbx-used-weight-1m", str(self.server.used_weight))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def serve_agg_trades(self) -> None:
+        """Answer /api/v3/aggTrades: `fromId` pages forward, `startTime`/`endTime` select a window of under an hour,
+        otherwise the most recent `limit` trades."""
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        symbol = query.get("symbol", "").upper()
+        if symbol not in self.server.tapes:
+            self.send_json({"code": -1121, "msg": "Invalid symbol."}, status=400)
+            return
+        try:
+            limit = min(int(query.get("limit", REST_DEFAULT_LIMIT)), REST_MAX_LIMIT)
+            from_id = int(query["fromId"]) if "fromId" in query else None
+            start_time = int(query["startTime"]) if "startTime" in query else None
+            end_time = int(query["endTime"]) if "endTime" in query else None
+        except ValueError as e:
+            self.send_json({"code": -1100, "msg": f"Illegal characters found in parameter: {e}"}, status=400)
+            return
+        if start_time is not None and end_time is not None and end_time - start_time >= MAX_TIME_WINDOW_MS:
+            self.send_json({"code": -1127, "msg": "More than 1 hours between startTime and endTime."}, status=400)
+            return
+        messages, trade_ids, trade_times = self.server.tapes[symbol]
+        stop = len(messages)
+        if from_id is not None:
+            start = bisect.bisect_left(trade_ids, from_id)
+        elif start_time is not None or end_time is not None:
+            start = bisect.bisect_left(trade_times, start_time) if start_time is not None else 0
+            if end_time is not None:
+                stop = bisect.bisect_right(trade_times, end_time)
+                start = start if start_time is not None else max(stop - limit, 0)
+        else:
+            start = max(len(trade_ids) - limit, 0)
+        trades = [{k: m[k] for k in REST_TRADE_KEYS if k in m} for m in messages[start:min(start + limit, stop)]]
+        self.send_json(trades)
+
+    def serve_depth(self) -> None:
+        """Answer /api/v3/depth with the book as of the last depth event streamed for the symbol."""
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        symbol = query.get("symbol", "").upper()
+        if symbol not in self.server.depth:
+            self.send_json({"code": -1121, "msg": "Invalid symbol."}, status=400)
+            return
+        try:
+            limit = min(int(query.get("limit", DEPTH_DEFAULT_LIMIT)), DEPTH_MAX_LIMIT)
+        except ValueError as e:
+            self.send_json({"code": -1100, "msg": f"Illegal characters found in parameter: {e}"}, status=400)
+            return
+        snapshot, events = self.server.depth[symbol]
+        book = book_at(snapshot, events, self.server.depth_sent.get(symbol, 0))
+        self.send_json({"lastUpdateId": book["lastUpdateId"], "bids": book["bids"][:limit], "asks": book["asks"][:limit]})
+
+    def stream_messages(self) -> List[tuple]:
+        """Frames for the requested stream as (payload, depth event index or None).
+
+        Accepts /ws/<stream> (raw) or /stream?streams=a@aggTrade/b@depth@100ms (combined);
+        aggTrade and depth streams are both supported.
+        """
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/stream":
+            streams = parse_qs(url.query).get("streams", [""])[-1].split("/")
+            combined = True
+        else:
+            streams = [url.path.rsplit("/", 1)[-1]]
+            combined = False
+        symbols = {stream.split("@")[0].upper() for stream in streams if stream.endswith("@aggTrade")}
+        depth_streams = {stream.split("@")[0].upper(): stream for stream in streams if "@depth" in stream}
+        frames = []
+        for message in self.server.messages:
+            if message.get("s") not in symbols:
+                continue
+            if combined:
+                message = {"stream": f"{message['s'].lower()}@aggTrade", "data": message}
+            frames.append((json.dumps(message).encode(), None))
+        for symbol, stream in depth_streams.items():
+            for index, event in enumerate(self.server.depth.get(symbol, (None, []))[1]):
+                if self.server.skip_every and (index + 1) % self.server.skip_every == 0:
+                    frames.append((None, (symbol, index)))  # Dropped on the wire, but it happened on the exchange
+                    continue
+                message = {"stream": stream, "data": event} if combined else event
+                frames.append((json.dumps(message).encode(), (symbol, index)))
+        return frames
+
+    def serve_stream(self) -> None:
+        """Complete the WebSocket handshake and replay messages at the configured rate."""
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_MAGIC).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        sock = self.connection
+        send_lock = threading.Lock()
+        closed = threading.Event()
+
+        def send(payload: bytes, opcode: int = 0x1) -> None:
+            with send_lock:
+                sock.sendall(encode_frame(payload, opcode))
+
+        def reader() -> None:
+            # Answer client pings and notice close frames / disconnects
+            try:
+                while not closed.is_set():
+                    frame = read_frame(sock)
+                    if frame is None or frame[0] == 0x8:
+                        break
+                    if frame[0] == 0x9:
+                        send(frame[1], 0xA)
+            except OSError:
+                pass
+            closed.set()
+
+        threading.Thread(target=reader, daemon=True).start()
+        server = self.server
+        frames = self.stream_messages()
+        logger.info(f"Stream client connected from {self.address_string()} for {self.path} ({len(frames)} messages)")
+        sent = 0
+        start = time.perf_counter()
+        last_ping = time.time()
+        try:
+            while not closed.is_set():
+                for frame, depth_index in frames:
+                    if closed.is_set() or (server.drop_after and sent >= server.drop_after):
+                        break
+                    if depth_index is not None:
+                        server.depth_sent[depth_index[0]] = depth_index[1] + 1  # Snapshots now include this event
+                        if frame is None:
+                            continue
+                    send(frame)
+                    sent += 1
+                    if server.rate > 0:
+                        # Pace against the start time so the average rate holds even if sleeps overshoot
+                        delay = start + sent / server.rate - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    if time.time() - last_ping >= PING_INTERVAL:
+                        send(b"heartbeat", 0x9)
+                        last_ping = time.time()
+                if not server.loop or not frames or (server.drop_after and sent >= server.drop_after):
+                    break
+            if server.drop_after and sent >= server.drop_after:
+                logger.info(f"Dropping stream client after {sent} messages")
+            else:
+                send(struct.pack("!H", 1000), 0x8)
+        except OSError as e:
+            logger.info(f"Stream client disconnected: {e}")
+        finally:
+            closed.set()
+            elapsed = time.perf_counter() - start
+            logger.info(f"Sent {sent} messages in {elapsed:.2f} seconds ({sent / max(elapsed, 1e-9):.0f} msg/sec)")
+            self.close_connection = True
+
+def make_server(messages: List[Dict], host: str = HOST, port: int = PORT, rate: float = 0,
+                loop: bool = False, drop_after: int = 0, depth: Optional[Dict[str, tuple]] = None,
+                skip_every: int = 0, weight_limit: int = 0, latency: float = 0) -> ThreadingHTTPServer:
+    """Build a mock exchange server; call serve_forever() (optionally in a thread) to run it.
+
+    `depth` maps symbol -> (snapshot, events) from synthetic_depth(); `skip_every`
+    silently drops every Nth depth event from the stream to exercise re-syncs.
+    REST responses report the minute's request weight in x-mbx-used-weight-1m; over
+    `weight_limit` (0 = unlimited) requests get 429s until the minute rolls over.
+    `latency` delays every REST response by that many seconds.
+    """
+    server = ThreadingHTTPServer((host, port), MockExchangeHandler)
+    server.daemon_threads = True
+    server.messages = messages
+    server.tapes = {}  # symbol -> (messages sorted by aggregate ID, their IDs, their times) for REST paging
+    for symbol in {m.get("s", SYMBOL) for m in messages}:
+        tape = sorted((m for m in messages if m.get("s", SYMBOL) == symbol), key=lambda m: m["a"])
+        server.tapes[symbol] = (tape, [m["a"] for m in tape], [m["T"] for m in tape])
+    server.rate = rate
+    server.loop = loop
+    server.drop_after = drop_after
+    server.depth = depth or {}
+    server.depth_sent = {}  # symbol -> depth events streamed so far, which /api/v3/depth snapshots reflect
+    server.skip_every = skip_every
+    server.weight_limit = weight_limit
+    server.latency = latency
+    server.weight_lock = threading.Lock()
+    server.weight_minute, server.used_weight = None, 0
+    return server
+
+def main() -> None:
+    """Run the mock exchange until Ctrl+C."""
+    parser = argparse.ArgumentParser(description="Local stand-in for the Binance aggTrade stream and REST API")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--replay', help="JSON-lines file of recorded aggTrade messages (default: synthetic trades)")
+    parser.add_argument('--symbols', default=SYMBOL, help="Comma-separated symbols for synthetic trades")
+    parser.add_argument('--count', type=int, default=100000, help="Number of synthetic trades per symbol when --replay is not given")
+    parser.add_argument('--start', help="UTC date or time (e.g. 2024-03-01) the synthetic trades start at, to serve history (default: now)")
+    parser.add_argument('--rate', type=float, default=0, help="Messages per second per client (0 = as fast as possible)")
+    parser.add_argument('--loop', action='store_true', help="Replay the messages forever")
+    parser.add_argument('--drop-after', type=int, default=0, help="Drop each client after this many messages to exercise reconnects")
+    parser.add_argument('--depth', type=int, default=0, help="Synthetic depthUpdate events per symbol for <symbol>@depth streams and /api/v3/depth")
+    parser.add_argument('--skip-every', type=int, default=0, help="Drop every Nth depth event from the stream to exercise order book re-syncs")
+    parser.add_argument('--weight-limit', type=int, default=0, help="REST request weight allowed per minute before 429s (0 = unlimited)")
+    parser.add_argument('--latency', type=float, default=0, help="Seconds to delay every REST response")
+    args = parser.parse_args()
+
+    symbols = [symbol.strip().upper() for symbol in args.symbols.split(",") if symbol.strip()]
+    start_time_ms = int(datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc).timestamp() * 1000) if args.start else None
+    messages = load_messages(args.replay) if args.replay else synthetic_market(symbols, args.count, start_time_ms)
+    depth = {symbol: synthetic_depth(args.depth, symbol) for symbol in symbols} if args.depth else None
+    server = make_server(messages, args.host, args.port, args.rate, args.loop, args.drop_after, depth, args.skip_every,
+                         args.weight_limit, args.latency)
+    logger.info(f"Mock exchange listening on ws://{args.host}:{args.port} (/ws/<symbol>@aggTrade or /stream?streams=...)")
+    logger.info(f"REST aggTrades available at http://{args.host}:{args.port}/api/v3/aggTrades")
+    if depth:
+        logger.info(f"Order book diffs on <symbol>@depth streams, snapshots at http://{args.host}:{args.port}/api/v3/depth")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping mock exchange via Ctrl+C")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+import numpy as np
+
+# Fixed-size shared-memory rings that S.C.A.L.E. publishes its latest trades and
+# closed bars into, so local consumers see them microseconds after they arrive.
+# One segment per symbol and stream:
+#     scale_<SYMBOL>_trades          TRADE_DTYPE records
+#     scale_<SYMBOL>_bars_<interval> BAR_DTYPE records
+# Layout: HEADER_SIZE-byte header, then 2 * capacity records. Every record is stored
+# twice (slot i and slot i + capacity) so the newest window of up to `capacity`
+# records is always one contiguous slice and can be viewed without copying.
+# Readers never block the writer: `written` is the sequence counter of committed
+# records, and the writer bumps `reserved` before touching any slot, so a reader
+# can tell after the fact whether the slots it looked at were being reused.
+HEADER_FORMAT = "<QQQQ"  # written, reserved, capacity, record itemsize
+WRITTEN_OFFSET = 0
+RESERVED_OFFSET = 8
+HEADER_SIZE = 64  # Header padded to a cache line
+RING_PREFIX = "scale"
+READ_RETRIES = 1000  # Attempts before a reader lapped on every try gives up
+_created = set()  # Segments created by this process, whose tracker registration must survive local readers
+
+def ring_name(symbol: str, stream: str) -> str:
+    """Shared-memory segment name for a symbol's stream ('trades' or 'bars_<interval>')."""
+    return f"{RING_PREFIX}_{symbol.upper()}_{stream}"
+
+def record_format(dtype: np.dtype) -> str:
+    """struct format packing one record of a flat numeric dtype (used for fast single-record publishes)."""
+    codes = {"i4": "i", "i8": "q", "u4": "I", "u8": "Q", "f4": "f", "f8": "d"}
+    fmt = "<" + "".join(codes.get(dtype.fields[name][0].str[1:], "?") for name in dtype.names)
+    if "?" in fmt or struct.calcsize(fmt) != dtype.itemsize:
+        raise ValueError(f"Record dtype {dtype} is not a packed numeric layout")
+    return fmt
+
+class SharedRing:
+    """Single-writer, many-reader ring of numpy records in POSIX shared memory."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, dtype: np.dtype, owner: bool):
+        self.shm = shm
+        self.buf = shm.buf
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        _, _, self.capacity, itemsize = struct.unpack_from(HEADER_FORMAT, self.buf, 0)
+        if itemsize != self.dtype.itemsize:
+            raise ValueError(f"Ring {shm.name} holds {itemsize}-byte records, expected {self.dtype.itemsize}")
+        self.record = struct.Struct(record_format(self.dtype))
+        self.records = np.ndarray((2 * self.capacity,), dtype=self.dtype, buffer=self.buf, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, name: str, dtype: np.dtype, capacity: int) -> "SharedRing":
+        """Create (or replace a stale) segment and become its writer."""
+        dtype = np.dtype(dtype)
+        size = HEADER_SIZE + 2 * capacity * dtype.itemsize
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that died without unlinking; readers still mapping it keep their copy
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        struct.pack_into(HEADER_FORMAT, shm.buf, 0, 0, 0, capacity, dtype.itemsize)
+        _created.add(name)
+        return cls(shm, dtype, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, dtype: np.dtype) -> Optional["SharedRing"]:
+        """Attach to a published ring as a reader; None if no writer has created it."""
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        # Python < 3.13 registers attached POSIX segments with the resource tracker, which would unlink the writer's ring
+        # on reader exit; it tracks them under the slash-prefixed name that SharedMemory.name strips
+        if name not in _created and os.name == "posix":
+            resource_tracker.unregister("/" + shm.name, "shared_memory")
+        try:
+            return cls(shm, dtype, owner=False)
+        except ValueError:
+            shm.close()
+            raise
+
+    def publish(self, record: Tuple) -> None:
+        """Append one record given as a tuple of field values."""
+        written = self.written()
+        offset = HEADER_SIZE + (written % self.capacity) * self.record.size
+        struct.pack_into("<Q", self.buf, RESERVED_OFFSET, written + 1)
+        self.record.pack_into(self.buf, offset, *record)
+        self.record.pack_into(self.buf, offset + self.capacity * self.record.size, *record)
+        struct.pack_into("<Q", self.buf, WRITTEN_OFFSET, written + 1)
+
+    def publish_many(self, records: np.ndarray) -> None:
+        """Append a batch of records (a numpy array of the ring's dtype)."""
+        records = records[-self.capacity:]
+        written = self.written()
+        struct.pack_into("<Q", self.buf, RESERVED_OFFSET, written + len(records))
+        slots = (written + np.arange(len(records))) % self.capacity
+        self.records[slots] = records
+        self.records[slots + self.capacity] = records
+        struct.pack_into("<Q", self.buf, WRITTEN_OFFSET, written + len(records))
+
+    def written(self) -> int:
+        """Total records published so far (the ring's sequence counter)."""
+        return struct.unpack_from("<Q", self.buf, WRITTEN_OFFSET)[0]
+
+    def window(self, count: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """Zero-copy view of the newest `count` records (default: all retained) and the sequence number it ends at.
+
+        The view aliases shared memory: it stays valid until the writer laps it,
+        which `still_valid(end, len(view))` checks after the caller is done reading.
+        """
+        written = self.written()
+        count = min(self.capacity if count is None else count, written, self.capacity)
+        end = written % self.capacity + self.capacity
+        return self.records[end - count:end], written
+
+    def still_valid(self, end: int, count: int) -> bool:
+        """Whether a window of `count` records ending at sequence `end` has not been (or started being) overwritten since."""
+        reserved = struct.unpack_from("<Q", self.buf, RESERVED_OFFSET)[0]
+        return reserved - end + count <= self.capacity
+
+    def latest(self, count: Optional[int] = None) -> np.ndarray:
+        """Consistent private copy of the newest `count` records."""
+        for _ in range(READ_RETRIES):
+            view, end = self.window(count)
+            snapshot = view.copy()
+            if self.still_valid(end, len(snapshot)):
+                return snapshot
+        raise TimeoutError(f"Ring {self.shm.name} was lapped on each of {READ_RETRIES} read attempts")
+
+    def wait(self, after: int, timeout: float = 1.0, poll: float = 0.0) -> bool:
+        """Spin (or sleep `poll` seconds between checks) until more than `after` records are published."""
+        deadline = time.perf_counter() + timeout
+        while self.written() <= after:
+            if time.perf_counter() >= deadline:
+                return False
+            if poll:
+                time.sleep(poll)
+        return True
+
+    def close(self) -> None:
+        """Detach; the writer also removes the segment. Views returned by window() must be dropped first."""
+        self.records = self.buf = None
+        self.shm.close()
+        if self.owner:
+            _created.discard(self.shm.name)
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
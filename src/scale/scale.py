@@ -1,11 +1,33 @@
 import os
+import sys
+import abc
+import argparse
 import requests
+import websocket
 import time
 import json
+import heapq
+from glob import glob
 import sqlite3
 from datetime import datetime, timezone
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict, List, Tuple
 import logging
+import numpy as np
+import pandas as pd
+from multiprocessing import Process, cpu_count
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from src.scale.tape import TRADE_DTYPE, BAR_DTYPE, TAPE_SUB_DIR, TAPE_EXTENSION, tape_path, bars_path, list_bars, list_tapes, open_tape, open_bars, book_dtype, book_path, repair_tape, symbol_dir
+    from src.scale.ring import SharedRing, ring_name
+    from src.scale.metrics import LatencyMetrics
+    from src.scale.book import OrderBook
+except ImportError:  # Run directly as a script: make the project root importable
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from src.scale.tape import TRADE_DTYPE, BAR_DTYPE, TAPE_SUB_DIR, TAPE_EXTENSION, tape_path, bars_path, list_bars, list_tapes, open_tape, open_bars, book_dtype, book_path, repair_tape, symbol_dir
+    from src.scale.ring import SharedRing, ring_name
+    from src.scale.metrics import LatencyMetrics
+    from src.scale.book import OrderBook
 
 # Configure logging
 log_file = "scale.log" if os.name == 'nt' else ("/var/log/scale.log" if os.getenv("ENV") == "production" else "scale.log")
@@ -20,39 +42,265 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Hardcoded configuration
-SYMBOL = "BTCUSDT"
+SYMBOLS = ["BTCUSDT"]  # Default symbol list; override with --symbols
 POLL_INTERVAL = 1  # Seconds
+POLL_THREADS = 8  # Concurrent REST requests per poll cycle
 MAX_API_RETRIES = 3  # Maximum retries for API requests
 RETRY_DELAY = 2  # Seconds
 BASE_URL = "https://api.binance.com/api/v3/aggTrades"  # Binance aggregated trades endpoint
+STREAM_BASE_URL = "wss://stream.binance.com:9443"  # Binance WebSocket host; symbols are multiplexed on /stream?streams=
+STREAM_MAX_STREAMS = 1024  # Binance limit on streams per combined connection
+STREAM_RECV_TIMEOUT = 10  # Seconds without a frame before sending our own ping
+STREAM_STALE_TIMEOUT = 30  # Seconds without any frame (data or pong) before reconnecting
+STREAM_MAX_BACKOFF = 60  # Upper bound for the reconnect delay in seconds
+CATCHUP_BATCH_SIZE = 1000  # Trades per fromId page (Binance maximum)
+RATE_LIMIT_WAIT = 60  # Seconds to back off on HTTP 429 when no Retry-After header is sent
+FLUSH_MAX_TRADES = 5000  # Buffered trades that force a group commit
+FLUSH_INTERVAL = 1  # Seconds a trade may wait in the buffer before a group commit
+DEFAULT_SINKS = ["bin"]  # Compact binary tape only; add "csv", "sqlite" and/or "txt" for the legacy formats
+BAR_INTERVALS = {"1s": 1000, "1m": 60000, "5m": 300000, "15m": 900000, "1h": 3600000, "4h": 14400000, "1d": 86400000}  # Milliseconds
+DEFAULT_BARS = ["1s", "1m", "5m", "1h"]
+BAR_CLOSE_GRACE = 1  # Seconds a symbol must be quiet, and past its bucket's end, before its bar is closed by the clock
+RING_TRADES = 65536  # Recent trades per symbol published to shared memory (0 disables the rings)
+RING_BARS = 4096  # Recent closed bars per symbol and interval in shared memory
+BOOK_STREAM = "depth@100ms"  # Binance diff depth stream (100 ms updates)
+BOOK_LEVELS = 10  # Levels per side in each order book sample
+BOOK_INTERVAL = 1  # Seconds between order book samples
+BOOK_SNAPSHOT_LIMIT = 1000  # Levels per side in REST depth snapshots
+BOOK_RESYNC_DELAY = 1  # Minimum seconds between snapshot requests while a book is out of sync
+BOOK_BUFFER_MAX = 10000  # Diffs buffered while waiting for a usable snapshot
+LATENCY_STAGES = ["event_to_receive", "receive_to_parse", "parse_to_visible", "parse_to_persisted"]
+METRICS_INTERVAL = 10  # Seconds between latency reports (metrics file rewrite and log line)
+METRICS_HOST = "127.0.0.1"
+TICK_INTERVAL = 0.25  # Seconds between housekeeping passes (time-based flushes and bar closes)
+SYMBOLS_PER_WORKER = 25  # Symbols per process when --workers 0 (auto) shards the symbol list
 OUTPUT_BASE_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")), "data", "scale")
+CURSOR_FILE_NAME = "cursor.json"  # Last aggregate tradeId written, kept in each symbol's directory
+LEGACY_CURSOR_FILE = os.path.join(OUTPUT_BASE_DIR, CURSOR_FILE_NAME)  # Pre multi-symbol cursor map
+REPLAY_OUTPUT_DIR = os.path.join(os.path.dirname(OUTPUT_BASE_DIR), "replay")  # Default --output-dir in replay mode, keeps the live tape clean
+ZIP_DATA_DIR = os.path.join(os.path.dirname(OUTPUT_BASE_DIR), "zip")  # Binance aggTrades CSVs from src/grim/download_binance_data.py
+AGG_TRADE_COLUMNS = ["agg_trade_id", "price", "quantity", "first_trade_id", "last_trade_id", "transact_time", "is_buyer_maker", "is_best_match"]
+REPLAY_CHUNK_SIZE = 1000000  # CSV rows parsed per chunk during replay
+REPLAY_LOG_INTERVAL = 10  # Seconds between replay progress lines
+METRICS_SUB_DIR = "metrics"  # Prometheus-text latency files, one per capture worker
 TIMEZONE = timezone.utc # Use UTC for timestamps
 
-def get_month_dir(timestamp: datetime) -> str:
-    """Get YYYYMM directory based on data's timestamp."""
-    return os.path.join(OUTPUT_BASE_DIR, timestamp.strftime("%Y%m"))
-
-def setup_directories(timestamp: datetime) -> None:
-    """Create output directories based on data's timestamp."""
-    month_dir = get_month_dir(timestamp)
-    csv_dir = os.path.join(month_dir, "csv")
-    sqlite_dir = os.path.join(month_dir, "sqlite")
-    txt_dir = os.path.join(month_dir, "txt")
-    for dir_path in [csv_dir, sqlite_dir, txt_dir]:
+METRICS = LatencyMetrics(LATENCY_STAGES)  # Per-process; live trades only, catch-up backlog would swamp the percentiles
+
+_timestamp_cache = (None, None)  # (epoch second, formatted timestamp); swapped as one tuple so poll threads never see a torn pair
+
+def parse_trade(trade: Dict, symbol: str) -> Dict:
+    """Convert a raw Binance aggTrade payload (REST or WebSocket) into S.C.A.L.E.'s trade record."""
+    global _timestamp_cache
+    second = int(trade["T"]) // 1000
+    cached_second, timestamp = _timestamp_cache
+    if second != cached_second:
+        # Trades arrive in bursts within the same second; formatting once per second keeps strftime off the hot path
+        timestamp = datetime.fromtimestamp(second, tz=TIMEZONE).strftime("%Y-%m-%dT%H:%M:%SZ")
+        _timestamp_cache = (second, timestamp)
+    price = float(trade["p"])
+    quantity = float(trade["q"])
+    return {
+        "ticker": f"BINANCE:{symbol}",
+        "time": int(trade["T"]),
+        "timestamp": timestamp,
+        "price": price,
+        "quantity": quantity,
+        "quoteQty": price * quantity,
+        "tradeId": int(trade["a"])
+    }
+
+def fetch_price(session: requests.Session, symbol: str, base_url: str = BASE_URL) -> Optional[Tuple[Dict, float]]:
+    """Fetch the latest aggregated trade from Binance API, with the perf_counter time it was parsed."""
+    params = {"symbol": symbol, "limit": 1}
+    for attempt in range(1, MAX_API_RETRIES + 1):
+        try:
+            response = session.get(base_url, params=params, headers={'Cache-Control': 'no-cache'}, timeout=10)
+            received, received_at = time.time(), time.perf_counter()
+            response.raise_for_status()
+            data = response.json()
+            if isinstance(data, dict) and "code" in data:
+                logger.warning(f"API error on attempt {attempt}: {data.get('msg', 'Unknown error')}")
+                if attempt == MAX_API_RETRIES:
+                    return None
+                time.sleep(RETRY_DELAY)
+                continue
+            trade = parse_trade(data[0], symbol)
+            parsed_at = time.perf_counter()
+            METRICS["event_to_receive"].record(received - trade['time'] / 1000)
+            METRICS["receive_to_parse"].record(parsed_at - received_at)
+            logger.info(f"Fetched {symbol} trade: price={trade['price']}, quantity={trade['quantity']}, tradeId={trade['tradeId']} at {trade['timestamp']}")
+            return trade, parsed_at
+        except (requests.RequestException, IndexError, KeyError) as e:
+            logger.warning(f"Error fetching {symbol} trade on attempt {attempt}: {e}")
+            if attempt == MAX_API_RETRIES:
+                return None
+            time.sleep(RETRY_DELAY)
+    return None
+
+def fetch_trades_from(session: requests.Session, symbol: str, from_id: int, base_url: str = BASE_URL) -> Optional[list]:
+    """Fetch up to CATCHUP_BATCH_SIZE raw aggregated trades starting at `from_id`."""
+    params = {"symbol": symbol, "fromId": from_id, "limit": CATCHUP_BATCH_SIZE}
+    for attempt in range(1, MAX_API_RETRIES + 1):
+        try:
+            response = session.get(base_url, params=params, headers={'Cache-Control': 'no-cache'}, timeout=10)
+            if response.status_code == 429:
+                wait_time = int(response.headers.get("Retry-After", RATE_LIMIT_WAIT))
+                logger.warning(f"Rate limit hit during catch-up on attempt {attempt}. Waiting {wait_time} seconds.")
+                time.sleep(wait_time)
+                continue
+            response.raise_for_status()
+            data = response.json()
+            if isinstance(data, dict) and "code" in data:
+                logger.warning(f"API error on attempt {attempt}: {data.get('msg', 'Unknown error')}")
+                if attempt == MAX_API_RETRIES:
+                    return None
+                time.sleep(RETRY_DELAY)
+                continue
+            return data
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Error fetching {symbol} trades from {from_id} on attempt {attempt}: {e}")
+            if attempt == MAX_API_RETRIES:
+                return None
+            time.sleep(RETRY_DELAY)
+    return None
+
+def cursor_file(symbol: str, output_dir: Optional[str] = None) -> str:
+    """Cursor file for a symbol under `output_dir` (default OUTPUT_BASE_DIR); each symbol has a single writer, so workers never share one."""
+    return os.path.join(symbol_dir(output_dir or OUTPUT_BASE_DIR, symbol), CURSOR_FILE_NAME)
+
+def load_cursor(symbol: str, output_dir: Optional[str] = None) -> Optional[int]:
+    """Load the last aggregate tradeId written for a symbol under `output_dir`, if any."""
+    legacy_file = os.path.join(output_dir, CURSOR_FILE_NAME) if output_dir else LEGACY_CURSOR_FILE
+    for path in (cursor_file(symbol, output_dir), legacy_file):
         try:
-            os.makedirs(dir_path, exist_ok=True)
-            logger.info(f"Directory created/verified: {dir_path}")
-        except Exception as e:
-            logger.error(f"Error creating directory {dir_path}: {e}")
-
-def setup_sqlite(timestamp: datetime, date_str: str) -> Optional[str]:
-    """Initialize SQLite database and trades table."""
-    month_dir = get_month_dir(timestamp)
-    sqlite_file = os.path.join(month_dir, "sqlite", f"{date_str}.db")
+            with open(path, 'r', encoding='utf-8') as f:
+                cursor = json.load(f).get(symbol)
+            if cursor is not None:
+                return int(cursor)
+        except FileNotFoundError:
+            continue
+        except (ValueError, TypeError, AttributeError, OSError) as e:
+            logger.error(f"Error reading cursor file {path}: {e}")
+    return None
+
+def save_cursor(symbol: str, trade_id: int, output_dir: Optional[str] = None) -> None:
+    """Atomically persist the last aggregate tradeId written for a symbol under `output_dir`."""
+    path = cursor_file(symbol, output_dir)
     try:
-        conn = sqlite3.connect(sqlite_file)
-        cursor = conn.cursor()
-        cursor.execute("""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({symbol: trade_id}, f)
+        os.replace(tmp_file, path)
+    except OSError as e:
+        logger.error(f"Error writing cursor file {path}: {e}")
+
+class TradeSink(abc.ABC):
+    """One on-disk representation of a symbol's trade tape, stored as one file per UTC day under <base_dir>/YYYYMM/<sub_dir>/.
+
+    Subclasses implement write(); open() and close() manage `path` and are extended by sinks that hold a handle.
+    """
+    name = ""
+    sub_dir = ""
+    extension = ""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.path = None
+
+    def day_path(self, date_str: str) -> str:
+        """Output file for a YYYYMMDD date."""
+        return os.path.join(self.base_dir, date_str[:6], self.sub_dir, f"{date_str}.{self.extension}")
+
+    def open(self, date_str: str) -> None:
+        self.path = self.day_path(date_str)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    @abc.abstractmethod
+    def write(self, batch: list) -> None:
+        """Persist a batch of parsed trades to the open day's file, raising OSError/sqlite3.Error on failure."""
+
+    def close(self) -> None:
+        self.path = None
+
+class BinarySink(TradeSink):
+    """Compact fixed-width records (see tape.TRADE_DTYPE) that readers can memory-map directly."""
+    name = "bin"
+    sub_dir = TAPE_SUB_DIR
+    extension = TAPE_EXTENSION.lstrip(".")
+
+    def __init__(self, base_dir: str):
+        super().__init__(base_dir)
+        self.handle = None
+
+    def day_path(self, date_str: str) -> str:
+        return tape_path(self.base_dir, date_str)
+
+    def open(self, date_str: str) -> None:
+        super().open(date_str)
+        repair_tape(self.path)  # Drop a torn record from a previous crash so appends stay aligned
+        self.handle = open(self.path, 'ab')
+
+    def write(self, batch: list) -> None:
+        records = np.empty(len(batch), dtype=TRADE_DTYPE)
+        records['time'] = [d['time'] for d in batch]
+        records['trade_id'] = [d['tradeId'] for d in batch]
+        records['price'] = [d['price'] for d in batch]
+        records['quantity'] = [d['quantity'] for d in batch]
+        self.handle.write(records.tobytes())
+        self.handle.flush()
+
+    def close(self) -> None:
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        super().close()
+
+class CsvSink(TradeSink):
+    """Human-readable CSV with the original S.C.A.L.E. columns."""
+    name = "csv"
+    sub_dir = "csv"
+    extension = "csv"
+
+    def __init__(self, base_dir: str):
+        super().__init__(base_dir)
+        self.handle = None
+
+    def open(self, date_str: str) -> None:
+        super().open(date_str)
+        self.handle = open(self.path, 'a', encoding='utf-8')
+        if self.handle.tell() == 0:
+            self.handle.write("timestamp,price,quantity,quoteQty,tradeId\n")
+
+    def write(self, batch: list) -> None:
+        self.handle.write("".join(
+            f"{d['timestamp']},{d['price']},{d['quantity']},{d['quoteQty']},{d['tradeId']}\n" for d in batch
+        ))
+        self.handle.flush()
+
+    def close(self) -> None:
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        super().close()
+
+class SqliteSink(TradeSink):
+    """Daily SQLite database with a `trades` table; one transaction per batch."""
+    name = "sqlite"
+    sub_dir = "sqlite"
+    extension = "db"
+
+    def __init__(self, base_dir: str):
+        super().__init__(base_dir)
+        self.conn = None
+
+    def open(self, date_str: str) -> None:
+        super().open(date_str)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")  # WAL only syncs at checkpoints
+        self.conn.execute("""
             CREATE TABLE IF NOT EXISTS trades (
                 timestamp TEXT,
                 price REAL,
@@ -61,131 +309,899 @@ def setup_sqlite(timestamp: datetime, date_str: str) -> Optional[str]:
                 tradeId INTEGER
             )
         """)
-        conn.commit()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='trades'")
-        if cursor.fetchone():
-            logger.info(f"SQLite table 'trades' confirmed in: {sqlite_file}")
-        else:
-            logger.error(f"Failed to create 'trades' table in {sqlite_file}")
+        self.conn.commit()
+
+    def write(self, batch: list) -> None:
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO trades (timestamp, price, quantity, quoteQty, tradeId)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(d['timestamp'], d['price'], d['quantity'], d['quoteQty'], d['tradeId']) for d in batch])
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        super().close()
+
+class TxtSink(TradeSink):
+    """JSON-lines dump of the full trade records."""
+    name = "txt"
+    sub_dir = "txt"
+    extension = "txt"
+
+    def __init__(self, base_dir: str):
+        super().__init__(base_dir)
+        self.handle = None
+
+    def open(self, date_str: str) -> None:
+        super().open(date_str)
+        self.handle = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, batch: list) -> None:
+        self.handle.write("".join(json.dumps(d) + "\n" for d in batch))
+        self.handle.flush()
+
+    def close(self) -> None:
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        super().close()
+
+SINKS = {sink.name: sink for sink in (BinarySink, CsvSink, SqliteSink, TxtSink)}
+
+class TradeWriter:
+    """Long-lived writer that group-commits one symbol's trades into the enabled sinks.
+
+    Sink handles stay open for the current UTC day and are rolled over when a trade
+    for another day arrives. Trades are buffered and written in one batch per sink
+    (one SQLite transaction) once FLUSH_MAX_TRADES are pending or FLUSH_INTERVAL
+    seconds have passed.
+    """
+
+    def __init__(self, symbol: str, sink_names: Optional[List[str]] = None, max_trades: int = FLUSH_MAX_TRADES, max_delay: float = FLUSH_INTERVAL,
+                 output_dir: Optional[str] = None):
+        self.symbol = symbol
+        base_dir = symbol_dir(output_dir or OUTPUT_BASE_DIR, symbol)
+        self.sinks = [SINKS[name](base_dir) for name in (sink_names or DEFAULT_SINKS)]
+        self.max_trades = max_trades
+        self.max_delay = max_delay
+        self.buffer = []
+        self.parsed_at = []  # perf_counter parse time per buffered trade (NaN for catch-up trades), for latency metrics
+        self.date_str = None
+        self.last_flush = time.time()
+        self.last_trade_id = None  # Last tradeId every sink has handed to the OS/SQLite
+        self.unsaved = {}  # Sink name -> trades of the current day that sink failed to write, retried by the next flush()
+        self.flushed_id = None  # Last tradeId taken from the buffer by flush()
+
+    def open_day(self, date_str: str) -> bool:
+        """Close the current day and open every sink's output for `date_str`."""
+        self.close_day()
+        try:
+            for sink in self.sinks:
+                sink.open(date_str)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error opening {self.symbol} outputs for {date_str}: {e}")
+            self.close_day()
+            return False
+        self.date_str = date_str
+        logger.info(f"Writing {self.symbol} {date_str} to {', '.join(sink.path for sink in self.sinks)}")
+        return True
+
+    def write(self, data: Dict, parsed_at: float = float('nan')) -> bool:
+        """Buffer a trade, rolling over to a new day first if needed. Returns False if the day's outputs cannot be opened."""
+        date_str = data['timestamp'][:10].replace("-", "")
+        if date_str != self.date_str:
+            self.flush()
+            if self.unsaved:
+                logger.error(f"Cannot roll {self.symbol} over to {date_str}: {', '.join(self.unsaved)} sink(s) still hold unsaved trades of {self.date_str}")
+                return False
+            if not self.open_day(date_str):
+                return False
+        self.buffer.append(data)
+        self.parsed_at.append(parsed_at)
+        return True
+
+    def flush_due(self) -> bool:
+        """Whether the buffer has hit the size or age threshold (unsaved trades are retried at the age threshold)."""
+        return len(self.buffer) >= self.max_trades or (bool(self.buffer or self.unsaved) and time.time() - self.last_flush >= self.max_delay)
+
+    def flush(self) -> np.ndarray:
+        """Write all buffered trades to each sink in a single batch; returns each live trade's parse-to-persisted latency.
+
+        A sink that fails keeps its trades and gets them again on the next flush; last_trade_id only
+        advances once every sink has written everything up to it.
+        """
+        self.last_flush = time.time()
+        if not self.buffer and not self.unsaved:
+            return np.empty(0)
+        batch, self.buffer = self.buffer, []
+        parsed_at, self.parsed_at = np.array(self.parsed_at), []
+        if batch:
+            self.flushed_id = batch[-1]['tradeId']
+        for sink in self.sinks:
+            pending = self.unsaved.pop(sink.name, []) + batch
+            if not pending:
+                continue
+            try:
+                sink.write(pending)
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"Error writing {len(pending)} trades to {sink.name} sink {sink.path}, keeping them for the next flush: {e}")
+                self.unsaved[sink.name] = pending
+        if self.unsaved:
+            return np.empty(0)
+        self.last_trade_id = self.flushed_id
+        latencies = time.perf_counter() - parsed_at
+        return latencies[~np.isnan(latencies)]
+
+    def close_day(self) -> None:
+        """Close the current day's sinks (buffer must already be flushed)."""
+        for name, trades in self.unsaved.items():
+            logger.error(f"Dropping {len(trades)} {self.symbol} trades the {name} sink could not write for {self.date_str}")
+        self.unsaved = {}
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"Error closing {sink.name} sink for {self.date_str}: {e}")
+        self.date_str = None
+
+    def close(self) -> None:
+        """Flush pending trades and release all handles."""
+        self.flush()
+        self.close_day()
+
+class DailyRecordFile:
+    """Append-only file of fixed-width records per UTC day, rolling its handle over at midnight."""
+
+    def __init__(self, path_for: Callable[[str], str], dtype: np.dtype, label: str):
+        self.path_for = path_for  # YYYYMMDD -> file path
+        self.dtype = dtype
+        self.label = label
+        self.handle = None
+        self.date_str = None
+
+    def append(self, records: np.ndarray, time_ms: int) -> None:
+        """Append records to the file of the day containing `time_ms`, flushing them to the OS."""
+        date_str = datetime.fromtimestamp(time_ms / 1000, tz=TIMEZONE).strftime("%Y%m%d")
+        try:
+            if date_str != self.date_str:
+                self.release()
+                path = self.path_for(date_str)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                repair_tape(path, self.dtype)
+                self.handle = open(path, 'ab')
+                self.date_str = date_str
+            self.handle.write(records.tobytes())
+            self.handle.flush()
+        except OSError as e:
+            logger.error(f"Error writing {self.label} for {date_str}: {e}")
+
+    def release(self) -> None:
+        """Close the current file handle."""
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        self.date_str = None
+
+class BarBuilder:
+    """Incremental OHLCV + VWAP + trade-count bar for one symbol and interval.
+
+    Each trade updates the open bar in O(1). A bar is closed and appended to
+    <symbol>/YYYYMM/bars_<interval>/YYYYMMDD.bin as soon as a trade for a later
+    bucket arrives, or by the clock once its bucket has ended and the symbol has
+    been quiet for BAR_CLOSE_GRACE seconds. Buckets without trades produce no bar.
+    """
+
+    def __init__(self, symbol: str, interval: str, output_dir: Optional[str] = None):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = BAR_INTERVALS[interval]
+        self.base_dir = symbol_dir(output_dir or OUTPUT_BASE_DIR, symbol)
+        self.open_time = None  # Start of the open bucket, epoch ms; None when no bar is open
+        self.open = self.high = self.low = self.close = 0.0
+        self.volume = self.quote_volume = 0.0
+        self.trades = 0
+        self.file = DailyRecordFile(lambda date_str: bars_path(self.base_dir, interval, date_str), BAR_DTYPE, f"{symbol} {interval} bars")
+        self.ring = None  # Optional SharedRing closed bars are published to
+
+    def update(self, time_ms: int, price: float, quantity: float) -> Optional[np.ndarray]:
+        """Fold a trade into the open bar; returns the bar it closed, if any."""
+        bucket = time_ms - time_ms % self.interval_ms
+        closed = None
+        if self.open_time is not None and bucket != self.open_time:
+            if bucket < self.open_time:
+                logger.debug(f"Ignoring late {self.symbol} trade at {time_ms} for closed {self.interval} bar")
+                return None
+            closed = self.close_bar()
+        if self.open_time is None:
+            self.open_time = bucket
+            self.open = self.high = self.low = price
+            self.volume = self.quote_volume = 0.0
+            self.trades = 0
+        elif price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += quantity
+        self.quote_volume += price * quantity
+        self.trades += 1
+        return closed
+
+    def close_due(self, now_ms: int) -> bool:
+        """Whether the open bar's bucket has ended (plus grace) by the wall clock; callers check the symbol is quiet."""
+        return self.open_time is not None and now_ms >= self.open_time + self.interval_ms + BAR_CLOSE_GRACE * 1000
+
+    def close_bar(self) -> Optional[np.ndarray]:
+        """Close and persist the open bar, returning it as a BAR_DTYPE record."""
+        if self.open_time is None:
+            return None
+        bar = np.array([(
+            self.open_time, self.open, self.high, self.low, self.close, self.volume, self.quote_volume,
+            self.quote_volume / self.volume if self.volume else self.close, self.trades
+        )], dtype=BAR_DTYPE)
+        self.open_time = None
+        if self.ring is not None:
+            self.ring.publish(bar[0])
+        self.file.append(bar, int(bar['open_time'][0]))
+        return bar
+
+    def seed(self, trades: np.ndarray) -> None:
+        """Rebuild the open bar after a restart from already-captured trades (TRADE_DTYPE, time-ordered)."""
+        if len(trades) == 0:
+            return
+        bucket = int(trades['time'][-1]) - int(trades['time'][-1]) % self.interval_ms
+        date_str = datetime.fromtimestamp(bucket / 1000, tz=TIMEZONE).strftime("%Y%m%d")
+        path = bars_path(self.base_dir, self.interval, date_str)
+        if os.path.exists(path):
+            persisted = open_bars(path)
+            if len(persisted) and persisted['open_time'][-1] >= bucket:
+                return  # Bar was already closed before the restart
+        in_bucket = trades[trades['time'] >= bucket]
+        if len(in_bucket) == 0:
+            return
+        prices = in_bucket['price']
+        self.open_time = bucket
+        self.open, self.close = float(prices[0]), float(prices[-1])
+        self.high, self.low = float(prices.max()), float(prices.min())
+        self.volume = float(in_bucket['quantity'].sum())
+        self.quote_volume = float((prices * in_bucket['quantity']).sum())
+        self.trades = len(in_bucket)
+        logger.info(f"Seeded open {self.symbol} {self.interval} bar with {self.trades} captured trades")
+
+    def release(self) -> None:
+        """Close the current bar file handle."""
+        self.file.release()
+
+class SymbolCapture:
+    """Capture state for one symbol: its writer, bar builders, tradeId cursor and fromId gap filling."""
+
+    def __init__(self, symbol: str, sink_names: Optional[List[str]] = None, bar_intervals: Optional[List[str]] = None, ring_trades: int = RING_TRADES,
+                 output_dir: Optional[str] = None):
+        self.symbol = symbol
+        self.output_dir = output_dir or OUTPUT_BASE_DIR
+        self.writer = TradeWriter(symbol, sink_names, output_dir=self.output_dir)
+        self.bars = [BarBuilder(symbol, interval, self.output_dir) for interval in (DEFAULT_BARS if bar_intervals is None else bar_intervals)]
+        self.cursor = load_cursor(symbol, self.output_dir)  # Last aggregate tradeId accepted (may still be buffered in the writer)
+        self.last_trade_at = 0.0  # Wall time of the last accepted trade, so a backlog is never closed out by the clock
+        self.trade_ring = None
+        logger.info(f"Resuming {symbol} after tradeId {self.cursor}" if self.cursor is not None else f"No saved cursor for {symbol}")
+        if self.cursor is not None and self.bars:
+            self.seed_bars()
+        if ring_trades:
+            self.open_rings(ring_trades)
+
+    def open_rings(self, ring_trades: int) -> None:
+        """Create this symbol's shared-memory rings, pre-filled from disk so readers get a full window at once."""
+        base_dir = symbol_dir(self.output_dir, self.symbol)
+        try:
+            self.trade_ring = SharedRing.create(ring_name(self.symbol, "trades"), TRADE_DTYPE, ring_trades)
+            tapes = list_tapes(base_dir)
+            if tapes:
+                self.trade_ring.publish_many(open_tape(list(tapes.values())[-1])[-ring_trades:])
+            for builder in self.bars:
+                builder.ring = SharedRing.create(ring_name(self.symbol, f"bars_{builder.interval}"), BAR_DTYPE, RING_BARS)
+                bar_files = list_bars(base_dir, builder.interval)
+                if bar_files:
+                    builder.ring.publish_many(open_bars(list(bar_files.values())[-1])[-RING_BARS:])
+            logger.info(f"Publishing {self.symbol} trades and bars to shared memory ({ring_name(self.symbol, 'trades')})")
+        except (OSError, ValueError) as e:
+            logger.error(f"Error creating {self.symbol} shared-memory rings, continuing without them: {e}")
+            self.close_rings()
+
+    def close_rings(self) -> None:
+        """Remove this symbol's shared-memory rings."""
+        if self.trade_ring is not None:
+            self.trade_ring.close()
+            self.trade_ring = None
+        for builder in self.bars:
+            if builder.ring is not None:
+                builder.ring.close()
+                builder.ring = None
+
+    def seed_bars(self) -> None:
+        """Restore the open bars from the newest tape so a restart does not truncate them."""
+        tapes = list_tapes(symbol_dir(self.output_dir, self.symbol))
+        if not tapes:
+            return
+        try:
+            trades = open_tape(list(tapes.values())[-1])
+            trades = trades[trades['trade_id'] <= self.cursor]
+            for builder in self.bars:
+                builder.seed(trades)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error seeding {self.symbol} bars from tape: {e}")
+
+    def flush(self) -> None:
+        """Flush the writer and checkpoint the cursor to what is now on disk."""
+        latencies = self.writer.flush()
+        METRICS["parse_to_persisted"].record_many(latencies)
+        if self.trade_ring is None:
+            METRICS["parse_to_visible"].record_many(latencies)  # Without the ring, readers see trades once they are on disk
+        if self.writer.last_trade_id is not None:
+            save_cursor(self.symbol, self.writer.last_trade_id, self.output_dir)
+
+    def process_trade(self, data: Dict, echo: bool = True, parsed_at: float = float('nan')) -> bool:
+        """Hand a trade to the writer, flushing when a threshold is hit. Returns False on fatal setup errors.
+
+        `parsed_at` (perf_counter) marks a live trade whose visible/persisted latency is measured.
+        """
+        if self.cursor is not None and data['tradeId'] <= self.cursor:
+            return True  # Already written (overlap between catch-up pages and the live feed)
+        if echo:
+            print(f"{data['timestamp']} | {self.symbol} | Price: {data['price']} | Volume: {data['quantity']}")
+        if not self.writer.write(data, parsed_at):
+            return False
+        self.cursor = data['tradeId']
+        self.last_trade_at = time.time()
+        if self.trade_ring is not None:
+            self.trade_ring.publish((data['time'], data['tradeId'], data['price'], data['quantity']))
+            if parsed_at == parsed_at:  # Not NaN
+                METRICS["parse_to_visible"].record(time.perf_counter() - parsed_at)
+        for builder in self.bars:
+            builder.update(data['time'], data['price'], data['quantity'])
+        if self.writer.flush_due():
+            self.flush()
+        return True
+
+    def tick(self, now: float) -> None:
+        """Housekeeping for quiet symbols: time-based flush and closing bars whose bucket has ended."""
+        if self.writer.flush_due():
+            self.flush()
+        if now - self.last_trade_at < BAR_CLOSE_GRACE:
+            return  # Trades are still arriving; the next later-bucket trade closes the bar exactly
+        now_ms = int(now * 1000)
+        for builder in self.bars:
+            if builder.close_due(now_ms):
+                builder.close_bar()
+
+    def catch_up(self, session: requests.Session, base_url: str = BASE_URL, until_id: Optional[int] = None) -> bool:
+        """Page forward from the cursor with fromId until the live edge (or `until_id`) is reached. Returns False on fatal setup errors."""
+        if self.cursor is None:
+            logger.info(f"No {self.symbol} trade cursor yet, starting capture at the live edge")
+            return True
+        start_cursor = self.cursor
+        catchup_start = time.time()
+        while until_id is None or self.cursor < until_id:
+            page_start = self.cursor
+            batch = fetch_trades_from(session, self.symbol, self.cursor + 1, base_url)
+            if batch is None:
+                logger.warning(f"{self.symbol} catch-up stopped at tradeId {self.cursor}; will retry on the next stall")
+                break
+            for trade in batch:
+                try:
+                    data = parse_trade(trade, self.symbol)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping malformed {self.symbol} trade during catch-up {trade}: {e}")
+                    continue
+                if not self.process_trade(data, echo=False):
+                    return False
+            self.flush()
+            if len(batch) < CATCHUP_BATCH_SIZE:
+                break  # Short page: we are at the live edge
+            if page_start == self.cursor:
+                logger.warning(f"{self.symbol} catch-up page from {page_start + 1} did not advance the cursor, stopping")
+                break
+        caught_up = self.cursor - start_cursor
+        if caught_up:
+            elapsed = time.time() - catchup_start
+            logger.info(f"Caught up {caught_up} {self.symbol} trades ({start_cursor + 1} to {self.cursor}) in {elapsed:.2f} seconds ({caught_up / max(elapsed, 1e-9):.0f} trades/sec)")
+        return True
+
+    def close(self) -> None:
+        """Flush and release the writer and bar files (open bars are rebuilt from the tape on restart)."""
+        self.flush()
+        self.writer.close()
+        for builder in self.bars:
+            builder.release()
+        self.close_rings()
+
+def poll_trades(captures: Dict[str, SymbolCapture], session: requests.Session, base_url: str = BASE_URL) -> None:
+    """Poll the REST endpoint for each symbol's newest trade every POLL_INTERVAL seconds, filling any gap from the cursor."""
+    with ThreadPoolExecutor(max_workers=min(len(captures), POLL_THREADS)) as executor:
+        while True:
+            start_time = time.time()
+            latest = list(executor.map(lambda symbol: (symbol, fetch_price(session, symbol, base_url)), captures))
+            for symbol, fetched in latest:
+                capture = captures[symbol]
+                if fetched:
+                    data, parsed_at = fetched
+                    if capture.cursor is not None and data['tradeId'] > capture.cursor + 1 and not capture.catch_up(session, base_url, until_id=data['tradeId']):
+                        logger.error("Stopping S.C.A.L.E. due to output setup failure")
+                        return
+                    if not capture.process_trade(data, parsed_at=parsed_at):
+                        logger.error("Stopping S.C.A.L.E. due to output setup failure")
+                        return
+                else:
+                    current_timestamp = datetime.now(TIMEZONE).strftime("%Y-%m-%dT%H:%M:%SZ")
+                    print(f"{current_timestamp} | {symbol} | No data fetched")
+            for capture in captures.values():
+                capture.tick(time.time())
+            METRICS.tick(time.time())
+            
+            elapsed = time.time() - start_time
+            sleep_time = max(POLL_INTERVAL - elapsed, 0)
+            time.sleep(sleep_time)
+
+def stream_url(base_url: str, symbols: List[str], stream: str = "aggTrade") -> str:
+    """Combined-stream URL multiplexing one stream type (e.g. aggTrade, depth@100ms) of all symbols over one connection."""
+    return f"{base_url.rstrip('/')}/stream?streams={'/'.join(f'{symbol.lower()}@{stream}' for symbol in symbols)}"
+
+def consume_stream(url: str, label: str, on_connect: Callable[[], bool], on_message: Callable[[bytes, float, float], Optional[bool]],
+                   on_tick: Callable[[float], None]) -> None:
+    """Run a WebSocket stream, reconnecting with backoff and keeping the connection alive with pings.
+
+    on_connect() runs after every (re)connect; on_message(payload, received wall
+    time, received perf_counter) handles each text frame and returns True once
+    data flows, None to ignore it, or False to stop; on_tick(now) runs every
+    TICK_INTERVAL even on a silent connection. on_connect returning False also stops.
+    """
+    reconnects = 0
+    while True:
+        ws = None
+        try:
+            logger.info(f"Connecting to {label} stream: {url}")
+            ws = websocket.create_connection(url, timeout=TICK_INTERVAL)
+            logger.info(f"Connected to {label} stream")
+            if not on_connect():
+                return
+            last_frame = last_ping = last_tick = time.time()
+            while True:
+                now = time.time()
+                if now - last_tick >= TICK_INTERVAL:
+                    # Quiet symbols on a busy connection still need their housekeeping
+                    on_tick(now)
+                    last_tick = now
+                try:
+                    # Server pings are answered inside recv_data; control frames are returned so pongs count as liveness
+                    opcode, payload = ws.recv_data(control_frame=True)
+                    received, received_at = time.time(), time.perf_counter()
+                except websocket.WebSocketTimeoutException:
+                    # Socket timeout (TICK_INTERVAL) brings us back to the housekeeping pass on a silent connection
+                    silence = time.time() - last_frame
+                    if silence > STREAM_STALE_TIMEOUT:
+                        logger.warning(f"No frames for {STREAM_STALE_TIMEOUT} seconds, reconnecting")
+                        break
+                    if silence > STREAM_RECV_TIMEOUT and time.time() - last_ping > STREAM_RECV_TIMEOUT:
+                        ws.ping()
+                        last_ping = time.time()
+                    continue
+                last_frame = time.time()
+                if opcode == websocket.ABNF.OPCODE_CLOSE:
+                    logger.warning(f"{label} stream closed by server")
+                    break
+                if opcode != websocket.ABNF.OPCODE_TEXT:
+                    continue
+                handled = on_message(payload, received, received_at)
+                if handled is False:
+                    return
+                if handled:
+                    reconnects = 0
+        except (websocket.WebSocketException, OSError) as e:
+            logger.warning(f"{label} stream error: {e}")
+        finally:
+            if ws is not None:
+                ws.close()
+        delay = min(RETRY_DELAY * (2 ** reconnects), STREAM_MAX_BACKOFF)
+        reconnects += 1
+        logger.info(f"Reconnecting to {label} stream in {delay} seconds")
+        time.sleep(delay)
+
+def stream_trades(captures: Dict[str, SymbolCapture], session: requests.Session, base_url: str = STREAM_BASE_URL, rest_url: str = BASE_URL) -> None:
+    """Consume the combined aggTrade stream for all symbols, filling gaps from the REST API."""
+    def on_connect() -> bool:
+        # Fill whatever was missed while disconnected; new stream frames queue up in the socket meanwhile
+        for capture in captures.values():
+            if not capture.catch_up(session, rest_url):
+                logger.error("Stopping S.C.A.L.E. due to output setup failure")
+                return False
+        return True
+
+    def on_message(payload: bytes, received: float, received_at: float) -> Optional[bool]:
+        try:
+            message = json.loads(payload).get("data", {})
+            capture = captures.get(message.get("s"))
+            if message.get("e") != "aggTrade" or capture is None:
+                logger.debug(f"Ignoring stream message: {message}")
+                return None
+            data = parse_trade(message, capture.symbol)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Malformed stream message {payload[:200]!r}: {e}")
             return None
-        conn.close()
-        return sqlite_file
-    except sqlite3.Error as e:
-        logger.error(f"SQLite error during setup for {sqlite_file}: {e}")
-        return None
-
-def fetch_price() -> Optional[Dict]:
-    """Fetch the latest aggregated trade from Binance API."""
-    params = {"symbol": SYMBOL, "limit": 1}
+        parsed_at = time.perf_counter()
+        METRICS["event_to_receive"].record(received - data['time'] / 1000)
+        METRICS["receive_to_parse"].record(parsed_at - received_at)
+        if capture.cursor is not None and data['tradeId'] > capture.cursor + 1 and not capture.catch_up(session, rest_url, until_id=data['tradeId'] - 1):
+            logger.error("Stopping S.C.A.L.E. due to output setup failure")
+            return False
+        if not capture.process_trade(data, echo=False, parsed_at=parsed_at):
+            logger.error("Stopping S.C.A.L.E. due to output setup failure")
+            return False
+        return True
+
+    def on_tick(now: float) -> None:
+        for capture in captures.values():
+            capture.tick(now)
+        METRICS.tick(now)
+
+    consume_stream(stream_url(base_url, list(captures)), f"aggTrade ({len(captures)} symbols)", on_connect, on_message, on_tick)
+
+def fetch_depth_snapshot(session: requests.Session, symbol: str, base_url: str) -> Optional[Dict]:
+    """Fetch a BOOK_SNAPSHOT_LIMIT-level order book snapshot from /api/v3/depth."""
+    params = {"symbol": symbol, "limit": BOOK_SNAPSHOT_LIMIT}
     for attempt in range(1, MAX_API_RETRIES + 1):
         try:
-            fetch_start = time.time()
-            response = requests.get(BASE_URL, params=params, headers={'Cache-Control': 'no-cache'})
+            response = session.get(base_url, params=params, headers={'Cache-Control': 'no-cache'}, timeout=10)
+            if response.status_code == 429:
+                wait_time = int(response.headers.get("Retry-After", RATE_LIMIT_WAIT))
+                logger.warning(f"Rate limit hit fetching {symbol} depth on attempt {attempt}. Waiting {wait_time} seconds.")
+                time.sleep(wait_time)
+                continue
             response.raise_for_status()
             data = response.json()
-            if isinstance(data, dict) and "code" in data:
+            if "lastUpdateId" not in data:
                 logger.warning(f"API error on attempt {attempt}: {data.get('msg', 'Unknown error')}")
                 if attempt == MAX_API_RETRIES:
                     return None
                 time.sleep(RETRY_DELAY)
                 continue
-            trade = data[0]
-            timestamp = datetime.fromtimestamp(trade["T"] / 1000, tz=TIMEZONE).strftime("%Y-%m-%dT%H:%M:%SZ")
-            price = float(trade["p"])
-            quantity = float(trade["q"])
-            quote_qty = price * quantity
-            trade_id = int(trade["a"])
-            fetch_end = time.time()
-            logger.info(f"Fetched trade: price={price}, quantity={quantity}, tradeId={trade_id} at {timestamp}")
-            logger.debug(f"Fetch time: {fetch_end - fetch_start:.2f} seconds")
-            return {
-                "ticker": f"BINANCE:{SYMBOL}",
-                "timestamp": timestamp,
-                "price": price,
-                "quantity": quantity,
-                "quoteQty": quote_qty,
-                "tradeId": trade_id
-            }
-        except (requests.RequestException, IndexError, KeyError) as e:
-            logger.warning(f"Error fetching trade on attempt {attempt}: {e}")
+            return data
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            logger.warning(f"Error fetching {symbol} depth snapshot on attempt {attempt}: {e}")
             if attempt == MAX_API_RETRIES:
                 return None
             time.sleep(RETRY_DELAY)
     return None
 
-def save_data(data: Optional[Dict], timestamp: datetime, date_str: str) -> None:
-    """Save trade data to CSV, SQLite, and TXT."""
-    if data is None:
+def depth_url(rest_url: str) -> str:
+    """/api/v3/depth next to the configured aggTrades endpoint (works for Binance and the mock exchange)."""
+    return f"{rest_url.rsplit('/', 1)[0]}/depth"
+
+class BookCapture:
+    """Local L2 order book for one symbol, kept in sync from a snapshot plus depth diffs and sampled to disk.
+
+    Follows Binance's procedure: buffer diffs, fetch a snapshot, drop diffs it
+    already covers, then require each diff's first update ID to follow the
+    previous one. Any gap discards the book and re-syncs from a new snapshot.
+    Every `interval` seconds the top `levels`, mid, spread and imbalance are
+    appended to <symbol>/YYYYMM/book<levels>/YYYYMMDD.bin (tape.book_dtype).
+    """
+
+    def __init__(self, symbol: str, levels: int = BOOK_LEVELS, interval: float = BOOK_INTERVAL, output_dir: Optional[str] = None):
+        self.symbol = symbol
+        self.levels = levels
+        self.interval = interval
+        self.book = OrderBook()
+        self.synced = False
+        self.buffer = []  # Diffs received while out of sync
+        self.last_sync_attempt = 0.0
+        self.next_sample = 0.0
+        self.applied = 0
+        self.resyncs = 0
+        self.dtype = book_dtype(levels)
+        base_dir = symbol_dir(output_dir or OUTPUT_BASE_DIR, symbol)
+        self.file = DailyRecordFile(lambda date_str: book_path(base_dir, levels, date_str), self.dtype, f"{symbol} order book samples")
+
+    def on_event(self, event: Dict, session: requests.Session, url: str) -> None:
+        """Apply (or buffer, while out of sync) one depthUpdate event."""
+        if not self.synced:
+            self.buffer.append(event)
+            if len(self.buffer) > BOOK_BUFFER_MAX:
+                del self.buffer[0]  # A snapshot older than what is left is simply retried
+            self.sync(session, url)
+            return
+        applied = self.book.apply_diff(event)
+        if applied:
+            self.applied += 1
+        elif applied is False:
+            logger.warning(f"{self.symbol} depth gap: expected update {self.book.update_id + 1}, got {event['U']}-{event['u']}; re-syncing")
+            self.synced = False
+            self.resyncs += 1
+            self.buffer = [event]
+            self.sync(session, url)
+
+    def sync(self, session: requests.Session, url: str) -> None:
+        """Load a snapshot and replay the buffered diffs on top of it (at most once per BOOK_RESYNC_DELAY)."""
+        now = time.time()
+        if now - self.last_sync_attempt < BOOK_RESYNC_DELAY:
+            return
+        self.last_sync_attempt = now
+        snapshot = fetch_depth_snapshot(session, self.symbol, url)
+        if snapshot is None:
+            return
+        if int(snapshot["lastUpdateId"]) < int(self.buffer[0]["U"]) - 1:
+            logger.info(f"{self.symbol} depth snapshot {snapshot['lastUpdateId']} predates buffered update {self.buffer[0]['U']}, retrying")
+            return
+        self.book.load_snapshot(snapshot)
+        for event in self.buffer:
+            if self.book.apply_diff(event) is False:
+                logger.warning(f"{self.symbol} buffered depth updates have a gap at {event['U']}, waiting for a new snapshot")
+                self.buffer = [self.buffer[-1]]
+                return
+        self.buffer = []
+        self.synced = True
+        logger.info(f"{self.symbol} order book synced at update {self.book.update_id} "
+                    f"({len(self.book.bids)} bids, {len(self.book.asks)} asks)")
+
+    def tick(self, now: float) -> None:
+        """Append a sample when the cadence is due."""
+        if not self.synced or now < self.next_sample:
+            return
+        self.next_sample = now - now % self.interval + self.interval  # Stay on the cadence grid
+        now_ms = int(now * 1000)
+        self.file.append(self.book.sample(self.levels, self.dtype, now_ms), now_ms)
+
+    def close(self) -> None:
+        """Release the sample file."""
+        self.file.release()
+
+def stream_books(books: Dict[str, BookCapture], session: requests.Session, base_url: str = STREAM_BASE_URL, rest_url: str = BASE_URL) -> None:
+    """Maintain order books for all symbols from the combined depth diff stream."""
+    snapshot_url = depth_url(rest_url)
+    last_report = time.time()
+
+    def on_connect() -> bool:
+        for book in books.values():
+            book.synced = False  # Diffs were missed while disconnected
+            book.buffer = []
+            book.last_sync_attempt = 0.0
+        return True
+
+    def on_message(payload: bytes, received: float, received_at: float) -> Optional[bool]:
+        try:
+            event = json.loads(payload).get("data", {})
+            book = books.get(event.get("s"))
+            if event.get("e") != "depthUpdate" or book is None:
+                logger.debug(f"Ignoring stream message: {event}")
+                return None
+            book.on_event(event, session, snapshot_url)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Malformed depth message {payload[:200]!r}: {e}")
+            return None
+        return True
+
+    def on_tick(now: float) -> None:
+        nonlocal last_report
+        for book in books.values():
+            book.tick(now)
+        if now - last_report >= METRICS_INTERVAL:
+            for book in books.values():
+                logger.info(f"{book.symbol} book: {book.applied / (now - last_report):.0f} diffs/sec, "
+                            f"spread {(book.book.best_ask() or 0) - (book.book.best_bid() or 0):.8g}, {book.resyncs} re-syncs")
+                book.applied = 0
+            last_report = now
+
+    consume_stream(stream_url(base_url, list(books), BOOK_STREAM), f"depth ({len(books)} symbols)", on_connect, on_message, on_tick)
+
+def replay_chunks(source: str, symbol: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Yield a symbol's recorded trades as time-ordered TRADE_DTYPE arrays, day by day.
+
+    `source` is a S.C.A.L.E. output directory (reads <SYMBOL>/YYYYMM/bin tapes) or a
+    directory of Binance <SYMBOL>-aggTrades-YYYY-MM-DD.csv files; `start`/`end` are
+    inclusive YYYYMMDD bounds.
+    """
+    tapes = list_tapes(symbol_dir(source, symbol))
+    if tapes:
+        for date_str, path in tapes.items():
+            if (start and date_str < start) or (end and date_str > end):
+                continue
+            yield open_tape(path)
         return
-    month_dir = get_month_dir(timestamp)
-    csv_file = os.path.join(month_dir, "csv", f"{date_str}.csv")
-    sqlite_file = os.path.join(month_dir, "sqlite", f"{date_str}.db")
-    txt_file = os.path.join(month_dir, "txt", f"{date_str}.txt")
-    
-    save_start = time.time()
-    
-    # CSV
-    try:
-        with open(csv_file, 'a', encoding='utf-8') as f:
-            if not os.path.exists(csv_file) or os.path.getsize(csv_file) == 0:
-                f.write("timestamp,price,quantity,quoteQty,tradeId\n")
-            f.write(f"{data['timestamp']},{data['price']},{data['quantity']},{data['quoteQty']},{data['tradeId']}\n")
-        logger.info(f"Saved to CSV: {csv_file}")
-    except Exception as e:
-        logger.error(f"Error writing to CSV {csv_file}: {e}")
-    
-    # SQLite
-    try:
-        conn = sqlite3.connect(sqlite_file)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO trades (timestamp, price, quantity, quoteQty, tradeId)
-            VALUES (?, ?, ?, ?, ?)
-        """, (data['timestamp'], data['price'], data['quantity'], data['quoteQty'], data['tradeId']))
-        conn.commit()
-        conn.close()
-        logger.info(f"Saved to SQLite: {sqlite_file}")
-    except sqlite3.Error as e:
-        logger.error(f"SQLite error writing to {sqlite_file}: {e}")
-    
-    # TXT
+    csv_files = {}
+    for path in glob(os.path.join(source, "**", f"{symbol}-aggTrades-*.csv"), recursive=True):
+        date_str = os.path.basename(path)[len(symbol) + len("-aggTrades-"):-len(".csv")].replace("-", "")
+        if len(date_str) == 8 and date_str.isdigit() and not ((start and date_str < start) or (end and date_str > end)):
+            csv_files[date_str] = path
+    if not csv_files:
+        logger.warning(f"No {symbol} tapes or aggTrades CSVs found in {source}")
+    for date_str, path in sorted(csv_files.items()):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                has_header = not f.readline()[:1].isdigit()
+            for chunk in pd.read_csv(path, header=0 if has_header else None, names=AGG_TRADE_COLUMNS, usecols=[0, 1, 2, 5],
+                                     chunksize=REPLAY_CHUNK_SIZE):
+                trades = np.empty(len(chunk), dtype=TRADE_DTYPE)
+                times = chunk['transact_time'].to_numpy(dtype=np.int64)
+                trades['time'] = np.where(times > 10 ** 14, times // 1000, times)  # Binance switched to microseconds in 2025
+                trades['trade_id'] = chunk['agg_trade_id'].to_numpy(dtype=np.int64)
+                trades['price'] = chunk['price'].to_numpy(dtype=np.float64)
+                trades['quantity'] = chunk['quantity'].to_numpy(dtype=np.float64)
+                yield trades
+        except (OSError, ValueError, pd.errors.ParserError) as e:
+            logger.error(f"Error reading {path} for replay: {e}")
+
+def replay_trades(captures: Dict[str, SymbolCapture], source: str, speed: float = 0, start: Optional[str] = None, end: Optional[str] = None) -> None:
+    """Re-emit recorded trades through each capture's write/bar/publish path, merged across symbols in trade-time order.
+
+    speed=1 replays in real time, N > 1 compresses every inter-arrival gap N-fold,
+    and 0 runs as fast as possible.
+    """
+    def records(symbol: str):
+        for chunk in replay_chunks(source, symbol, start, end):
+            for trade_time, trade_id, price, quantity in chunk.tolist():
+                yield trade_time, trade_id, symbol, price, quantity
+
+    pacing = f"{speed:g}x real time" if speed else "as fast as possible"
+    logger.info(f"Replaying {', '.join(captures)} from {source} {pacing}")
+    replay_start = last_log = last_tick = time.time()
+    first_time = None
+    replayed = 0
+    for trade_time, trade_id, symbol, price, quantity in heapq.merge(*(records(symbol) for symbol in captures)):
+        if speed:
+            if first_time is None:
+                first_time = trade_time
+                replay_start = time.time()
+            due = replay_start + (trade_time - first_time) / 1000 / speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            METRICS["event_to_receive"].record(time.time() - due)  # Pacing lag behind the recorded schedule
+        received_at = time.perf_counter()
+        data = parse_trade({"T": trade_time, "a": trade_id, "p": price, "q": quantity}, symbol)
+        parsed_at = time.perf_counter()
+        METRICS["receive_to_parse"].record(parsed_at - received_at)
+        if not captures[symbol].process_trade(data, echo=False, parsed_at=parsed_at):
+            logger.error("Stopping S.C.A.L.E. replay due to output setup failure")
+            return
+        replayed += 1
+        now = time.time()
+        if now - last_tick >= TICK_INTERVAL:
+            for capture in captures.values():
+                capture.tick(now)
+            METRICS.tick(now)
+            last_tick = now
+            if now - last_log >= REPLAY_LOG_INTERVAL:
+                logger.info(f"Replayed {replayed} trades, now at {data['timestamp']} ({replayed / (now - replay_start):.0f} trades/sec)")
+                last_log = now
+    elapsed = time.time() - replay_start
+    logger.info(f"Replay finished: {replayed} trades in {elapsed:.2f} seconds ({replayed / max(elapsed, 1e-9):.0f} trades/sec)")
+
+def run_capture(symbols: List[str], args: argparse.Namespace, worker: int = 0) -> None:
+    """Capture a group of symbols in this process until Ctrl+C."""
+    if args.mode == 'book':
+        captures = {symbol: BookCapture(symbol, args.book_levels, args.book_interval, args.output_dir) for symbol in symbols}
+    else:
+        captures = {symbol: SymbolCapture(symbol, args.sinks, args.bars, args.ring, args.output_dir) for symbol in symbols}
+    session = requests.Session()  # One keep-alive connection pool shared by every symbol's REST calls
+    METRICS.labels = {"worker": str(worker)}
+    METRICS.interval = args.metrics_interval
+    METRICS.path = os.path.join(args.output_dir, METRICS_SUB_DIR, f"worker_{worker}.prom") if args.metrics_interval else None
+    if args.metrics_port:
+        METRICS.serve(METRICS_HOST, args.metrics_port + worker)
     try:
-        with open(txt_file, 'a', encoding='utf-8') as f:
-            json.dump(data, f)
-            f.write("\n")
-        logger.info(f"Saved to TXT: {txt_file}")
+        if args.mode == 'stream':
+            stream_trades(captures, session, args.stream_url, args.rest_url)
+        elif args.mode == 'book':
+            stream_books(captures, session, args.stream_url, args.rest_url)
+        elif args.mode == 'replay':
+            replay_trades(captures, args.replay_from, args.speed, args.start, args.end)
+        else:
+            for capture in captures.values():
+                if not capture.catch_up(session, args.rest_url):
+                    logger.error("Stopping S.C.A.L.E. due to output setup failure")
+                    return
+            poll_trades(captures, session, args.rest_url)
+    except KeyboardInterrupt:
+        logger.info(f"Stopping capture of {', '.join(symbols)} via Ctrl+C")
     except Exception as e:
-        logger.error(f"Error writing to TXT {txt_file}: {e}")
-    
-    save_end = time.time()
-    logger.info(f"Saved data: {json.dumps(data)}")
-    logger.debug(f"Save time: {save_end - save_start:.2f} seconds")
+        logger.error(f"Error in capture loop for {', '.join(symbols)}: {e}")
+    finally:
+        for capture in captures.values():
+            capture.close()
+        session.close()
+        METRICS.close()
+
+def parse_args() -> argparse.Namespace:
+    """Parse S.C.A.L.E. command-line options."""
+    parser = argparse.ArgumentParser(description="S.C.A.L.E. live trade capture")
+    parser.add_argument('--mode', choices=['poll', 'stream', 'replay', 'book'], default='poll',
+                        help="'poll' samples the newest trade every POLL_INTERVAL seconds, 'stream' records every trade from the WebSocket feed, "
+                             "'replay' re-emits recorded trades offline, 'book' maintains L2 order books from depth diffs")
+    parser.add_argument('--symbols', default=",".join(SYMBOLS),
+                        help="Comma-separated symbols to capture concurrently, e.g. BTCUSDT,ETHUSDT")
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f"Processes to shard the symbols across (0 = one per {SYMBOLS_PER_WORKER} symbols, up to the core count)")
+    parser.add_argument('--stream-url', default=STREAM_BASE_URL,
+                        help="WebSocket host serving /stream?streams= (point at src/scale/mock_exchange.py for local testing)")
+    parser.add_argument('--rest-url', default=BASE_URL,
+                        help="aggTrades REST endpoint used for polling and fromId catch-up")
+    parser.add_argument('--sinks', default=",".join(DEFAULT_SINKS),
+                        help=f"Comma-separated output formats to write, from: {', '.join(SINKS)}")
+    parser.add_argument('--bars', default=",".join(DEFAULT_BARS),
+                        help=f"Comma-separated OHLCV bar intervals to build live (empty to disable), from: {', '.join(BAR_INTERVALS)}")
+    parser.add_argument('--ring', type=int, default=RING_TRADES,
+                        help="Recent trades per symbol to publish in shared memory for local readers (0 disables)")
+    parser.add_argument('--book-levels', type=int, default=BOOK_LEVELS, help="Order book levels per side recorded in book mode")
+    parser.add_argument('--book-interval', type=float, default=BOOK_INTERVAL, help="Seconds between order book samples in book mode")
+    parser.add_argument('--output-dir',
+                        help=f"Directory for tapes, bars, cursors and metrics (default: {OUTPUT_BASE_DIR}, or {REPLAY_OUTPUT_DIR} in replay mode)")
+    parser.add_argument('--replay-from', default=OUTPUT_BASE_DIR,
+                        help=f"Replay source: a S.C.A.L.E. output directory or a directory of Binance aggTrades CSVs such as {ZIP_DATA_DIR}")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="Replay pacing: 1 = real time, N = N times faster keeping inter-arrival gaps, 0 = as fast as possible")
+    parser.add_argument('--start', help="First YYYYMMDD day to replay (inclusive)")
+    parser.add_argument('--end', help="Last YYYYMMDD day to replay (inclusive)")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                        help=f"Seconds between latency reports written to {METRICS_SUB_DIR}/worker_<n>.prom under the output directory (0 disables)")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help=f"Serve Prometheus-text latency metrics on {METRICS_HOST}:<port + worker index>/metrics (0 disables)")
+    args = parser.parse_args()
+    args.sinks = [name.strip() for name in args.sinks.split(",") if name.strip()]
+    unknown = [name for name in args.sinks if name not in SINKS]
+    if unknown or not args.sinks:
+        parser.error(f"--sinks must list one or more of: {', '.join(SINKS)}")
+    args.bars = [interval.strip() for interval in args.bars.split(",") if interval.strip()]
+    if any(interval not in BAR_INTERVALS for interval in args.bars):
+        parser.error(f"--bars must list intervals from: {', '.join(BAR_INTERVALS)}")
+    args.symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in args.symbols.split(",") if symbol.strip()))
+    if not args.symbols:
+        parser.error("--symbols must list at least one symbol")
+    if args.output_dir is None:
+        args.output_dir = REPLAY_OUTPUT_DIR if args.mode == 'replay' else OUTPUT_BASE_DIR
+    args.output_dir = os.path.abspath(args.output_dir)
+    if args.mode == 'replay' and args.output_dir == os.path.abspath(args.replay_from):
+        parser.error("--output-dir must differ from --replay-from, or replayed trades would be appended to their own source")
+    if args.book_levels < 1 or args.book_interval <= 0:
+        parser.error("--book-levels and --book-interval must be positive")
+    if args.speed < 0:
+        parser.error("--speed must be 0 (as fast as possible) or a positive multiple of real time")
+    if args.ring < 0:
+        parser.error("--ring must be 0 (disabled) or a positive number of trades")
+    if args.workers < 0:
+        parser.error("--workers must be 0 (auto) or a positive number")
+    return args
+
+def shard_symbols(symbols: List[str], workers: int) -> List[List[str]]:
+    """Split symbols into per-process groups; workers=0 picks a count from SYMBOLS_PER_WORKER and the core count."""
+    if workers == 0:
+        workers = min(cpu_count(), -(-len(symbols) // SYMBOLS_PER_WORKER))
+    # Each group also has to fit on one combined stream connection
+    workers = max(workers, -(-len(symbols) // STREAM_MAX_STREAMS))
+    workers = max(1, min(workers, len(symbols)))
+    return [symbols[i::workers] for i in range(workers)]
 
 def main() -> None:
     """Main loop for S.C.A.L.E."""
-    logger.info("Starting S.C.A.L.E. Press Ctrl+C to stop.")
+    args = parse_args()
+    groups = shard_symbols(args.symbols, args.workers)
+    logger.info(f"Starting S.C.A.L.E. in {args.mode} mode for {len(args.symbols)} symbols on {len(groups)} worker(s) writing {', '.join(args.sinks)}. Press Ctrl+C to stop.")
     
     try:
-        while True:
-            start_time = time.time()
-            data = fetch_price()
-            if data:
-                timestamp = datetime.strptime(data['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
-                date_str = timestamp.strftime("%Y%m%d")
-                setup_directories(timestamp)
-                sqlite_file = setup_sqlite(timestamp, date_str)
-                if sqlite_file is None:
-                    logger.error("Stopping S.C.A.L.E. due to SQLite setup failure")
-                    return
-                print(f"{data['timestamp']} | Price: {data['price']} | Volume: {data['quantity']}")
-                save_data(data, timestamp, date_str)
-            else:
-                current_timestamp = datetime.now(TIMEZONE).strftime("%Y-%m-%dT%H:%M:%SZ")
-                print(f"{current_timestamp} | No data fetched")
-            
-            elapsed = time.time() - start_time
-            sleep_time = max(POLL_INTERVAL - elapsed, 0)
-            time.sleep(sleep_time)
+        if len(groups) == 1:
+            run_capture(groups[0], args)
+        else:
+            workers = [Process(target=run_capture, args=(group, args, i), name=f"scale-{i}") for i, group in enumerate(groups)]
+            for worker in workers:
+                worker.start()
+            try:
+                for worker in workers:
+                    worker.join()
+            except KeyboardInterrupt:
+                # Workers receive the same Ctrl+C and flush their own writers
+                logger.info("Stopping S.C.A.L.E. via Ctrl+C, waiting for workers to flush")
+                for worker in workers:
+                    worker.join()
     except KeyboardInterrupt:
         logger.info("Stopping S.C.A.L.E. via Ctrl+C")
     except Exception as e:
@@ -194,4 +1210,4 @@ def main() -> None:
         logger.info("Cleaning up and stopping S.C.A.L.E.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,117 @@
+import os
+from glob import glob
+from typing import Dict, Optional
+import numpy as np
+
+# Fixed-width binary records written by S.C.A.L.E. and memory-mapped by its readers.
+# Files are headerless little-endian records, one file per symbol and UTC day:
+#     data/scale/<SYMBOL>/YYYYMM/bin/YYYYMMDD.bin           trades (TRADE_DTYPE)
+#     data/scale/<SYMBOL>/YYYYMM/bars_<interval>/YYYYMMDD.bin  closed OHLCV bars (BAR_DTYPE)
+#     data/scale/<SYMBOL>/YYYYMM/book<levels>/YYYYMMDD.bin     order book samples (book_dtype(levels))
+TRADE_DTYPE = np.dtype([
+    ('time', '<i8'),      # Exchange trade time, epoch milliseconds
+    ('trade_id', '<i8'),  # Aggregate trade ID
+    ('price', '<f8'),
+    ('quantity', '<f8'),
+])
+BAR_DTYPE = np.dtype([
+    ('open_time', '<i8'),  # Bucket start, epoch milliseconds
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('quote_volume', '<f8'),
+    ('vwap', '<f8'),
+    ('trades', '<i8'),
+])
+
+def book_dtype(levels: int) -> np.dtype:
+    """Record of a top-`levels` order book sample; missing levels have NaN price and zero quantity."""
+    return np.dtype([
+        ('time', '<i8'),          # Sample wall time, epoch milliseconds
+        ('event_time', '<i8'),    # Exchange time of the last applied depth update, epoch milliseconds
+        ('update_id', '<i8'),     # Last applied depth update ID
+        ('bid_price', '<f8', (levels,)),  # Best first
+        ('bid_qty', '<f8', (levels,)),
+        ('ask_price', '<f8', (levels,)),
+        ('ask_qty', '<f8', (levels,)),
+        ('mid', '<f8'),
+        ('spread', '<f8'),
+        ('imbalance', '<f8'),     # (bid qty - ask qty) / (bid qty + ask qty) over the recorded levels
+    ])
+
+TAPE_SUB_DIR = "bin"
+TAPE_EXTENSION = ".bin"
+BAR_SUB_DIR = "bars_{interval}"
+BOOK_SUB_DIR = "book{levels}"
+
+def symbol_dir(base_dir: str, symbol: str) -> str:
+    """Per-symbol partition under the S.C.A.L.E. output directory."""
+    return os.path.join(base_dir, symbol.upper())
+
+def tape_path(base_dir: str, date_str: str) -> str:
+    """Path of the tape file for a YYYYMMDD date under a symbol directory."""
+    return os.path.join(base_dir, date_str[:6], TAPE_SUB_DIR, f"{date_str}{TAPE_EXTENSION}")
+
+def bars_path(base_dir: str, interval: str, date_str: str) -> str:
+    """Path of the bar file for an interval (e.g. '1m') and YYYYMMDD date under a symbol directory."""
+    return os.path.join(base_dir, date_str[:6], BAR_SUB_DIR.format(interval=interval), f"{date_str}{TAPE_EXTENSION}")
+
+def book_path(base_dir: str, levels: int, date_str: str) -> str:
+    """Path of the top-`levels` order book sample file for a YYYYMMDD date under a symbol directory."""
+    return os.path.join(base_dir, date_str[:6], BOOK_SUB_DIR.format(levels=levels), f"{date_str}{TAPE_EXTENSION}")
+
+def _list_daily(base_dir: str, sub_dir: str) -> Dict[str, str]:
+    files = {}
+    for path in glob(os.path.join(base_dir, "*", sub_dir, f"*{TAPE_EXTENSION}")):
+        date_str = os.path.basename(path)[:-len(TAPE_EXTENSION)]
+        if len(date_str) == 8 and date_str.isdigit():
+            files[date_str] = path
+    return dict(sorted(files.items()))
+
+def list_tapes(base_dir: str) -> Dict[str, str]:
+    """Map YYYYMMDD -> tape path for every tape file under a symbol directory."""
+    return _list_daily(base_dir, TAPE_SUB_DIR)
+
+def list_bars(base_dir: str, interval: str) -> Dict[str, str]:
+    """Map YYYYMMDD -> bar file path for an interval under a symbol directory."""
+    return _list_daily(base_dir, BAR_SUB_DIR.format(interval=interval))
+
+def list_books(base_dir: str, levels: int) -> Dict[str, str]:
+    """Map YYYYMMDD -> order book sample file path for a depth under a symbol directory."""
+    return _list_daily(base_dir, BOOK_SUB_DIR.format(levels=levels))
+
+def open_records(path: str, dtype: np.dtype = TRADE_DTYPE, mode: str = 'r') -> np.ndarray:
+    """Memory-map a record file as a `dtype` array (zero-copy).
+
+    A trailing partial record (writer interrupted mid-append) is ignored.
+    """
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(count,))
+
+def open_tape(path: str, mode: str = 'r') -> np.ndarray:
+    """Memory-map a tape file as a TRADE_DTYPE record array."""
+    return open_records(path, TRADE_DTYPE, mode)
+
+def open_bars(path: str, mode: str = 'r') -> np.ndarray:
+    """Memory-map a bar file as a BAR_DTYPE record array."""
+    return open_records(path, BAR_DTYPE, mode)
+
+def open_book(path: str, levels: int, mode: str = 'r') -> np.ndarray:
+    """Memory-map an order book sample file as a book_dtype(levels) record array."""
+    return open_records(path, book_dtype(levels), mode)
+
+def repair_tape(path: str, dtype: np.dtype = TRADE_DTYPE) -> Optional[int]:
+    """Truncate a torn trailing record left by a crash; returns the record count, or None if the file is missing."""
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+    whole = size - size % dtype.itemsize
+    if whole != size:
+        with open(path, 'r+b') as f:
+            f.truncate(whole)
+    return whole // dtype.itemsize
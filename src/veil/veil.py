@@ -1,9 +1,38 @@
+import os
+import sys
 import pandas as pd
 
+try:
+    from src.scale.tape import TRADE_DTYPE
+    from src.scale.ring import SharedRing, ring_name
+    from src.grim import store
+except ImportError:  # Run directly as a script: make the project root importable
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+    from src.scale.tape import TRADE_DTYPE
+    from src.scale.ring import SharedRing, ring_name
+    from src.grim import store
+
+SYMBOL = "BTCUSDT"  # Symbol whose live S.C.A.L.E. trades are read
+
 class VEIL:
     def __init__(self):
         self.trades = []
         self.balance = 100000  # Starting balance
+        self.rings = {}  # Symbol -> S.C.A.L.E. shared-memory trade ring, attached on first use
+
+    def live_price(self, symbol=SYMBOL):
+        """Latest traded price published by a running S.C.A.L.E., or None if it is not running."""
+        if symbol not in self.rings:
+            ring = SharedRing.attach(ring_name(symbol, "trades"), TRADE_DTYPE)
+            if ring is None:
+                return None
+            self.rings[symbol] = ring
+        last = self.rings[symbol].latest(1)
+        return float(last['price'][0]) if len(last) else None
+
+    def history(self, start, end, symbol=SYMBOL):
+        """Historical trades (time, price, quantity) between start and end from G.R.I.M.'s store, for replaying signals."""
+        return store.query(symbol, start, end, ['time', 'price', 'quantity'])
 
     def simulate_trade(self, signal, price):
         """Simulates a trade based on a signal."""
@@ -0,0 +1,101 @@
+import random
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+
+from src.grim import backfill, catalog
+from src.scale import mock_exchange
+
+SYMBOL = "BTCUSDT"
+START_MS = 1699999980000  # A minute boundary
+GAP = (START_MS + 60000, START_MS + 660000)  # Ten minutes, about 24 pages of the tape below
+
+@pytest.fixture
+def exchange():
+    """A mock exchange serving 30,000 trades from START_MS on an ephemeral port; yields (server, aggTrades URL)."""
+    random.seed(0)
+    server = mock_exchange.make_server(mock_exchange.synthetic_trades(30000, start_time_ms=START_MS), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/api/v3/aggTrades"
+    server.shutdown()
+    server.server_close()
+
+def expected_ids(server, start_ms: int, end_ms: int) -> np.ndarray:
+    _, ids, times = server.tapes[SYMBOL]
+    ids, times = np.array(ids), np.array(times)
+    return ids[(times >= start_ms) & (times < end_ms)]
+
+def test_pages_by_from_id(exchange, tmp_path, monkeypatch):
+    server, url = exchange
+    next_ids = []
+    fetch_page = backfill.fetch_page
+    monkeypatch.setattr(backfill, "fetch_page", lambda session, base_url, symbol, cursor:
+                        next_ids.append(cursor["next_id"]) or fetch_page(session, base_url, symbol, cursor))
+    frames = []
+    total = backfill.run(SYMBOL, [GAP], url, frames.append, path=str(tmp_path / "catalog.db"))
+    fetched = pd.concat(frames)["trade_id"].to_numpy()
+    assert total == len(fetched) > backfill.PAGE_LIMIT
+    assert np.array_equal(np.sort(fetched), expected_ids(server, *GAP))
+    assert next_ids[0] is None and all(next_id is not None for next_id in next_ids[1:])
+    last = int(expected_ids(server, *GAP)[-1])
+    assert catalog.watermark(f"api:{SYMBOL}", str(tmp_path / "catalog.db"))["value"] == last
+
+def test_from_id_skips_the_time_window(exchange, tmp_path, monkeypatch):
+    server, url = exchange
+    from_id = int(expected_ids(server, *GAP)[0])
+    next_ids = []
+    fetch_page = backfill.fetch_page
+    monkeypatch.setattr(backfill, "fetch_page", lambda session, base_url, symbol, cursor:
+                        next_ids.append(cursor["next_id"]) or fetch_page(session, base_url, symbol, cursor))
+    frames = []
+    backfill.run(SYMBOL, [GAP], url, frames.append, path=str(tmp_path / "catalog.db"), from_id=from_id)
+    assert next_ids[0] == from_id
+    assert np.array_equal(np.sort(pd.concat(frames)["trade_id"].to_numpy()), expected_ids(server, *GAP))
+
+def test_resumes_an_interrupted_range(exchange, tmp_path, monkeypatch):
+    server, url = exchange
+    path = str(tmp_path / "catalog.db")
+    monkeypatch.setattr(backfill, "FLUSH_ROWS", 5000)
+    stored = []
+
+    def failing_sink(frame: pd.DataFrame) -> None:
+        if len(stored) == 2:
+            raise RuntimeError("interrupted")
+        stored.append(frame)
+
+    with pytest.raises(RuntimeError):
+        backfill.run(SYMBOL, [GAP], url, failing_sink, path=path)
+    cursors = catalog.backfill_ranges(SYMBOL, path)
+    assert len(cursors) == 1 and cursors[0]["next_id"] is not None
+    assert not catalog.coverage(SYMBOL, *GAP, path=path).any()
+
+    backfill.run(SYMBOL, catalog.gaps(SYMBOL, *GAP, path=path), url, stored.append, path=path)
+    fetched = pd.concat(stored)["trade_id"].to_numpy()
+    assert len(np.unique(fetched)) == len(fetched)
+    assert np.array_equal(np.sort(fetched), expected_ids(server, *GAP))
+    assert catalog.backfill_ranges(SYMBOL, path) == []
+    assert catalog.coverage(SYMBOL, *GAP, path=path).all()
+    assert catalog.gaps(SYMBOL, *GAP, path=path) == []
+
+def test_throttle_follows_used_weight():
+    throttle = backfill.Throttle()
+    for _ in range(backfill.MAX_CONCURRENCY + 2):
+        throttle.observe(0)
+    assert throttle.concurrency == backfill.MAX_CONCURRENCY
+    throttle.observe(int(backfill.WEIGHT_LIMIT * backfill.WEIGHT_TARGET) + 1)
+    assert throttle.concurrency == backfill.MAX_CONCURRENCY // 2
+    throttle.observe(int(backfill.WEIGHT_LIMIT * backfill.WEIGHT_PAUSE))
+    assert throttle.concurrency == 1 and throttle.paused_until > 0
+
+def test_fetch_page_reports_weight_and_rate_limit(exchange):
+    server, url = exchange
+    server.weight_limit = 4  # Two aggTrades requests a minute
+    cursor = {"start_time": GAP[0], "end_time": GAP[1], "next_id": None}
+    with requests.Session() as session:
+        pages = [backfill.fetch_page(session, url, SYMBOL, cursor) for _ in range(4)]
+    assert pages[0]["trades"] and pages[0]["weight"] == 2
+    limited = next(page for page in pages if page["retry_after"] is not None)  # A minute rollover can only delay it by one request
+    assert limited["trades"] is None and limited["error"] == "HTTP 429" and 1 <= limited["retry_after"] <= 60
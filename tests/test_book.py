@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+
+from src.scale import mock_exchange
+from src.scale.book import OrderBook
+from src.scale.tape import book_dtype
+
+def levels(pairs) -> dict:
+    return {float(price): float(qty) for price, qty in pairs}
+
+def assert_book_matches(book: OrderBook, reference: dict) -> None:
+    assert book.update_id == reference["lastUpdateId"]
+    assert levels(book.bids.items()) == levels(reference["bids"])
+    assert levels(book.asks.items()) == levels(reference["asks"])
+
+def test_diffs_match_the_reference_book():
+    random.seed(0)
+    snapshot, events = mock_exchange.synthetic_depth(500)
+    book = OrderBook()
+    book.load_snapshot(snapshot)
+    for event in events:
+        assert book.apply_diff(event) is True
+    reference = mock_exchange.book_at(snapshot, events, len(events))
+    assert_book_matches(book, reference)
+    assert book.event_time == events[-1]["E"]
+    assert book.best_bid() == float(reference["bids"][0][0]) and book.best_ask() == float(reference["asks"][0][0])
+
+def test_covered_diffs_and_gaps():
+    random.seed(1)
+    snapshot, events = mock_exchange.synthetic_depth(3)
+    book = OrderBook()
+    book.load_snapshot(mock_exchange.book_at(snapshot, events, 1))
+    assert book.apply_diff(events[0]) is None  # Already in the snapshot
+    assert book.apply_diff(events[2]) is False  # events[1] is missing
+    assert_book_matches(book, mock_exchange.book_at(snapshot, events, 1))
+    assert book.apply_diff(events[1]) is True and book.apply_diff(events[2]) is True
+    assert_book_matches(book, mock_exchange.book_at(snapshot, events, 3))
+
+def test_top_and_sample():
+    book = OrderBook()
+    book.load_snapshot({"lastUpdateId": 7, "bids": [["99.5", "2"], ["100", "1"], ["98", "0"]], "asks": [["101", "1"]]})
+    top = book.top(3)
+    assert top["bid_price"][:2].tolist() == [100.0, 99.5] and np.isnan(top["bid_price"][2])
+    assert top["bid_qty"].tolist() == [1.0, 2.0, 0.0]
+    assert np.isnan(top["ask_price"][1:]).all() and top["ask_qty"].tolist() == [1.0, 0.0, 0.0]
+    sample = book.sample(3, book_dtype(3), 1700000000000)[0]
+    assert sample['time'] == 1700000000000 and sample['update_id'] == 7
+    assert sample['mid'] == 100.5 and sample['spread'] == 1.0 and sample['imbalance'] == 0.5
+    assert OrderBook().best_bid() is None and OrderBook().best_ask() is None
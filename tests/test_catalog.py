@@ -0,0 +1,96 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from src.grim import catalog, store
+from src.scale.tape import TRADE_DTYPE
+
+SYMBOL = "BTCUSDT"
+DAY_MS = catalog.DAY_MS
+DAY_MINUTES = catalog.DAY_MINUTES
+FIRST_DAY_MS = 1699920000000  # 2023-11-14T00:00:00Z
+
+def trades(times, ids) -> np.ndarray:
+    records = np.zeros(len(times), dtype=TRADE_DTYPE)
+    records['time'] = times
+    records['trade_id'] = ids
+    records['price'] = 60000.0
+    records['quantity'] = 0.5
+    return records
+
+@pytest.fixture
+def paths(tmp_path):
+    """(store base_dir, catalog path) under tmp_path."""
+    return str(tmp_path / "store"), str(tmp_path / "catalog.db")
+
+def days(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0]: row[1:] for row in conn.execute("SELECT date, rows, min_time, max_time, sources, checksum FROM days")}
+    finally:
+        conn.close()
+
+def test_refresh_tracks_stored_days(paths):
+    base_dir, path = paths
+    assert catalog.is_empty(SYMBOL, path) and catalog.latest_time(SYMBOL, path) is None
+    times = np.concatenate([FIRST_DAY_MS + np.arange(100) * 1000, FIRST_DAY_MS + 2 * DAY_MS + np.arange(50) * 1000])
+    store.write(SYMBOL, trades(times, np.arange(len(times))), base_dir=base_dir)
+    catalog.refresh(SYMBOL, ["20231114", "20231115", "20231116"], "a.csv", base_dir=base_dir, path=path)
+    assert catalog.existing_dates(SYMBOL, path) == {"20231114", "20231116"}
+    assert catalog.latest_time(SYMBOL, path) == int(times[-1]) and not catalog.is_empty(SYMBOL, path)
+    first = days(path)
+    assert first["20231114"][:4] == (100, int(times[0]), int(times[99]), '["a.csv"]')
+
+    store.write(SYMBOL, trades([FIRST_DAY_MS + 500], [1000]), base_dir=base_dir)
+    catalog.refresh(SYMBOL, ["20231114"], "b.csv", base_dir=base_dir, path=path)
+    second = days(path)
+    assert second["20231114"][0] == 101 and second["20231114"][3] == '["a.csv", "b.csv"]'
+    assert second["20231114"][4] != first["20231114"][4] and second["20231116"] == first["20231116"]
+    assert catalog.existing_dates("ETHUSDT", path) == set()
+
+def test_rebuild_matches_incremental_refresh(paths, tmp_path):
+    base_dir, path = paths
+    times = FIRST_DAY_MS + np.arange(0, 3 * DAY_MS, 3600000)
+    store.write(SYMBOL, trades(times, np.arange(len(times))), base_dir=base_dir)
+    catalog.refresh(SYMBOL, ["20231114", "20231115", "20231116"], base_dir=base_dir, path=path)
+    rebuilt = str(tmp_path / "rebuilt.db")
+    assert catalog.rebuild(SYMBOL, base_dir=base_dir, path=rebuilt) == 3
+    assert days(rebuilt) == days(path)
+
+def test_note_folds_batches_until_refreshed(paths):
+    base_dir, path = paths
+    first = trades(FIRST_DAY_MS + np.arange(10) * 1000, np.arange(10))
+    second = trades(FIRST_DAY_MS + DAY_MS - 1000 + np.arange(5) * 1000, np.arange(10, 15))  # Runs into the next day
+    for records, source in ((first, "a.csv"), (second, "api")):
+        store.write(SYMBOL, records, base_dir=base_dir)
+        catalog.note(SYMBOL, records, source, path=path)
+    noted = days(path)
+    assert noted["20231114"] == (11, int(first['time'][0]), int(second['time'][0]), '["a.csv", "api"]', None)
+    assert noted["20231115"][:4] == (4, int(second['time'][1]), int(second['time'][-1]), '["api"]')
+    catalog.rebuild(SYMBOL, base_dir=base_dir, path=path)
+    assert days(path)["20231114"][:4] == noted["20231114"][:4] and days(path)["20231114"][4] is not None
+
+def test_coverage_and_gaps(paths):
+    base_dir, path = paths
+    minute = catalog.MINUTE_MS
+    times = FIRST_DAY_MS + np.array([0, 1, 2, 10, 1439]) * minute + 500  # Minutes 0-2, 10 and the day's last
+    records = trades(np.append(times, FIRST_DAY_MS + DAY_MS + 5 * minute), np.arange(6))
+    store.write(SYMBOL, records, base_dir=base_dir)
+    catalog.note(SYMBOL, records, path=path)
+    assert catalog.has_coverage(SYMBOL, path) and not catalog.has_coverage("ETHUSDT", path)
+    start, end = FIRST_DAY_MS + 30000, FIRST_DAY_MS + DAY_MS + 10 * minute
+    flags = catalog.coverage(SYMBOL, start, end, path=path)
+    assert len(flags) == DAY_MINUTES + 10 and np.flatnonzero(flags).tolist() == [0, 1, 2, 10, 1439, DAY_MINUTES + 5]
+    assert catalog.gaps(SYMBOL, start, end, path=path) == [
+        (FIRST_DAY_MS + 3 * minute, FIRST_DAY_MS + 10 * minute), (FIRST_DAY_MS + 11 * minute, FIRST_DAY_MS + 1439 * minute),
+        (FIRST_DAY_MS + DAY_MS, FIRST_DAY_MS + DAY_MS + 5 * minute), (FIRST_DAY_MS + DAY_MS + 6 * minute, end)]
+
+    conn = catalog.connect(path)
+    with conn:
+        catalog.mark_checked(conn, SYMBOL, FIRST_DAY_MS + 3 * minute + 1, FIRST_DAY_MS + DAY_MS + 5 * minute)  # Whole minutes only
+    conn.close()
+    assert catalog.gaps(SYMBOL, start, end, path=path) == [(FIRST_DAY_MS + 3 * minute, FIRST_DAY_MS + 4 * minute),
+                                                          (FIRST_DAY_MS + DAY_MS + 6 * minute, end)]
+    assert not catalog.coverage(SYMBOL, start, end, checked=False, path=path)[4]
+    assert catalog.gaps(SYMBOL, end, start, path=path) == []
@@ -0,0 +1,158 @@
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.grim import catalog, formats, grim
+
+DAY_START_MS = 1700006400000  # 2023-11-15T00:00:00Z
+DAY = DAY_START_MS // formats.DAY_MS
+
+def write_lines(path, lines) -> str:
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+def aggtrade_rows(count, scale=1):
+    return [f"{100 + i},{60000 + i}.5,0.25,{200 + i},{200 + i},{(DAY_START_MS + i * 1000) * scale},true,true" for i in range(count)]
+
+def cdd_rows(count, scale):
+    """CryptoDataDownload minute bars, newest first, with times in seconds (scale=1) or milliseconds (scale=1000)."""
+    rows = []
+    for i in reversed(range(count)):
+        unix = (DAY_START_MS // 1000 + i * 60) * scale
+        rows.append(f"{unix},2023-11-15 00:{i:02d}:00,BTC/USD,60000,60010,59990,{60000 + i},1.5,90000")
+    return rows
+
+@pytest.mark.parametrize("scale, unit", [(1, "ms"), (1000, "us")])
+def test_sniff_headerless_aggtrades(tmp_path, scale, unit):
+    path = write_lines(tmp_path / "BTCUSDT-aggTrades-2023-11-15.csv", aggtrade_rows(3, scale))
+    source = formats.sniff(path)
+    assert (source["name"], source["skiprows"], source["unit"]) == ("binance_aggtrades", 0, unit)
+    assert source["columns"] == formats.BINANCE_AGGTRADE_COLUMNS
+
+def test_sniff_headered_and_cdd_files(tmp_path):
+    header = ",".join(formats.BINANCE_AGGTRADE_COLUMNS)
+    source = formats.sniff(write_lines(tmp_path / "aggTrades.csv", [header] + aggtrade_rows(2)))
+    assert (source["name"], source["skiprows"]) == ("binance_aggtrades", 1)
+    banner, cdd_header = "https://www.CryptoDataDownload.com", "unix,date,symbol,open,high,low,close,Volume BTC,Volume USD"
+    source = formats.sniff(write_lines(tmp_path / "Bitstamp_BTCUSD_minute.csv", [banner, cdd_header] + cdd_rows(3, 1)))
+    assert (source["name"], source["skiprows"], source["unit"]) == ("bitstamp_ohlcv", 2, "s")
+    source = formats.sniff(write_lines(tmp_path / "Bitfinex_BTCUSD_minute.csv", [banner, cdd_header] + cdd_rows(3, 1000)))
+    assert (source["name"], source["unit"]) == ("bitfinex_ohlcv", "ms")
+    source = formats.sniff(write_lines(tmp_path / "BTCUSDT_20231115.csv", ["timestamp,price,quantity,quoteQty,tradeId,symbol",
+                                                                          "2023-11-15T00:00:00Z,60000.0,0.5,30000.0,1,BTCUSDT"]))
+    assert (source["name"], source["unit"]) == ("scale_csv", "iso")
+    assert formats.sniff(write_lines(tmp_path / "other.csv", ["a,b,c", "1,2,3"])) is None
+    assert formats.sniff(str(tmp_path / "missing.csv")) is None
+
+def test_read_batches_normalises_times(tmp_path):
+    rows = aggtrade_rows(5, 1000)
+    rows[2] = rows[2].replace("60002.5", "")
+    path = write_lines(tmp_path / "aggTrades.csv", rows)
+    source = formats.sniff(path)
+    batches = list(formats.read_batches(path, source, chunksize=2))
+    assert len(batches) == 3
+    batch = pd.concat(batches)
+    assert list(batch.columns) == ["time", "price", "quantity", "trade_id"]
+    assert batch["trade_id"].tolist() == [100, 101, 103, 104]
+    assert batch["time"].tolist() == [DAY_START_MS + i * 1000 for i in (0, 1, 3, 4)]
+    coverage = formats.scan(path, source)
+    assert (coverage["min_time"], coverage["max_time"], coverage["days"]) == (DAY_START_MS, DAY_START_MS + 4000, [[DAY, DAY]])
+
+def test_read_batches_from_cdd_bars(tmp_path):
+    path = write_lines(tmp_path / "Bitstamp_BTCUSD_minute.csv", ["https://www.CryptoDataDownload.com",
+                                                                "unix,date,symbol,open,high,low,close,Volume BTC,Volume USD"] + cdd_rows(4, 1))
+    source = formats.sniff(path)
+    batch = next(formats.read_batches(path, source))
+    assert list(batch.columns) == ["time", "price", "quantity"]
+    assert batch["time"].tolist() == [DAY_START_MS + i * 60000 for i in (3, 2, 1, 0)]
+    assert batch["price"].tolist() == [60003.0, 60002.0, 60001.0, 60000.0]
+    assert formats.scan(path, source)["min_time"] == DAY_START_MS
+
+def test_trade_ids_replace_hashed_ids():
+    times = np.array([DAY_START_MS, DAY_START_MS + 60000, DAY_START_MS + 120000])
+    ids = formats.trade_ids(pd.Series(["9007199254740993", "9f86d081884c7d659a2feaa0c55ad015", "7"]), times)
+    assert ids[0] == 9007199254740993 and ids[2] == 7
+    assert ids[1] == formats.synthetic_ids([times[1]], formats.LEGACY_SOURCE_ID)[0] and ids[1] & formats.SYNTHETIC_ID_FLAG
+    bars = formats.synthetic_ids(times, formats.FORMATS["bitstamp_ohlcv"]["source_id"])
+    assert len(set(bars) | set(formats.synthetic_ids(times, 2))) == 6 and (bars & ((1 << formats.SYNTHETIC_TIME_BITS) - 1) == times).all()
+
+def test_iso_timestamps_and_day_numbers():
+    times = np.array([DAY_START_MS, DAY_START_MS + 86399999])
+    expected = pd.to_datetime(times, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ')
+    assert formats.iso_timestamps(times).tolist() == list(expected)
+    assert formats.to_epoch_ms(pd.Series(list(expected)), "iso").tolist() == [DAY_START_MS, DAY_START_MS + 86399000]
+    assert formats.day_numbers(["20231115", "20231116"]).tolist() == [DAY, DAY + 1]
+
+def test_scan_finds_day_runs(tmp_path):
+    times = [DAY_START_MS + day * formats.DAY_MS for day in (0, 1, 2, 5, 7, 8)]
+    path = write_lines(tmp_path / "aggTrades.csv", [f"{i},60000.5,0.25,{i},{i},{t},true,true" for i, t in enumerate(times)])
+    coverage = formats.scan(path, formats.sniff(path))
+    assert coverage["days"] == [[DAY, DAY + 2], [DAY + 5, DAY + 5], [DAY + 7, DAY + 8]]
+    assert formats.runs_overlap(coverage["days"], np.array([DAY + 3, DAY + 5]))
+    assert not formats.runs_overlap(coverage["days"], np.array([DAY + 3, DAY + 4, DAY + 6]))
+
+@pytest.mark.parametrize("newest_first", [False, True])
+def test_seek_blocks_read_only_the_wanted_days(tmp_path, monkeypatch, newest_first):
+    monkeypatch.setattr(formats, "SEEK_INDEX_ROWS", 4)
+    times = DAY_START_MS + np.arange(60) * (formats.DAY_MS // 10)  # Ten rows a day over six days
+    rows = [f"{i},{60000 + i}.5,0.25,{i},{i},{t},true,true" for i, t in enumerate(times)]
+    path = write_lines(tmp_path / "aggTrades.csv", rows[::-1] if newest_first else rows)
+    source = formats.sniff(path)
+    coverage = formats.scan(path, source)
+    assert len(coverage["offsets"]) == 15
+    wanted = [(DAY_START_MS + 2 * formats.DAY_MS, DAY_START_MS + 3 * formats.DAY_MS)]
+    blocks = formats.seek_blocks(coverage["offsets"], os.path.getsize(path), wanted)
+    assert 0 < len(blocks) < 15
+    full = next(formats.read_batches(path, source)).set_index("trade_id")
+    seeked = pd.concat(formats.read_blocks(path, source, blocks)).set_index("trade_id")
+    assert len(seeked) < len(full)
+    pd.testing.assert_frame_equal(seeked, full.loc[seeked.index])
+    in_day = full[(full["time"] >= wanted[0][0]) & (full["time"] < wanted[0][1])]
+    assert len(in_day) == 10 and set(in_day.index) <= set(seeked.index)
+
+def test_scan_from_the_last_processed_line(tmp_path):
+    rows = aggtrade_rows(3)
+    path = write_lines(tmp_path / "aggTrades.csv", rows)
+    processed = os.path.getsize(path)
+    with open(path, "a") as f:
+        f.write(f"9,60000.5,0.25,9,9,{DAY_START_MS + 2 * formats.DAY_MS},true,true\n")
+    start = formats.line_start(path, processed)
+    assert start == processed - len(rows[-1]) - 1
+    coverage = formats.scan(path, formats.sniff(path), start)
+    assert coverage["min_time"] == DAY_START_MS + 2000 and coverage["offsets"] is None
+    assert coverage["days"] == [[DAY, DAY], [DAY + 2, DAY + 2]]
+    assert formats.merge_runs([[DAY, DAY + 1]], coverage["days"]) == [[DAY, DAY + 2]]
+
+def test_unchanged_files_are_not_rescanned(tmp_path, monkeypatch):
+    zip_dir = tmp_path / "zip"
+    zip_dir.mkdir()
+    first = write_lines(zip_dir / "BTCUSDT-aggTrades-2023-11-15.csv", aggtrade_rows(3))
+    second = write_lines(zip_dir / "BTCUSDT-aggTrades-2023-11-16.csv", aggtrade_rows(3, 1000))
+    monkeypatch.setattr(grim, "ZIP_DATA_DIR", str(zip_dir))
+    monkeypatch.setattr(catalog, "CATALOG_PATH", str(tmp_path / "catalog.db"))
+    grim.process_csv_files(set())
+    cached = catalog.source_files()
+    assert sorted(cached) == sorted([first, second])
+    assert cached[first]["format"] == "binance_aggtrades" and cached[first]["days"] == [[DAY, DAY]]
+
+    scanned = []
+    monkeypatch.setattr(grim, "source_fingerprint", lambda path, source: scanned.append(path))
+    grim.process_csv_files(set())
+    assert scanned == []
+    os.utime(second, ns=(0, 0))
+    monkeypatch.setattr(grim, "Pool", ThreadPool)  # Keep the workers in this process to see the rescan
+    grim.process_csv_files(set())
+    assert scanned == [second]
+
+def test_split_lines_cover_every_row(tmp_path):
+    header = ",".join(formats.BINANCE_AGGTRADE_COLUMNS)
+    path = write_lines(tmp_path / "aggTrades.csv", [header] + aggtrade_rows(37))
+    source = formats.sniff(path)
+    blocks = formats.split_lines(path, source, 4)
+    assert len(blocks) > 1 and blocks[-1][1] == os.path.getsize(path)
+    assert all(end == start for (_, end), (start, _) in zip(blocks, blocks[1:]))
+    split = pd.concat(formats.read_blocks(path, source, blocks), ignore_index=True)
+    pd.testing.assert_frame_equal(split, next(formats.read_batches(path, source)).reset_index(drop=True))
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from src.grim import catalog, grim, rollups, store
+from src.scale import mock_exchange
+from src.scale.tape import TRADE_DTYPE, symbol_dir, tape_path
+
+@pytest.fixture
+def grim_dirs(tmp_path, monkeypatch):
+    """Point G.R.I.M.'s store, candles, catalog and source directories at `tmp_path`."""
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(rollups, "CANDLE_DIR", str(tmp_path / "candles"))
+    monkeypatch.setattr(catalog, "CATALOG_PATH", str(tmp_path / "catalog.db"))
+    monkeypatch.setattr(grim, "OUTPUT_BASE_DIR", str(tmp_path / "grim"))
+    monkeypatch.setattr(grim, "SCALE_DATA_DIR", str(tmp_path / "scale"))
+    monkeypatch.setattr(grim, "ZIP_DATA_DIR", str(tmp_path / "zip"))
+    os.makedirs(tmp_path / "zip")
+    return tmp_path
+
+def write_tapes(scale_dir: str, times: np.ndarray, ids: np.ndarray) -> None:
+    """Record trades in S.C.A.L.E.'s daily binary tapes."""
+    days = times // 86400000
+    for day in np.unique(days):
+        tape = np.zeros(int((days == day).sum()), dtype=TRADE_DTYPE)
+        tape['time'], tape['trade_id'], tape['price'], tape['quantity'] = times[days == day], ids[days == day], 40000.0, 0.1
+        path = tape_path(symbol_dir(scale_dir, grim.SYMBOL), np.datetime64(int(day), 'D').astype(str).replace("-", ""))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tape.tofile(path)
+
+def snapshot(root) -> dict:
+    """Size and mtime of every file under `root` but the catalog."""
+    return {os.path.join(d, f): (os.path.getsize(os.path.join(d, f)), os.stat(os.path.join(d, f)).st_mtime_ns)
+            for d, _, files in os.walk(root) for f in files if not f.startswith("catalog.db")}
+
+def segments(root) -> tuple:
+    """Store segment and CSV segment files under `root`."""
+    files = [(os.path.basename(d), f) for d, _, names in os.walk(root) for f in names]
+    return ([f for _, f in files if f.endswith(store.SEGMENT_EXTENSION)],
+            [f for d, f in files if d == grim.CSV_SEGMENT_DIR])
+
+def test_tape_ahead_of_api_adds_no_segments(grim_dirs, monkeypatch):
+    now = int(time.time() * 1000)
+    start = (now - 1800000) // 60000 * 60000
+    times = np.arange(start, now - 60000, 2000, dtype=np.int64)
+    ids = np.arange(1, len(times) + 1, dtype=np.int64)
+    messages = [{"a": int(a), "p": "40000.00", "q": "0.10000", "f": 0, "l": 0, "T": int(t), "m": True, "M": True, "s": grim.SYMBOL}
+                for a, t in zip(ids, times)]
+    server = mock_exchange.make_server([], port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+    monkeypatch.setattr(grim, "BASE_URL", f"{url}/aggTrades")
+    monkeypatch.setattr(grim, "PING_URL", f"{url}/ping")
+    monkeypatch.setattr(grim, "EARLIEST_TIMESTAMP", datetime.fromtimestamp(start / 1000, tz=timezone.utc))
+    monkeypatch.setattr(grim, "API_START_DATE", datetime.fromtimestamp(start / 1000, tz=timezone.utc))
+    try:
+        compacted_on, csv_segments = None, 0
+        for lo, hi in ((0, len(ids) // 2), (len(ids) // 2, len(ids))):
+            # The exchange and S.C.A.L.E. have both moved on past the API watermark (one trade in)
+            server.tapes[grim.SYMBOL] = (messages[:hi], ids[:hi].tolist(), times[:hi].tolist())
+            write_tapes(grim.SCALE_DATA_DIR, times[:hi], ids[:hi])
+            catalog.set_watermark(f"api:{grim.SYMBOL}", int(ids[0]), int(times[0]))
+            compacted_on = grim.run_cycle(compacted_on=compacted_on)
+            assert np.array_equal(store.query(grim.SYMBOL, columns=['trade_id'], as_frame=False)['trade_id'], ids[:hi])
+            csv_segments += len(np.unique(times[lo:hi] // 86400000))  # The tape's new rows only
+            store_segments, csv_files = segments(grim_dirs)
+            assert store_segments == [] and len(csv_files) == csv_segments
+        before = snapshot(grim_dirs)
+        grim.run_cycle(compacted_on=compacted_on)
+        assert snapshot(grim_dirs) == before
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import requests
+
+from src.scale import metrics
+
+def test_window_quantiles_and_roll():
+    histogram = metrics.LatencyHistogram()
+    samples = np.linspace(0.001, 0.1, 1000)  # 1 to 100 ms
+    histogram.record_many(samples[:500])
+    for sample in samples[500:]:
+        histogram.record(sample)
+    summary = histogram.roll()
+    assert summary["count"] == 1000 and summary["max"] == pytest.approx(0.1)
+    for q in metrics.QUANTILES:
+        assert summary[q] == pytest.approx(np.quantile(samples, q), rel=0.1)
+    histogram.record(-1.0)  # Clock skew counts as zero
+    summary = histogram.roll()
+    assert summary["count"] == 1 and summary["max"] == 0.0 and summary[0.5] == 0.0
+    assert histogram.total == 1001 and histogram.sum == pytest.approx(samples.sum())
+    assert histogram.roll() == {"count": 0, "max": 0.0, **{q: 0.0 for q in metrics.QUANTILES}}
+
+def test_record_and_record_many_agree():
+    samples = np.random.default_rng(0).lognormal(-7, 2, 5000)
+    one, many = metrics.LatencyHistogram(), metrics.LatencyHistogram()
+    for sample in samples:
+        one.record(sample)
+    many.record_many(samples)
+    assert np.array_equal(one.counts, many.counts) and one.roll() == many.roll()
+
+def test_export_file_and_endpoint(tmp_path):
+    latency = metrics.LatencyMetrics(["parse", "persist"], labels={"worker": "0"})
+    latency["parse"].record_many(np.full(10, 0.002))
+    latency.path = str(tmp_path / "metrics" / "worker_0.prom")
+    latency.interval = 10
+    latency.tick(latency.last_report + 1)
+    assert not (tmp_path / "metrics").exists()
+    latency.tick(latency.last_report + 10)
+    text = (tmp_path / "metrics" / "worker_0.prom").read_text()
+    assert 'scale_latency_seconds_count{stage="parse",worker="0"} 10' in text
+    assert 'scale_latency_seconds{stage="persist",worker="0",quantile="0.99"} 0.000000' in text
+    assert latency["parse"].roll()["count"] == 0  # The export closed the window
+
+    latency.serve("127.0.0.1", 0)
+    try:
+        response = requests.get(f"http://127.0.0.1:{latency.server.server_address[1]}/metrics", timeout=5)
+        assert response.status_code == 200 and response.text == text
+    finally:
+        latency.close()
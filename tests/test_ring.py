@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from src.scale import ring
+from src.scale.tape import BAR_DTYPE, TRADE_DTYPE
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CAPACITY = 8
+
+def trades(start: int, count: int) -> np.ndarray:
+    records = np.zeros(count, dtype=TRADE_DTYPE)
+    records['trade_id'] = np.arange(start, start + count)
+    records['time'] = 1700000000000 + records['trade_id']
+    return records
+
+@pytest.fixture
+def writer():
+    """A trade ring under a per-process name, so test runs never touch a live capture's segments."""
+    shared = ring.SharedRing.create(ring.ring_name(f"TEST{os.getpid()}", "trades"), TRADE_DTYPE, CAPACITY)
+    yield shared
+    shared.close()
+
+def test_latest_wraps_around(writer):
+    for record in trades(1, 5):
+        writer.publish(tuple(record))
+    assert writer.written() == 5 and writer.latest()['trade_id'].tolist() == [1, 2, 3, 4, 5]
+    writer.publish_many(trades(6, 6))
+    assert writer.written() == 11 and writer.latest()['trade_id'].tolist() == list(range(4, 12))
+    view, end = writer.window(3)
+    assert end == 11 and view['trade_id'].tolist() == [9, 10, 11] and view.base is not None  # Zero-copy
+    writer.publish_many(trades(12, 20))  # More than the capacity in one batch keeps only the newest records
+    assert writer.latest()['trade_id'].tolist() == list(range(24, 32))
+
+def test_reader_detects_being_lapped(writer):
+    writer.publish_many(trades(1, 7))
+    writer.publish_many(trades(8, 8))
+    reader = ring.SharedRing.attach(writer.shm.name, TRADE_DTYPE)
+    full, full_end = reader.window()
+    part, part_end = reader.window(4)
+    assert full['trade_id'].tolist() == list(range(8, 16)) and part['trade_id'].tolist() == [12, 13, 14, 15]
+    writer.publish_many(trades(16, 4))
+    assert not reader.still_valid(full_end, len(full)) and reader.still_valid(part_end, len(part))
+    writer.publish(tuple(trades(20, 1)[0]))
+    assert not reader.still_valid(part_end, len(part))
+    del full, part
+    reader.close()
+
+def test_attach_checks_the_ring(writer):
+    assert ring.SharedRing.attach(ring.ring_name(f"TEST{os.getpid()}", "missing"), TRADE_DTYPE) is None
+    with pytest.raises(ValueError):
+        ring.SharedRing.attach(writer.shm.name, BAR_DTYPE)
+
+def test_reader_exit_leaves_the_ring(writer):
+    writer.publish_many(trades(1, 3))
+    script = ("import sys; from src.scale.ring import SharedRing; from src.scale.tape import TRADE_DTYPE; "
+              "reader = SharedRing.attach(sys.argv[1], TRADE_DTYPE); print(reader.latest()['trade_id'].tolist()); reader.close()")
+    result = subprocess.run([sys.executable, "-c", script, writer.shm.name], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[1, 2, 3]"
+    reader = ring.SharedRing.attach(writer.shm.name, TRADE_DTYPE)
+    assert reader is not None and reader.written() == 3
+    reader.close()
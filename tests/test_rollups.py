@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src.grim import rollups, store
+from src.scale.tape import BAR_DTYPE, TRADE_DTYPE
+
+SYMBOL = "BTCUSDT"
+MONTH_END_MS = 1701388800000  # 2023-12-01T00:00:00Z
+
+def trades(times, seed=0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    records = np.zeros(len(times), dtype=TRADE_DTYPE)
+    records['time'] = times
+    records['trade_id'] = np.arange(len(times)) + seed * 1000000
+    records['price'] = np.round(60000 + rng.normal(0, 20, len(times)), 2)
+    records['quantity'] = np.round(rng.random(len(times)), 4)
+    return records
+
+def assert_bars_equal(actual: np.ndarray, expected: np.ndarray) -> None:
+    for field in BAR_DTYPE.names:
+        assert np.allclose(actual[field], expected[field]), field
+
+@pytest.fixture
+def dirs(tmp_path):
+    """(store base_dir, candle base_dir) under tmp_path."""
+    return str(tmp_path / "store"), str(tmp_path / "candles")
+
+def write(records, dirs) -> None:
+    store_dir, candle_dir = dirs
+    store.write(SYMBOL, records, base_dir=store_dir)
+    rollups.update(SYMBOL, np.sort(records, order=['time', 'trade_id']), base_dir=candle_dir, store_dir=store_dir)
+
+def test_incremental_updates_match_a_rebuild(dirs, tmp_path):
+    store_dir, candle_dir = dirs
+    times = np.sort(MONTH_END_MS + np.random.default_rng(1).integers(-3 * 3600000, 3 * 3600000, 5000))
+    records = trades(times)
+    for part in np.array_split(np.arange(len(records)), 4):  # Later batches land in buckets earlier ones opened
+        write(records[part], dirs)
+    write(trades(times[:50] + 7, seed=2), dirs)  # A late batch back in the first hour
+    stored = store.query(SYMBOL, base_dir=store_dir, as_frame=False)
+    rebuilt_dir = str(tmp_path / "rebuilt")
+    assert rollups.rebuild(SYMBOL, base_dir=rebuilt_dir, store_dir=store_dir) > 0
+    for resolution, interval_ms in rollups.RESOLUTIONS.items():
+        bars = rollups.candles(SYMBOL, resolution, base_dir=candle_dir, as_frame=False)
+        expected = rollups.trade_bars(stored["time"], stored["price"], stored["quantity"], interval_ms)
+        assert_bars_equal(bars, expected)
+        assert_bars_equal(rollups.candles(SYMBOL, resolution, base_dir=rebuilt_dir, as_frame=False), expected)
+    assert list(rollups.list_months(SYMBOL, "1m", candle_dir)) == ["202311", "202312"]
+
+def test_candles_range_and_columns(dirs):
+    store_dir, candle_dir = dirs
+    write(trades(MONTH_END_MS + np.arange(-600, 600) * 1000), dirs)
+    frame = rollups.candles(SYMBOL, "1m", "2023-11-30T23:55:00Z", MONTH_END_MS + 300000, ["open_time", "trades"], base_dir=candle_dir)
+    assert list(frame.columns) == ["open_time", "trades"]
+    assert frame["open_time"].tolist() == [MONTH_END_MS + i * 60000 for i in range(-5, 5)]
+    assert (frame["trades"] == 60).all()
+    with pytest.raises(ValueError):
+        rollups.candles(SYMBOL, "2m", base_dir=candle_dir)
+    with pytest.raises(ValueError):
+        rollups.candles(SYMBOL, "1m", columns=["side"], base_dir=candle_dir)
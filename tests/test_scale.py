@@ -0,0 +1,322 @@
+import csv
+import json
+import os
+import random
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+
+from src.scale import mock_exchange, scale, tape
+
+START_MS = 1700000000000  # Far enough from midnight that the tape stays within one day
+MIDNIGHT_MS = 1700006400000  # 2023-11-15T00:00:00Z
+SYMBOLS = ["BTCUSDT", "ETHUSDT"]
+TRADES = 450  # Per symbol
+DROP_AFTER = 120  # Messages per connection before the mock exchange drops the client
+
+class StopCapture(Exception):
+    """Raised from a patched capture hook to leave the otherwise endless stream loop."""
+
+@pytest.fixture
+def exchange():
+    """A mock exchange on an ephemeral port serving TRADES trades per symbol over REST and a stream that drops each client after DROP_AFTER messages."""
+    random.seed(0)
+    messages = [m for symbol in SYMBOLS for m in mock_exchange.synthetic_trades(TRADES, start_time_ms=START_MS, symbol=symbol)]
+    server = mock_exchange.make_server(sorted(messages, key=lambda m: m["T"]), port=0, drop_after=DROP_AFTER)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """Point S.C.A.L.E.'s output and cursor at tmp_path and reset its capture state."""
+    monkeypatch.setattr(scale, "OUTPUT_BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(scale, "LEGACY_CURSOR_FILE", str(tmp_path / scale.CURSOR_FILE_NAME))
+    monkeypatch.setattr(scale, "RETRY_DELAY", 0)
+    return tmp_path
+
+def urls(server) -> tuple:
+    """(stream base URL, aggTrades REST URL) of a mock exchange."""
+    port = server.server_address[1]
+    return f"ws://127.0.0.1:{port}", f"http://127.0.0.1:{port}/api/v3/aggTrades"
+
+def csv_ids(path) -> list:
+    with open(path, newline='') as f:
+        return [int(row["tradeId"]) for row in csv.DictReader(f)]
+
+def stored_ids(root, symbol: str) -> list:
+    """A symbol's trade IDs in the order they were appended to its daily binary tapes."""
+    tapes = tape.list_tapes(tape.symbol_dir(str(root), symbol))
+    return [int(i) for path in tapes.values() for i in tape.open_tape(path)['trade_id']]
+
+def expected_bars(trades: list, interval_ms: int) -> pd.DataFrame:
+    """Bars for `trades` computed in one pass with pandas, to check the incremental builder against."""
+    frame = pd.DataFrame(trades)
+    frame["open_time"] = frame["time"] - frame["time"] % interval_ms
+    frame["quote"] = frame["price"] * frame["quantity"]
+    grouped = frame.groupby("open_time")
+    return pd.DataFrame({
+        "open": grouped["price"].first(), "high": grouped["price"].max(), "low": grouped["price"].min(),
+        "close": grouped["price"].last(), "volume": grouped["quantity"].sum(),
+        "vwap": grouped["quote"].sum() / grouped["quantity"].sum(), "trades": grouped.size(),
+    }).reset_index()
+
+def assert_bars_match(bars: np.ndarray, expected: pd.DataFrame) -> None:
+    for column in ["open_time", "open", "high", "low", "close", "trades"]:
+        assert bars[column].tolist() == expected[column].tolist()
+    for column in ["volume", "vwap"]:
+        assert np.allclose(bars[column], expected[column])
+
+def test_parse_trade():
+    trade = mock_exchange.synthetic_trades(1, start_id=7, start_time_ms=1700000000123)[0]
+    data = scale.parse_trade(trade, "BTCUSDT")
+    assert data["tradeId"] == 7 and data["time"] == trade["T"] and data["timestamp"] == "2023-11-14T22:13:20Z"
+    assert data["price"] == float(trade["p"]) and data["quantity"] == float(trade["q"])
+    assert data["quoteQty"] == pytest.approx(data["price"] * data["quantity"])
+
+def test_stream_catches_up_after_a_drop(exchange, output_dir, monkeypatch):
+    captures = {symbol: scale.SymbolCapture(symbol, ring_trades=0) for symbol in SYMBOLS}
+    saved = {symbol: [] for symbol in SYMBOLS}
+
+    def recorder(write, ids: list):
+        def record(data: dict, *args) -> bool:
+            ids.append(data["tradeId"])
+            if all(len(ids) == TRADES for ids in saved.values()):
+                raise StopCapture
+            return write(data, *args)
+        return record
+
+    for symbol, capture in captures.items():
+        monkeypatch.setattr(capture.writer, "write", recorder(capture.writer.write, saved[symbol]))
+    with requests.Session() as session, pytest.raises(StopCapture):
+        scale.stream_trades(captures, session, *urls(exchange))
+    for capture in captures.values():
+        capture.close()
+    for symbol in SYMBOLS:  # The first connection, then fromId pages; replayed frames are skipped
+        assert saved[symbol] == list(range(1, TRADES + 1))
+
+def test_catch_up_resumes_from_saved_cursor(exchange, output_dir, monkeypatch):
+    monkeypatch.setattr(scale, "CATCHUP_BATCH_SIZE", 100)
+    scale.save_cursor("BTCUSDT", 50)
+    capture = scale.SymbolCapture("BTCUSDT", ring_trades=0)
+    assert capture.cursor == 50
+    with requests.Session() as session:
+        assert capture.catch_up(session, urls(exchange)[1])
+    capture.close()
+    assert stored_ids(output_dir, "BTCUSDT") == list(range(51, TRADES + 1))
+    assert scale.load_cursor("BTCUSDT") == TRADES
+
+def test_load_cursor_falls_back_to_the_legacy_map(output_dir):
+    with open(scale.LEGACY_CURSOR_FILE, 'w') as f:
+        json.dump({"ETHUSDT": 7}, f)
+    assert scale.load_cursor("ETHUSDT") == 7 and scale.load_cursor("BTCUSDT") is None
+    scale.save_cursor("ETHUSDT", 9)
+    assert scale.load_cursor("ETHUSDT") == 9
+
+def test_capture_writes_under_its_output_dir(output_dir):
+    other = output_dir / "other"
+    capture = scale.SymbolCapture("BTCUSDT", ["csv"], ["1m"], ring_trades=0, output_dir=str(other))
+    for trade in mock_exchange.synthetic_trades(3, start_time_ms=START_MS):
+        capture.process_trade(scale.parse_trade(trade, "BTCUSDT"), echo=False)
+    capture.close()
+    assert scale.load_cursor("BTCUSDT", str(other)) == 3 and scale.load_cursor("BTCUSDT") is None
+    assert csv_ids(other / "BTCUSDT" / "202311" / "csv" / "20231114.csv") == [1, 2, 3]
+    assert scale.OUTPUT_BASE_DIR == str(output_dir) and sorted(os.listdir(output_dir)) == ["other"]
+
+def test_writer_group_commits_and_rolls_over_days(output_dir):
+    trades = mock_exchange.synthetic_trades(10)
+    for i, trade in enumerate(trades):
+        trade["T"] = MIDNIGHT_MS + (i - 5) * 1000  # Five trades on each side of midnight
+    root = output_dir / "BTCUSDT" / "202311"
+    day1 = root / "csv" / "20231114.csv"
+    writer = scale.TradeWriter("BTCUSDT", list(scale.SINKS), max_trades=4, max_delay=3600)
+    for trade in trades[:3]:
+        assert writer.write(scale.parse_trade(trade, "BTCUSDT"))
+    assert not writer.flush_due() and csv_ids(day1) == []
+    writer.write(scale.parse_trade(trades[3], "BTCUSDT"))
+    assert writer.flush_due()
+    writer.flush()
+    assert csv_ids(day1) == [1, 2, 3, 4] and writer.last_trade_id == 4
+
+    for trade in trades[4:]:
+        writer.write(scale.parse_trade(trade, "BTCUSDT"))
+    writer.close()
+    assert csv_ids(day1) == [1, 2, 3, 4, 5]
+    assert csv_ids(root / "csv" / "20231115.csv") == [6, 7, 8, 9, 10]
+    assert stored_ids(output_dir, "BTCUSDT") == list(range(1, 11))
+    with sqlite3.connect(root / "sqlite" / "20231115.db") as conn:
+        assert [row[0] for row in conn.execute("SELECT tradeId FROM trades")] == [6, 7, 8, 9, 10]
+    with open(root / "txt" / "20231115.txt") as f:
+        assert [json.loads(line)["tradeId"] for line in f] == [6, 7, 8, 9, 10]
+
+def test_failed_sink_keeps_its_trades(output_dir, monkeypatch):
+    trades = [scale.parse_trade(trade, "BTCUSDT") for trade in mock_exchange.synthetic_trades(6, start_time_ms=START_MS)]
+    day = output_dir / "BTCUSDT" / "202311" / "csv" / "20231114.csv"
+    writer = scale.TradeWriter("BTCUSDT", ["csv", "bin"], max_trades=100, max_delay=3600)
+    for data in trades[:3]:
+        writer.write(data)
+    writer.flush()
+    assert writer.last_trade_id == 3
+
+    def failing_write(batch):
+        raise OSError("disk full")
+
+    sink = writer.sinks[1]
+    monkeypatch.setattr(sink, "write", failing_write)
+    for data in trades[3:5]:
+        writer.write(data)
+    writer.flush()
+    assert writer.last_trade_id == 3 and csv_ids(day) == [1, 2, 3, 4, 5]
+    next_day = dict(trades[5], timestamp="2023-11-15T00:00:00.000Z")
+    assert not writer.write(next_day)  # Cannot roll over while the tape still misses trades of this day
+    monkeypatch.undo()
+    writer.write(trades[5])
+    writer.flush()
+    assert writer.last_trade_id == 6 and csv_ids(day) == list(range(1, 7))
+    writer.close()
+    assert stored_ids(output_dir, "BTCUSDT") == list(range(1, 7))
+
+def test_sinks_must_implement_write(output_dir):
+    with pytest.raises(TypeError):
+        scale.TradeSink(str(output_dir))
+
+    class NoWrite(scale.TradeSink):
+        name = "none"
+
+    with pytest.raises(TypeError):
+        NoWrite(str(output_dir))
+    assert all(isinstance(sink(str(output_dir)), scale.TradeSink) for sink in scale.SINKS.values())
+
+def test_binary_sink_repairs_a_torn_record(output_dir):
+    trades = [scale.parse_trade(trade, "BTCUSDT") for trade in mock_exchange.synthetic_trades(3, start_time_ms=START_MS)]
+    path = tape.tape_path(str(output_dir), "20231114")
+    sink = scale.BinarySink(str(output_dir))
+    sink.open("20231114")
+    sink.write(trades[:2])
+    sink.handle.write(b"\0" * 5)  # A crash mid-append
+    sink.close()
+    sink.open("20231114")
+    sink.write(trades[2:])
+    sink.close()
+    records = tape.open_tape(path)
+    assert os.path.getsize(path) == 3 * tape.TRADE_DTYPE.itemsize
+    assert records['trade_id'].tolist() == [1, 2, 3] and records['time'].tolist() == [d['time'] for d in trades]
+
+def test_bar_builder_matches_a_batch_resample(output_dir):
+    trades = [scale.parse_trade(trade, "BTCUSDT") for trade in mock_exchange.synthetic_trades(3000, start_time_ms=START_MS)]
+    builder = scale.BarBuilder("BTCUSDT", "1s")
+    closed = [bar for d in trades if (bar := builder.update(d['time'], d['price'], d['quantity'])) is not None]
+    assert not builder.close_due(trades[-1]['time']) and builder.close_due(trades[-1]['time'] + 1000 + scale.BAR_CLOSE_GRACE * 1000)
+    closed.append(builder.close_bar())
+    builder.release()
+    expected = expected_bars(trades, 1000)
+    assert_bars_match(np.concatenate(closed), expected)
+    (path,) = tape.list_bars(tape.symbol_dir(str(output_dir), "BTCUSDT"), "1s").values()
+    assert_bars_match(tape.open_bars(path), expected)
+
+def test_restart_reseeds_the_open_bar(output_dir):
+    trades = [scale.parse_trade(trade, "BTCUSDT") for trade in mock_exchange.synthetic_trades(3000, start_time_ms=START_MS)]
+    capture = scale.SymbolCapture("BTCUSDT", bar_intervals=["1m"], ring_trades=0)
+    for data in trades[:1700]:
+        capture.process_trade(data, echo=False)
+    capture.close()  # The open bar is not persisted; the restart rebuilds it from the tape
+    capture = scale.SymbolCapture("BTCUSDT", bar_intervals=["1m"], ring_trades=0)
+    assert capture.cursor == 1700 and capture.bars[0].trades > 0
+    for data in trades[1700:]:
+        capture.process_trade(data, echo=False)
+    capture.bars[0].close_bar()
+    capture.close()
+    (path,) = tape.list_bars(tape.symbol_dir(str(output_dir), "BTCUSDT"), "1m").values()
+    assert_bars_match(tape.open_bars(path), expected_bars(trades, 60000))
+
+def tape_trades(symbol: str, count: int) -> np.ndarray:
+    """TRADE_DTYPE records of a synthetic symbol tape starting at START_MS."""
+    trades = mock_exchange.synthetic_trades(count, start_time_ms=START_MS, symbol=symbol)
+    records = np.empty(count, dtype=tape.TRADE_DTYPE)
+    records['time'] = [t["T"] for t in trades]
+    records['trade_id'] = [t["a"] for t in trades]
+    records['price'] = [float(t["p"]) for t in trades]
+    records['quantity'] = [float(t["q"]) for t in trades]
+    return records
+
+def replay(source, captures: dict) -> list:
+    """Replay `source` into `captures` as fast as possible; returns the (time, symbol) order trades were fed in."""
+    fed = []
+    for symbol, capture in captures.items():
+        def process_trade(data: dict, *args, original=capture.process_trade, **kwargs) -> bool:
+            fed.append((data["time"], data["ticker"]))
+            return original(data, *args, **kwargs)
+        capture.process_trade = process_trade
+    scale.replay_trades(captures, str(source))
+    for capture in captures.values():
+        for builder in capture.bars:
+            builder.close_bar()
+        capture.close()
+    return fed
+
+def test_replay_from_tapes_merges_symbols(output_dir, tmp_path_factory):
+    source = tmp_path_factory.mktemp("source")
+    recorded = {symbol: tape_trades(symbol, 2000) for symbol in SYMBOLS}
+    for symbol, records in recorded.items():
+        path = tape.tape_path(tape.symbol_dir(str(source), symbol), "20231114")
+        os.makedirs(os.path.dirname(path))
+        records.tofile(path)
+    captures = {symbol: scale.SymbolCapture(symbol, bar_intervals=["1m"], ring_trades=0) for symbol in SYMBOLS}
+    fed = replay(source, captures)
+    assert len(fed) == 2 * 2000 and [t for t, _ in fed] == sorted(t for t, _ in fed)
+    for symbol, records in recorded.items():
+        (path,) = tape.list_tapes(tape.symbol_dir(str(output_dir), symbol)).values()
+        assert np.array_equal(tape.open_tape(path), records)
+        (path,) = tape.list_bars(tape.symbol_dir(str(output_dir), symbol), "1m").values()
+        assert_bars_match(tape.open_bars(path), expected_bars(records, 60000))
+
+def test_replay_from_binance_csvs(output_dir, tmp_path_factory):
+    source = tmp_path_factory.mktemp("source")
+    records = tape_trades("BTCUSDT", 1000)
+    rows = pd.DataFrame({"agg_trade_id": records['trade_id'], "price": records['price'], "quantity": records['quantity'],
+                         "first_trade_id": records['trade_id'], "last_trade_id": records['trade_id'],
+                         "transact_time": records['time'] * 1000, "is_buyer_maker": True, "is_best_match": True})
+    rows.to_csv(source / "BTCUSDT-aggTrades-2023-11-14.csv", header=False, index=False)  # 2025+ dumps use microseconds
+    later = rows.assign(agg_trade_id=rows["agg_trade_id"] + 1000, transact_time=rows["transact_time"] + 6 * 86400 * 10 ** 6)
+    later.to_csv(source / "BTCUSDT-aggTrades-2023-11-20.csv", index=False)  # Headered, and outside the replayed range
+    captures = {"BTCUSDT": scale.SymbolCapture("BTCUSDT", bar_intervals=[], ring_trades=0)}
+    scale.replay_trades(captures, str(source), end="20231115")
+    captures["BTCUSDT"].close()
+    (path,) = tape.list_tapes(tape.symbol_dir(str(output_dir), "BTCUSDT")).values()
+    assert np.array_equal(tape.open_tape(path), records)
+
+def test_book_capture_resyncs_after_a_gap(output_dir, monkeypatch):
+    random.seed(0)
+    snapshot, events = mock_exchange.synthetic_depth(300)
+    server = mock_exchange.make_server([], port=0, depth={"BTCUSDT": (snapshot, events)})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(scale, "BOOK_RESYNC_DELAY", 0)
+    url = scale.depth_url(urls(server)[1])
+    book = scale.BookCapture("BTCUSDT", levels=5)
+    try:
+        with requests.Session() as session:
+            book.on_event(events[0], session, url)
+            assert book.synced and book.book.update_id == events[0]["u"]
+            for event in events[1:100]:
+                book.on_event(event, session, url)
+            server.depth_sent["BTCUSDT"] = 101  # events[100] happened on the exchange but never reached us
+            book.on_event(events[101], session, url)
+            assert book.synced and book.resyncs == 1
+            for event in events[102:]:
+                book.on_event(event, session, url)
+    finally:
+        server.shutdown()
+        server.server_close()
+    reference = mock_exchange.book_at(snapshot, events, len(events))
+    assert book.book.update_id == reference["lastUpdateId"]
+    assert dict(book.book.bids) == {float(p): float(q) for p, q in reference["bids"]}
+    book.tick(START_MS / 1000)
+    book.close()
+    (path,) = tape.list_books(tape.symbol_dir(str(output_dir), "BTCUSDT"), 5).values()
+    (sample,) = tape.open_book(path, 5)
+    assert sample['update_id'] == reference["lastUpdateId"] and sample['bid_price'][0] == book.book.best_bid()
@@ -0,0 +1,66 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from src.grim import formats, schema
+
+DAY_START_MS = 1700006400000  # 2023-11-15T00:00:00Z
+V1_TABLE = """
+    CREATE TABLE {name} (
+        timestamp TEXT,
+        price REAL,
+        quantity REAL,
+        quoteQty REAL,
+        tradeId TEXT,
+        symbol TEXT,
+        PRIMARY KEY (timestamp, symbol, tradeId)
+    )
+"""
+
+def v1_rows(times, ids, price=60000.0):
+    stamps = formats.iso_timestamps(np.array(times))
+    return [(str(ts), price, 0.5, price * 0.5, str(i), "BTCUSDT") for ts, i in zip(stamps, ids)]
+
+def write_v1(path, market_data, trades=()):
+    conn = sqlite3.connect(path)
+    try:
+        for name, rows in (("market_data", market_data), ("trades", trades)):
+            conn.execute(V1_TABLE.format(name=name))
+            conn.executemany(f"INSERT INTO {name} VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_migrate_version_1_file(tmp_path):
+    path = str(tmp_path / "20231115.db")
+    times = DAY_START_MS + np.arange(10)[::-1] * 1000
+    write_v1(path, v1_rows(times, range(10)), trades=v1_rows(times[:3], range(3), price=1.0) + v1_rows([DAY_START_MS], ["abc"]))
+    before, after = schema.migrate(path)
+    assert before > 0 and after > 0
+    assert schema.migrate(path) is None
+    conn = sqlite3.connect(path)
+    try:
+        assert schema.version(conn) == schema.SCHEMA_VERSION
+        frame = schema.read(conn)
+        assert list(frame.columns) == schema.FRAME_COLUMNS and frame["time"].is_monotonic_increasing
+        assert len(frame) == 11 and (frame["price"][frame["trade_id"] < 10] == 60000.0).all()  # market_data wins
+        assert frame["trade_id"].tolist().count(formats.synthetic_ids([DAY_START_MS], formats.LEGACY_SOURCE_ID)[0]) == 1
+        assert len(schema.read(conn, DAY_START_MS + 2000, DAY_START_MS + 5000)) == 3
+        view = conn.execute("SELECT timestamp, quoteQty, tradeId FROM market_data_text WHERE tradeId = '0'").fetchone()
+        assert view == ("2023-11-15T00:00:09.000Z", 30000.0, "0")
+    finally:
+        conn.close()
+
+def test_connect_creates_and_inserts(tmp_path):
+    conn = schema.connect(str(tmp_path / "20231115.db"))
+    try:
+        frame = pd.DataFrame({"time": [DAY_START_MS, DAY_START_MS], "trade_id": [2, 1], "price": [1.0, 2.0],
+                              "quantity": [0.5, 0.25], "symbol": ["ETHUSDT", "BTCUSDT"]})
+        schema.insert(conn, frame)
+        schema.insert(conn, frame.iloc[[0]].assign(price=3.0))  # Same key replaces
+        read = schema.read(conn)
+        assert read["symbol"].tolist() == ["ETHUSDT", "BTCUSDT"] and read["price"].tolist() == [3.0, 2.0]  # Key order: symbol IDs follow first sight
+        assert schema.symbol_ids(conn, ["BTCUSDT", "ETHUSDT"]) == {"ETHUSDT": 1, "BTCUSDT": 2}
+    finally:
+        conn.close()
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.grim import store
+from src.scale.tape import TRADE_DTYPE
+
+SYMBOL = "BTCUSDT"
+MONTH_END_MS = 1701388800000  # 2023-12-01T00:00:00Z
+
+def trades(times, ids) -> np.ndarray:
+    records = np.zeros(len(times), dtype=TRADE_DTYPE)
+    records['time'] = times
+    records['trade_id'] = ids
+    records['price'] = 60000 + np.asarray(ids) / 100
+    records['quantity'] = 0.5
+    return records
+
+@pytest.fixture
+def stored(tmp_path):
+    """Two out-of-order, overlapping batches straddling a month boundary; returns (base_dir, every unique record sorted)."""
+    times = MONTH_END_MS + np.arange(-600, 600) * 100
+    records = trades(times, np.arange(len(times)))
+    base_dir = str(tmp_path)
+    assert store.write(SYMBOL, records[700:][::-1], base_dir=base_dir) == 500
+    assert store.write(SYMBOL, records[:800], base_dir=base_dir) == 800  # 100 rows overlap the first batch
+    return base_dir, records
+
+def test_partitions_are_sorted_and_unique(stored):
+    base_dir, records = stored
+    assert list(store.list_partitions(SYMBOL, base_dir)) == ["202311", "202312"]
+    assert np.array_equal(store.query(SYMBOL, base_dir=base_dir, as_frame=False)["trade_id"], records['trade_id'])
+    assert store.time_range(SYMBOL, base_dir) == (int(records['time'][0]), int(records['time'][-1]))
+    assert store.time_range("ETHUSDT", base_dir) is None
+
+def test_appends_newer_rows(stored):
+    base_dir, records = stored
+    newer = trades(records['time'][-1] + np.arange(1, 11), np.arange(2000, 2010))
+    store.compact_due(SYMBOL, base_dir, open_month="209901")
+    size = os.path.getsize(store.partition_path(base_dir, SYMBOL, "202312"))
+    assert store.write(SYMBOL, newer, base_dir=base_dir) == 10
+    assert os.path.getsize(store.partition_path(base_dir, SYMBOL, "202312")) == size + newer.nbytes
+    assert store.list_segments(SYMBOL, base_dir) == {}
+    assert store.query(SYMBOL, base_dir=base_dir)["trade_id"].tolist()[-11:] == [1199] + list(range(2000, 2010))
+
+def test_segments_merge_until_compacted(stored, monkeypatch):
+    base_dir, records = stored
+    assert list(store.list_segments(SYMBOL, base_dir)) == ["202312"]  # Only December already held newer rows
+    changed = records[[650]].copy()
+    changed['price'] = 1.0
+    store.write(SYMBOL, changed, base_dir=base_dir)  # Same (time, trade_id): the newest write wins
+    before = store.query(SYMBOL, base_dir=base_dir)
+    assert len(before) == len(records) and before["price"][650] == 1.0
+    monkeypatch.setattr(store, "COMPACT_FRACTION", 10.0)  # Segments far smaller than the partition
+    assert store.compact_due(SYMBOL, base_dir, max_segments=3, open_month="202312") == []  # Open, with two segments
+    assert store.compact_due(SYMBOL, base_dir, max_segments=2, open_month="202312") == []
+    assert len(store.list_segments(SYMBOL, base_dir)["202312"]) == 1  # Merged, the partition left alone
+    assert store.query(SYMBOL, base_dir=base_dir).equals(before)
+    monkeypatch.undo()
+    assert store.compact_due(SYMBOL, base_dir, open_month="202312", owns=lambda month: month != "202312") == []
+    assert store.compact_due(SYMBOL, base_dir, open_month="202312") == ["202312"]
+    assert store.list_segments(SYMBOL, base_dir) == {}
+    partition = np.fromfile(store.partition_path(base_dir, SYMBOL, "202312"), dtype=TRADE_DTYPE)
+    assert np.array_equal(partition, np.concatenate([records[600:650], changed, records[651:]]))
+    assert store.query(SYMBOL, base_dir=base_dir).equals(before)
+
+def test_query_range_and_columns(stored):
+    base_dir, records = stored
+    start, end = MONTH_END_MS - 5000, MONTH_END_MS + 5000
+    frame = store.query(SYMBOL, "2023-11-30T23:59:55Z", end, base_dir=base_dir)
+    expected = records[(records['time'] >= start) & (records['time'] < end)]
+    assert list(frame.columns) == store.STORE_COLUMNS
+    assert np.array_equal(frame["time"], expected['time']) and np.array_equal(frame["trade_id"], expected['trade_id'])
+    assert np.allclose(frame["quote_qty"], expected['price'] * expected['quantity'])
+    arrays = store.query(SYMBOL, end=MONTH_END_MS, columns=["quote_qty", "time"], base_dir=base_dir, as_frame=False)
+    assert list(arrays) == ["quote_qty", "time"] and arrays["time"].max() < MONTH_END_MS and len(arrays["time"]) == 600
+    assert len(store.query(SYMBOL, end, start, base_dir=base_dir)) == 0
+    with pytest.raises(ValueError):
+        store.query(SYMBOL, columns=["side"], base_dir=base_dir)